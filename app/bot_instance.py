@@ -1,11 +1,18 @@
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.bot import DefaultBotProperties
-from app.config import BOT_TOKEN
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from app.config import BOT_TOKEN, BotConfig
+
+session = None
+if BotConfig.TELEGRAM_API_URL:
+    session = AiohttpSession(api=TelegramAPIServer.from_base(BotConfig.TELEGRAM_API_URL))
 
 bot = Bot(
     token=BOT_TOKEN,
+    session=session,
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 
-dp = Dispatcher()
\ No newline at end of file
+dp = Dispatcher()
@@ -1,31 +1,25 @@
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-# ✅ ИСПРАВЛЯЕМ:
-BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")  # ← Было "BOT_TOKEN"
-ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cat_bot.db")
-HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")  # ← ДОБАВЛЯЕМ!
-
 import os
 from dotenv import load_dotenv
 
+# .env читается один раз - здесь; остальные модули берут значения из config
 load_dotenv()
 
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+TELEGRAM_BOT_TOKEN = BOT_TOKEN
 ADMIN_ID = int(os.getenv("ADMIN_ID", 103181087))
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./flight_bot.db")
+HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY", "")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 
 class RequestConfig:
     # Бесплатные запросы
-    FREE_REQUESTS_DAILY = 5
+    FREE_REQUESTS_DAILY = int(os.getenv("FREE_REQUESTS_DAILY", "5"))
     FREE_REQUESTS_WEEKLY = 20
     RESET_TYPE = "daily"  # "daily" или "weekly"
+    # "lazy" - квота пересчитывается при чтении, "eager" - плюс ночной bulk UPDATE
+    RESET_MODE = os.getenv("RESET_MODE", "lazy")
     
-    # Тарифы (Stars -> запросы) - МЕНЯЕМ ЗДЕСЬ!
+    # Тарифы по умолчанию (Stars -> запросы); на лету меняются через PRICING_FILE
     PRICING = {
         15: 3,   # БЫЛО: 15:3, СТАЛО: 15:10 - кнопка ОБНОВИТСЯ
         45: 10,   # без изменений
@@ -41,16 +35,116 @@ class RequestConfig:
     # Сервисные коды
     SERVICE_CODE_REQUESTS = 10
 
-def get_pricing_display():
-    """Возвращает отформатированные тарифы для отображения"""
-    display_lines = []
-    for stars, requests in RequestConfig.PRICING.items():
-        display_lines.append(f"• {stars} ⭐ → {requests} запросов")
-    return "\n".join(display_lines)
-
 def get_free_requests_info():
     if RequestConfig.RESET_TYPE == "daily":
         return f"🆓 {RequestConfig.FREE_REQUESTS_DAILY} бесплатных запросов в день"
     else:
         return f"🆓 {RequestConfig.FREE_REQUESTS_WEEKLY} бесплатных запросов в неделю"
-    
\ No newline at end of file
+    
+class PricingConfig:
+    # JSON {"15": 3, "45": 10, ...}; изменения подхватываются без перезапуска
+    FILE = os.getenv("PRICING_FILE", "./pricing.json")
+    WATCH_INTERVAL = float(os.getenv("PRICING_WATCH_INTERVAL", "5"))  # секунд между проверками mtime
+
+class CacheConfig:
+    # Кэш балансов пользователей (write-through)
+    BALANCE_CACHE_SIZE = int(os.getenv("BALANCE_CACHE_SIZE", "10000"))
+    BALANCE_CACHE_TTL = int(os.getenv("BALANCE_CACHE_TTL", "300"))  # секунды
+
+class StateConfig:
+    # Хранилище ожидающих фото: "memory" или "sqlite" (общее для нескольких процессов)
+    BACKEND = os.getenv("STATE_STORE_BACKEND", "memory")
+    SQLITE_PATH = os.getenv("STATE_STORE_PATH", "./bot_state.db")
+    PENDING_PHOTO_TTL = int(os.getenv("PENDING_PHOTO_TTL", "3600"))  # секунды
+    PENDING_PHOTO_MAX = int(os.getenv("PENDING_PHOTO_MAX", "10000"))
+
+class ImageConfig:
+    # Предобработка фото перед отправкой в анализатор
+    TARGET_SIDE = int(os.getenv("IMAGE_TARGET_SIDE", "768"))    # минимальная длинная сторона PhotoSize
+    MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))         # после пережатия
+    JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+    MIN_JPEG_QUALITY = 40
+    MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", "250000"))
+    PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", "2"))
+    # fork из процесса с event loop и потоками небезопасен: "forkserver" (где есть) или "spawn"
+    START_METHOD = os.getenv("IMAGE_START_METHOD", "")
+    DETAIL = os.getenv("IMAGE_DETAIL", "auto")  # "low" / "high" / "auto" для image_url
+
+class ResultCacheConfig:
+    # Кэш результатов анализа: file_unique_id (или хэш байтов) + хэш промпта
+    ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1") == "1"
+    MEMORY_SIZE = int(os.getenv("RESULT_CACHE_MEMORY_SIZE", "2000"))
+    TTL = int(os.getenv("RESULT_CACHE_TTL", str(7 * 24 * 3600)))  # секунды
+    SQLITE_PATH = os.getenv("RESULT_CACHE_PATH", "./analysis_cache.db")  # "" - без постоянного уровня
+
+class AnalyzerConfig:
+    # Ограничение нагрузки на OpenAI
+    MAX_CONCURRENCY = int(os.getenv("ANALYZER_MAX_CONCURRENCY", "8"))
+    MAX_QUEUE = int(os.getenv("ANALYZER_MAX_QUEUE", "100"))  # сверх этого запросы сразу отклоняются
+    # Потоковый ответ с постепенным редактированием сообщения
+    STREAMING = os.getenv("ANALYZER_STREAMING", "1") == "1"
+    STREAM_EDIT_INTERVAL = float(os.getenv("ANALYZER_STREAM_EDIT_INTERVAL", "1.2"))  # секунд между правками
+    # Дедлайны и повторы
+    DEADLINE = float(os.getenv("ANALYZER_DEADLINE", "45"))               # секунд на весь анализ с повторами
+    ATTEMPT_TIMEOUT = float(os.getenv("ANALYZER_ATTEMPT_TIMEOUT", "20"))  # секунд на одну попытку
+    MAX_RETRIES = int(os.getenv("ANALYZER_MAX_RETRIES", "2"))
+    BACKOFF_BASE = 0.5
+    BACKOFF_MAX = 8.0
+    # Circuit breaker
+    BREAKER_FAILURES = int(os.getenv("ANALYZER_BREAKER_FAILURES", "5"))   # подряд, чтобы разомкнуть
+    BREAKER_RESET_TIMEOUT = float(os.getenv("ANALYZER_BREAKER_RESET", "30"))
+
+class UsageLedgerConfig:
+    # Журнал анализов пишется в фоне пачками: раз в FLUSH_INTERVAL_MS или по набору BATCH_SIZE событий
+    ENABLED = os.getenv("USAGE_LEDGER_ENABLED", "1") == "1"
+    FLUSH_INTERVAL_MS = int(os.getenv("USAGE_LEDGER_FLUSH_MS", "1000"))
+    BATCH_SIZE = int(os.getenv("USAGE_LEDGER_BATCH_SIZE", "200"))
+    MAX_PENDING = int(os.getenv("USAGE_LEDGER_MAX_PENDING", "10000"))  # сверх этого события отбрасываются
+
+class BotConfig:
+    # Прием апдейтов: "polling" (разработка), "webhook" или "sharded"
+    MODE = os.getenv("BOT_MODE", "polling")   # "polling" | "webhook" | "sharded"
+    POLLING_TIMEOUT = int(os.getenv("POLLING_TIMEOUT", "30"))
+    # Режим sharded: процессов-воркеров и размер очереди каждого (0 - без ограничения)
+    SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "0")) or os.cpu_count() or 1
+    SHARD_QUEUE_SIZE = int(os.getenv("SHARD_QUEUE_SIZE", "1000"))
+    SHARD_CHECK_INTERVAL = float(os.getenv("SHARD_CHECK_INTERVAL", "1"))  # секунд между проверками воркеров
+    # Свой адрес Bot API (локальный сервер или стенд для нагрузочных тестов)
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+class WebhookConfig:
+    BASE_URL = os.getenv("WEBHOOK_BASE_URL", "")          # https://bot.example.com
+    PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+    SECRET = os.getenv("WEBHOOK_SECRET", "")              # X-Telegram-Bot-Api-Secret-Token
+    HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+    PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+    WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))      # процессов на одном порту (SO_REUSEPORT)
+
+class MetricsConfig:
+    # Локальный HTTP /metrics в формате Prometheus
+    ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+    HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    PORT = int(os.getenv("METRICS_PORT", "9101"))   # воркеры webhook/sharded: PORT + номер воркера
+
+class ProfilingConfig:
+    # Хендлеры дольше порога пишутся в лог отдельной записью
+    SLOW_HANDLER_MS = float(os.getenv("SLOW_HANDLER_MS", "500"))
+    # Сколько последних замеров хранить на хендлер для перцентилей
+    HANDLER_STATS_WINDOW = int(os.getenv("HANDLER_STATS_WINDOW", "1000"))
+    # Монитор event loop: период замера задержки и порог блокировки для снимка стека
+    LOOP_MONITOR = os.getenv("LOOP_MONITOR", "1") == "1"
+    LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.1"))
+    LOOP_BLOCK_MS = float(os.getenv("LOOP_BLOCK_MS", "100"))
+
+class DatabaseConfig:
+    # Профиль движка БД: auto (по DATABASE_URL), sqlite-wal, sqlite-legacy, postgres
+    PROFILE = os.getenv("DB_PROFILE", "auto")
+    # SQLite
+    SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "20000"))
+    # PostgreSQL (драйверы asyncpg и psycopg2 - в requirements-postgres.txt)
+    POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
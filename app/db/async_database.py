@@ -0,0 +1,364 @@
+# app/db/async_database.py
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy import select, update, case, or_
+from app.config import DATABASE_URL
+from app.db.profiles import create_async_engine_for
+from app.db.balance_cache import balance_cache, BalanceSnapshot
+from app.db.quota_reset import free_requests_limit, reset_threshold
+from app.services.metrics import db_seconds
+import datetime
+import json
+import os
+
+
+def to_async_url(url: str) -> str:
+    """Переводит синхронный DATABASE_URL на асинхронный драйвер"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql://"):
+        return url.replace("postgresql://", "postgresql+asyncpg://", 1)
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql+asyncpg://", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+async_engine = create_async_engine_for(ASYNC_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+
+
+async def _add_new_user(db, user_id: int, paid_requests: int = 0):
+    """Новый пользователь в транзакции db (вместе со счетчиками /stats) - коммитит вызывающий"""
+    from app.db.models import User
+    from app.db.stats import bump
+    today = datetime.date.today()
+    user = User(
+        id=user_id,
+        tg_id=str(user_id),
+        free_requests=free_requests_limit(),
+        paid_requests=paid_requests,
+        total_requests_used=0,
+        last_reset=today,
+        last_active_date=today,
+        used_promo_codes=json.dumps([])
+    )
+    db.add(user)
+    await bump(db, today, users=1, new_users=1, active_users=1)
+    return user
+
+
+async def _load_user(user_id: int):
+    """Загружает (или создает) пользователя, возвращает (User, BalanceSnapshot)
+
+    Чтение не пишет в БД: сброс бесплатной квоты вычисляется в BalanceSnapshot
+    и материализуется при следующем reserve_request.
+    """
+    from app.db.models import User
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+
+        if not user:
+            # Создаем нового пользователя
+            user = await _add_new_user(db, user_id)
+            await db.commit()
+
+        return user, balance_cache.put(BalanceSnapshot.from_user(user))
+
+
+@db_seconds.time(op="get_user")
+async def get_user(user_id: int):
+    """Получить пользователя по ID (async). free_requests/last_reset - как хранятся в БД,
+    актуальный баланс с учетом сброса дает get_balance()"""
+    user, _ = await _load_user(user_id)
+    return user
+
+
+@db_seconds.time(op="get_balance")
+async def get_balance(user_id: int) -> BalanceSnapshot:
+    """Снимок баланса из кэша, при промахе - из БД через get_user"""
+    snapshot = balance_cache.get(user_id)
+    if snapshot is None:
+        _, snapshot = await _load_user(user_id)
+    return snapshot
+
+
+@db_seconds.time(op="update_user_balance")
+async def update_user_balance(user_id: int, new_paid_balance: int):
+    """Обновить баланс оплаченных запросов (async)"""
+    from app.db.models import User
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user:
+            user.paid_requests = new_paid_balance
+            await db.commit()
+            balance_cache.put(BalanceSnapshot.from_user(user))
+
+
+@db_seconds.time(op="add_paid_requests")
+async def add_paid_requests(user_id: int, requests_to_add: int):
+    """Добавить оплаченные запросы (async)"""
+    from app.db.models import User
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user:
+            user.paid_requests += requests_to_add
+            await db.commit()
+            balance_cache.put(BalanceSnapshot.from_user(user))
+            return user.paid_requests
+        return 0
+
+
+@db_seconds.time(op="use_free_request")
+async def use_free_request(user_id: int):
+    """Использовать один бесплатный запрос (async)"""
+    from app.db.models import User
+    from app.db.stats import bump
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user and user.free_requests > 0:
+            user.free_requests -= 1
+            user.total_requests_used += 1
+            await bump(db, requests_free=1)
+            await db.commit()
+            balance_cache.put(BalanceSnapshot.from_user(user))
+            return True
+        return False
+
+
+@db_seconds.time(op="use_paid_request")
+async def use_paid_request(user_id: int):
+    """Использовать один оплаченный запрос (async)"""
+    from app.db.models import User
+    from app.db.stats import bump
+    async with AsyncSessionLocal() as db:
+        user = await db.get(User, user_id)
+        if user and user.paid_requests > 0:
+            user.paid_requests -= 1
+            user.total_requests_used += 1
+            await bump(db, requests_paid=1)
+            await db.commit()
+            balance_cache.put(BalanceSnapshot.from_user(user))
+            return True
+        return False
+
+
+def _balance_columns(User):
+    """Колонки для RETURNING, из которых собирается BalanceSnapshot"""
+    return User.free_requests, User.paid_requests, User.total_requests_used, User.last_reset
+
+
+class Reservation:
+    """Зарезервированный запрос и баланс сразу после списания"""
+    __slots__ = ("user_id", "request_type", "free_requests", "paid_requests")
+
+    def __init__(self, user_id: int, request_type: str, free_requests: int, paid_requests: int):
+        self.user_id = user_id
+        self.request_type = request_type
+        self.free_requests = free_requests
+        self.paid_requests = paid_requests
+
+    def __repr__(self):
+        return (f"Reservation(user_id={self.user_id}, request_type={self.request_type!r}, "
+                f"free_requests={self.free_requests}, paid_requests={self.paid_requests})")
+
+
+@db_seconds.time(op="reserve_request")
+async def reserve_request(user_id: int):
+    """Атомарно списать один запрос одним UPDATE ... RETURNING (сначала бесплатные, потом платные)"""
+    from app.db.models import User
+    from app.db.stats import bump
+    today = datetime.date.today()
+    # Ленивый сброс: если период закончился, считаем от полного лимита и фиксируем его здесь же
+    stale = or_(User.last_reset.is_(None), User.last_reset < reset_threshold(today))
+    free_now = case((stale, free_requests_limit()), else_=User.free_requests)
+    has_free = free_now > 0
+    stmt = (
+        update(User)
+        .where(User.id == user_id, or_(free_now > 0, User.paid_requests > 0))
+        .values(
+            free_requests=case((has_free, free_now - 1), else_=free_now),
+            paid_requests=case((has_free, User.paid_requests), else_=User.paid_requests - 1),
+            total_requests_used=User.total_requests_used + 1,
+            last_request_type=case((has_free, "free"), else_="paid"),
+            last_reset=case((stale, today), else_=User.last_reset),
+            reset_counter=User.reset_counter + case((stale, 1), else_=0),
+        )
+        .returning(User.last_request_type, *_balance_columns(User))
+        .execution_options(synchronize_session=False)
+    )
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(stmt)).first()
+        if row is not None:
+            await bump(db, today, **{f"requests_{row[0]}": 1})
+        await db.commit()
+
+    if row is None:
+        return None
+    snapshot = balance_cache.put(BalanceSnapshot(user_id, *row[1:]))
+    return Reservation(user_id, row[0], snapshot.free_requests, snapshot.paid_requests)
+
+
+@db_seconds.time(op="refund_request")
+async def refund_request(reservation: Reservation):
+    """Вернуть зарезервированный запрос в тот же пул, откуда он был списан"""
+    from app.db.models import User
+    from app.db.stats import bump
+    column = User.free_requests if reservation.request_type == "free" else User.paid_requests
+    stmt = (
+        update(User)
+        .where(User.id == reservation.user_id)
+        .values({column: column + 1, User.total_requests_used: User.total_requests_used - 1})
+        .returning(*_balance_columns(User))
+        .execution_options(synchronize_session=False)
+    )
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(stmt)).first()
+        if row is not None:
+            await bump(db, **{f"requests_{reservation.request_type}": -1})
+        await db.commit()
+
+    if row is None:
+        balance_cache.invalidate(reservation.user_id)
+        return reservation
+    snapshot = balance_cache.put(BalanceSnapshot(reservation.user_id, *row))
+    reservation.free_requests, reservation.paid_requests = snapshot.free_requests, snapshot.paid_requests
+    return reservation
+
+
+@db_seconds.time(op="bulk_reset_free_requests")
+async def bulk_reset_free_requests(today: datetime.date = None) -> int:
+    """Сбросить бесплатную квоту всем, у кого закончился период, одним UPDATE (режим eager)"""
+    from app.db.models import User
+    today = today or datetime.date.today()
+    stmt = (
+        update(User)
+        .where(or_(User.last_reset.is_(None), User.last_reset < reset_threshold(today)))
+        .values(
+            free_requests=free_requests_limit(),
+            last_reset=today,
+            reset_counter=User.reset_counter + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(stmt)
+        await db.commit()
+    # Кэш не трогаем: снимки и так вычисляют сброс из stored_last_reset
+    return result.rowcount
+
+
+@db_seconds.time(op="mark_user_active")
+async def mark_user_active(user_id: int, today: datetime.date = None) -> bool:
+    """Первый апдейт пользователя за день: переводит last_active_date и увеличивает DAU.
+    Условный UPDATE, поэтому параллельные воркеры считают пользователя один раз"""
+    from app.db.models import User
+    from app.db.stats import bump
+    today = today or datetime.date.today()
+    stmt = (
+        update(User)
+        .where(User.id == user_id, or_(User.last_active_date.is_(None), User.last_active_date < today))
+        .values(last_active_date=today)
+        .execution_options(synchronize_session=False)
+    )
+    async with AsyncSessionLocal() as db:
+        marked = (await db.execute(stmt)).rowcount > 0
+        if marked:
+            await bump(db, today, active_users=1)
+        await db.commit()
+    return marked
+
+
+@db_seconds.time(op="get_stats")
+async def get_stats(today: datetime.date = None) -> dict:
+    """Итоги и счетчики за сегодня одним запросом по первичным ключам"""
+    from app.db.models import StatsDaily, StatsTotals
+    from app.db.stats import TOTALS_ID
+    today = today or datetime.date.today()
+    stmt = (
+        select(
+            StatsTotals.users, StatsTotals.promos_created, StatsTotals.promos_used, StatsTotals.promos_active,
+            StatsTotals.requests_free, StatsTotals.requests_paid,
+            StatsDaily.new_users, StatsDaily.active_users,
+            StatsDaily.requests_free.label("today_requests_free"),
+            StatsDaily.requests_paid.label("today_requests_paid"),
+        )
+        .select_from(StatsTotals)
+        .outerjoin(StatsDaily, StatsDaily.day == today)
+        .where(StatsTotals.id == TOTALS_ID)
+    )
+    async with AsyncSessionLocal() as db:
+        row = (await db.execute(stmt)).mappings().first()
+    return {name: (row[name] if row else None) or 0 for name in stmt.selected_columns.keys()}
+
+
+@db_seconds.time(op="get_daily_stats")
+async def get_daily_stats(days: int, today: datetime.date = None) -> list:
+    """Дневные срезы за последние days дней, новые сверху"""
+    from app.db.models import StatsDaily
+    today = today or datetime.date.today()
+    stmt = (
+        select(StatsDaily)
+        .where(StatsDaily.day > today - datetime.timedelta(days=days))
+        .order_by(StatsDaily.day.desc())
+    )
+    async with AsyncSessionLocal() as db:
+        return list((await db.execute(stmt)).scalars())
+
+
+@db_seconds.time(op="insert_usage_events")
+async def insert_usage_events(rows: list):
+    """Пачка записей журнала одним многострочным INSERT"""
+    from app.db.models import UsageEvent
+    from sqlalchemy import insert
+    if not rows:
+        return
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(UsageEvent).values(rows))
+        await db.commit()
+
+
+@db_seconds.time(op="credit_payment")
+async def credit_payment(user_id: int, telegram_charge_id: str, amount: int, requests: int, currency: str = "XTR",
+                         provider_charge_id: str = None, payload: str = None):
+    """Зачислить платеж ровно один раз: INSERT в payments и прибавка баланса в одной транзакции.
+
+    Уникальный telegram_payment_charge_id отсекает повторную доставку апдейта - тогда
+    возвращается None и баланс не меняется. Иначе - BalanceSnapshot после зачисления.
+    """
+    from app.db.models import Payment, User
+    from app.db.profiles import insert_for
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            insert_for(db.get_bind().dialect.name)(Payment)
+            .values(
+                telegram_payment_charge_id=telegram_charge_id,
+                provider_payment_charge_id=provider_charge_id,
+                user_id=user_id,
+                currency=currency,
+                amount=amount,
+                requests=requests,
+                payload=payload,
+                created_at=datetime.datetime.utcnow(),
+            )
+            .on_conflict_do_nothing(index_elements=["telegram_payment_charge_id"])
+            .returning(Payment.id)
+        )
+        if (await db.execute(stmt)).first() is None:
+            await db.rollback()
+            return None
+
+        row = (await db.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(paid_requests=User.paid_requests + requests)
+            .returning(*_balance_columns(User))
+            .execution_options(synchronize_session=False)
+        )).first()
+        if row is None:
+            user = await _add_new_user(db, user_id, paid_requests=requests)
+            snapshot = BalanceSnapshot.from_user(user)
+        else:
+            snapshot = BalanceSnapshot(user_id, *row)
+        await db.commit()
+    return balance_cache.put(snapshot)
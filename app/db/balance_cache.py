@@ -0,0 +1,116 @@
+# app/db/balance_cache.py
+import datetime
+import time
+import threading
+from collections import OrderedDict
+from app.config import CacheConfig
+from app.db.quota_reset import effective_free_requests, effective_last_reset
+
+
+class BalanceSnapshot:
+    """Компактный неизменяемый снимок баланса пользователя (вместо detached ORM User)
+
+    Хранит значения как в БД; free_requests и last_reset вычисляются с учетом
+    ленивого сброса квоты, поэтому снимок не устаревает после полуночи.
+    """
+    __slots__ = ("user_id", "stored_free_requests", "paid_requests", "total_requests_used", "stored_last_reset")
+
+    def __init__(self, user_id: int, free_requests: int, paid_requests: int, total_requests_used: int, last_reset):
+        object.__setattr__(self, "user_id", user_id)
+        object.__setattr__(self, "stored_free_requests", free_requests)
+        object.__setattr__(self, "paid_requests", paid_requests)
+        object.__setattr__(self, "total_requests_used", total_requests_used)
+        object.__setattr__(self, "stored_last_reset", last_reset)
+
+    @property
+    def free_requests(self) -> int:
+        return effective_free_requests(self.stored_free_requests, self.stored_last_reset, datetime.date.today())
+
+    @property
+    def last_reset(self):
+        return effective_last_reset(self.stored_last_reset, datetime.date.today())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("BalanceSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("BalanceSnapshot is immutable")
+
+    def __repr__(self):
+        return (f"BalanceSnapshot(user_id={self.user_id}, free_requests={self.free_requests}, "
+                f"paid_requests={self.paid_requests}, total_requests_used={self.total_requests_used}, "
+                f"last_reset={self.last_reset})")
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.free_requests, user.paid_requests, user.total_requests_used or 0, user.last_reset)
+
+
+class BalanceCache:
+    """LRU кэш снимков баланса с TTL и счетчиками попаданий"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, snapshot)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, snapshot = entry
+            if expires_at <= now:
+                del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return snapshot
+
+    def put(self, snapshot: BalanceSnapshot):
+        if self.max_entries <= 0:
+            return snapshot
+        with self._lock:
+            self._entries[snapshot.user_id] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(snapshot.user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return snapshot
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def disable(self):
+        """Выключает кэш: put ничего не хранит, get всегда промах"""
+        with self._lock:
+            self.max_entries = 0
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+balance_cache = BalanceCache(CacheConfig.BALANCE_CACHE_SIZE, CacheConfig.BALANCE_CACHE_TTL)
@@ -1,52 +1,40 @@
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from app.config import DATABASE_URL, RequestConfig
+from app.config import DATABASE_URL
+from app.db.profiles import create_sync_engine
+from app.db.balance_cache import balance_cache
+from app.db.quota_reset import free_requests_limit
 import datetime
 import json
 
-connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
-engine = create_engine(DATABASE_URL, connect_args=connect_args)
+# Профиль (WAL/pragma для SQLite, пул для PostgreSQL) - см. app/db/profiles.py
+engine = create_sync_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 def get_user(user_id: int):
-    """Получить пользователя по ID с автоматическим сбросом"""
+    """Получить пользователя по ID (сброс квоты ленивый, см. app/db/quota_reset.py)"""
     from app.db.models import User
+    from app.db.stats import bump_sync
     db = SessionLocal()
     try:
         user = db.query(User).filter(User.id == user_id).first()
-        today = datetime.date.today()
         
         if not user:
             # Создаем нового пользователя
-            free_requests = RequestConfig.FREE_REQUESTS_DAILY if RequestConfig.RESET_TYPE == "daily" else RequestConfig.FREE_REQUESTS_WEEKLY
+            today = datetime.date.today()
             user = User(
                 id=user_id, 
                 tg_id=str(user_id),
-                free_requests=free_requests,
+                free_requests=free_requests_limit(),
                 paid_requests=0,
                 last_reset=today,
+                last_active_date=today,
                 used_promo_codes=json.dumps([])
             )
             db.add(user)
+            bump_sync(db, today, users=1, new_users=1, active_users=1)
             db.commit()
             db.refresh(user)
-        else:
-            # Проверяем нужно ли сбросить бесплатные запросы
-            needs_reset = False
-            if RequestConfig.RESET_TYPE == "daily":
-                needs_reset = user.last_reset < today
-            else:  # weekly
-                days_since_reset = (today - user.last_reset).days
-                needs_reset = days_since_reset >= 7
-            
-            if needs_reset:
-                free_requests = RequestConfig.FREE_REQUESTS_DAILY if RequestConfig.RESET_TYPE == "daily" else RequestConfig.FREE_REQUESTS_WEEKLY
-                user.free_requests = free_requests
-                user.last_reset = today
-                user.reset_counter += 1
-                db.commit()
-                db.refresh(user)
         
         return user
     finally:
@@ -61,6 +49,7 @@ def update_user_balance(user_id: int, new_paid_balance: int):
         if user:
             user.paid_requests = new_paid_balance
             db.commit()
+            balance_cache.invalidate(user_id)
     finally:
         db.close()
 
@@ -73,6 +62,7 @@ def add_paid_requests(user_id: int, requests_to_add: int):
         if user:
             user.paid_requests += requests_to_add
             db.commit()
+            balance_cache.invalidate(user_id)
             return user.paid_requests
         return 0
     finally:
@@ -81,13 +71,16 @@ def add_paid_requests(user_id: int, requests_to_add: int):
 def use_free_request(user_id: int):
     """Использовать один бесплатный запрос"""
     from app.db.models import User
+    from app.db.stats import bump_sync
     db = SessionLocal()
     try:
         user = db.query(User).filter(User.id == user_id).first()
         if user and user.free_requests > 0:
             user.free_requests -= 1
             user.total_requests_used += 1
+            bump_sync(db, requests_free=1)
             db.commit()
+            balance_cache.invalidate(user_id)
             return True
         return False
     finally:
@@ -96,13 +89,16 @@ def use_free_request(user_id: int):
 def use_paid_request(user_id: int):
     """Использовать один оплаченный запрос"""
     from app.db.models import User
+    from app.db.stats import bump_sync
     db = SessionLocal()
     try:
         user = db.query(User).filter(User.id == user_id).first()
         if user and user.paid_requests > 0:
             user.paid_requests -= 1
             user.total_requests_used += 1
+            bump_sync(db, requests_paid=1)
             db.commit()
+            balance_cache.invalidate(user_id)
             return True
         return False
     finally:
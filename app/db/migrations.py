@@ -0,0 +1,368 @@
+# app/db/migrations.py
+"""Версионные миграции схемы для SQLite и PostgreSQL.
+
+Каждая миграция - номер, имя и функция upgrade(ctx). Шаги идемпотентны
+(IF NOT EXISTS, проверка колонки перед ALTER), поэтому повторный запуск после
+сбоя безопасен. Примененные версии пишутся в schema_migrations; на старте
+хватает одного запроса max(version), чтобы понять, что делать нечего.
+
+Индексы на PostgreSQL строятся CREATE INDEX CONCURRENTLY - без блокировки записи,
+поэтому такие миграции выполняются вне транзакции (transactional=False).
+Невалидный индекс (pg_index.indisvalid) от прерванной сборки пересоздается
+до записи версии.
+
+Запуск вручную: python -m app.db.migrations [--dry-run] [--status]
+"""
+import argparse
+import datetime
+import logging
+from sqlalchemy import (
+    JSON, Boolean, Column, Date, DateTime, Integer, MetaData, String, Table, inspect, text,
+)
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+
+class Migration:
+    __slots__ = ("version", "name", "upgrade", "transactional")
+
+    def __init__(self, version: int, name: str, upgrade, transactional: bool = True):
+        self.version = version
+        self.name = name
+        self.upgrade = upgrade
+        self.transactional = transactional
+
+
+class MigrationContext:
+    """Операции над схемой с учетом диалекта. В dry-run SQL только собирается"""
+
+    def __init__(self, connection, dry_run: bool = False):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+        self.dry_run = dry_run
+        self.statements = []
+
+    def execute(self, sql: str, params: dict = None):
+        self.statements.append(sql)
+        if not self.dry_run:
+            self.connection.execute(text(sql), params or {})
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.connection).has_table(table)
+
+    def has_column(self, table: str, column: str) -> bool:
+        if not self.has_table(table):
+            return False
+        return any(info["name"] == column for info in inspect(self.connection).get_columns(table))
+
+    def create_table(self, table):
+        """Таблица из моделей (вместе с ее индексами), если ее еще нет"""
+        if self.has_table(table.name):
+            return
+        from sqlalchemy.schema import CreateIndex, CreateTable
+        self.statements.append(str(CreateTable(table).compile(dialect=self.connection.dialect)).strip())
+        for index in table.indexes:
+            self.statements.append(str(CreateIndex(index).compile(dialect=self.connection.dialect)))
+        if not self.dry_run:
+            table.create(self.connection, checkfirst=True)
+
+    def add_column(self, table: str, column: str, sql_type: str, default: str = None):
+        """ALTER TABLE ... ADD COLUMN, если колонки еще нет. default - SQL-литерал"""
+        if self.dry_run and not self.has_table(table):
+            return  # в dry-run таблица еще только "создана" предыдущим шагом - со всеми колонками
+        if self.has_column(table, column):
+            return
+        ddl = f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}"
+        if default is not None:
+            ddl += f" DEFAULT {default}"
+        self.execute(ddl)
+
+    def index_is_valid(self, name: str):
+        """pg_index.indisvalid: False - индекс остался от прерванного CONCURRENTLY, None - индекса нет"""
+        return self.connection.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+        ).scalar()
+
+    def create_index(self, name: str, table: str, columns, unique: bool = False):
+        """Индекс без блокировки записи: CONCURRENTLY на PostgreSQL"""
+        concurrently = " CONCURRENTLY" if self.dialect == "postgresql" else ""
+        unique_sql = "UNIQUE " if unique else ""
+        ddl = f"CREATE {unique_sql}INDEX{concurrently} IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+        if self.dialect != "postgresql":
+            self.execute(ddl)
+            return
+
+        # Упавший CREATE INDEX CONCURRENTLY оставляет невалидный индекс, а IF NOT EXISTS его не заменит
+        for attempt in range(2):
+            if self.index_is_valid(name) is False:
+                logger.warning(f"⚠️ Index {name} is invalid, rebuilding")
+                self.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+            self.execute(ddl)
+            if self.dry_run or self.index_is_valid(name):
+                return
+        raise RuntimeError(f"index {name} is still invalid after rebuild")
+
+    def drop_table(self, table: str):
+        self.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+# ----------------- Миграции -----------------
+# DDL каждой версии заморожен здесь, а не берется из app.db.models: правка модели
+# не должна менять то, что старая миграция создает на свежей БД. Новые изменения схемы -
+# только новой миграцией. Python-default'ы моделей на DDL не влияют, поэтому здесь их нет.
+_V1 = MetaData()
+Table(
+    "users", _V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("tg_id", String, unique=True, index=True),
+    Column("is_premium", Boolean),
+    Column("created_at", DateTime),
+    Column("free_requests", Integer),
+    Column("paid_requests", Integer),
+    Column("total_requests_used", Integer),
+    Column("last_request_type", String, nullable=True),
+    Column("last_reset", Date, index=True),
+    Column("reset_counter", Integer),
+    Column("used_promo_codes", JSON),
+)
+Table(
+    "promo_codes", _V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("code", String, unique=True, index=True),
+    Column("requests", Integer),
+    Column("created_by", Integer),
+    Column("created_at", DateTime),
+    Column("expires_at", DateTime),
+    Column("used_by", Integer, nullable=True, index=True),
+    Column("used_at", DateTime, nullable=True),
+    Column("is_active", Boolean),
+)
+Table(
+    "watches", _V1,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, index=True),
+    Column("origin", String),
+    Column("destination", String),
+    Column("price_limit", Integer),
+    Column("active", Boolean),
+)
+Table(
+    "user_limits", _V1,
+    Column("user_id", Integer, primary_key=True),
+    Column("last_reset", Date, nullable=False),
+    Column("used_requests", Integer),
+)
+
+
+def _baseline(ctx: MigrationContext):
+    """Таблицы, которые раньше создавал create_all"""
+    for name in ("users", "promo_codes", "watches", "user_limits"):
+        ctx.create_table(_V1.tables[name])
+
+
+def _users_legacy_columns(ctx: MigrationContext):
+    """Колонки, которые добавлял simple_migrate"""
+    ctx.add_column("users", "total_requests_used", "INTEGER", "0")
+    ctx.add_column("users", "reset_counter", "INTEGER", "0")
+    ctx.add_column("users", "reset_type", "VARCHAR", "'daily'")
+    ctx.add_column("users", "used_promo_codes", "TEXT", "'[]'")
+    ctx.add_column("users", "last_request_type", "VARCHAR")
+
+
+def _hot_path_indexes(ctx: MigrationContext):
+    # bulk-сброс квоты и /stats фильтруют по last_reset, статистика промокодов - по used_by
+    ctx.create_index("ix_users_last_reset", "users", ["last_reset"])
+    ctx.create_index("ix_promo_codes_used_by", "promo_codes", ["used_by"])
+
+
+def _drop_schema_version(ctx: MigrationContext):
+    """Одна строка с версией из прежнего быстрого старта больше не нужна"""
+    ctx.drop_table("schema_version")
+
+
+_V5 = MetaData()
+Table(
+    "stats_totals", _V5,
+    Column("id", Integer, primary_key=True),
+    *(Column(name, Integer, nullable=False)
+      for name in ("users", "promos_created", "promos_used", "promos_active", "requests_free", "requests_paid")),
+)
+Table(
+    "stats_daily", _V5,
+    Column("day", Date, primary_key=True),
+    *(Column(name, Integer, nullable=False)
+      for name in ("new_users", "active_users", "promos_created", "promos_used", "requests_free", "requests_paid")),
+)
+
+
+def _stats_counters(ctx: MigrationContext):
+    """Счетчики для /stats и дата активности для DAU. Итоги заполняются по текущим данным,
+    списания запросов считаются с этой миграции"""
+    ctx.add_column("users", "last_active_date", "DATE")
+    ctx.create_table(_V5.tables["stats_totals"])
+    ctx.create_table(_V5.tables["stats_daily"])
+    ctx.execute(
+        "INSERT INTO stats_totals (id, users, promos_created, promos_used, promos_active, requests_free, requests_paid) "
+        "SELECT 1, "
+        "(SELECT count(*) FROM users), "
+        "(SELECT count(*) FROM promo_codes), "
+        "(SELECT count(*) FROM promo_codes WHERE used_by IS NOT NULL), "
+        "(SELECT count(*) FROM promo_codes WHERE is_active = :active AND used_by IS NULL), "
+        "0, 0 "
+        "WHERE NOT EXISTS (SELECT 1 FROM stats_totals WHERE id = 1)",
+        {"active": True},
+    )
+
+
+_V6 = MetaData()
+Table(
+    "usage_ledger", _V6,
+    Column("id", Integer, primary_key=True),
+    Column("user_id", Integer, nullable=False, index=True),
+    Column("created_at", DateTime, nullable=False, index=True),
+    Column("request_type", String, nullable=False),
+    Column("outcome", String, nullable=False),
+    Column("latency_ms", Integer, nullable=False),
+    Column("cache_hit", Boolean, nullable=False),
+    Column("prompt_tokens", Integer, nullable=False),
+    Column("completion_tokens", Integer, nullable=False),
+)
+
+
+def _usage_ledger(ctx: MigrationContext):
+    ctx.create_table(_V6.tables["usage_ledger"])
+
+
+_V7 = MetaData()
+Table(
+    "payments", _V7,
+    Column("id", Integer, primary_key=True),
+    Column("telegram_payment_charge_id", String, nullable=False, unique=True),
+    Column("provider_payment_charge_id", String, nullable=True),
+    Column("user_id", Integer, nullable=False, index=True),
+    Column("currency", String, nullable=False),
+    Column("amount", Integer, nullable=False),
+    Column("requests", Integer, nullable=False),
+    Column("payload", String, nullable=True),
+    Column("created_at", DateTime, nullable=False),
+)
+
+
+def _payments(ctx: MigrationContext):
+    ctx.create_table(_V7.tables["payments"])
+
+
+MIGRATIONS = [
+    Migration(1, "baseline", _baseline),
+    Migration(2, "users_legacy_columns", _users_legacy_columns),
+    Migration(3, "hot_path_indexes", _hot_path_indexes, transactional=False),
+    Migration(4, "drop_schema_version", _drop_schema_version),
+    Migration(5, "stats_counters", _stats_counters),
+    Migration(6, "usage_ledger", _usage_ledger),
+    Migration(7, "payments", _payments),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+# ----------------- Раннер -----------------
+def current_version(engine):
+    """Последняя примененная версия одним запросом; None если миграций еще не было"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text(f"SELECT max(version) FROM {MIGRATIONS_TABLE}")).scalar()
+    except DBAPIError:
+        return None
+
+
+def _ensure_migrations_table(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+            " version INTEGER PRIMARY KEY,"
+            " name VARCHAR(200) NOT NULL,"
+            " applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def _applied_versions(engine) -> set:
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}"))}
+
+
+def _record(conn, migration: Migration):
+    conn.execute(
+        text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {"version": migration.version, "name": migration.name, "applied_at": datetime.datetime.utcnow()},
+    )
+
+
+def pending_migrations(engine, migrations=None) -> list:
+    migrations = migrations or MIGRATIONS
+    if current_version(engine) is None:
+        return list(migrations)
+    applied = _applied_versions(engine)
+    return [migration for migration in migrations if migration.version not in applied]
+
+
+def migrate(engine, dry_run: bool = False, migrations=None) -> list:
+    """Применяет недостающие миграции по порядку. Возвращает [(migration, [sql, ...]), ...]"""
+    migrations = migrations or MIGRATIONS
+    if not dry_run and current_version(engine) == migrations[-1].version:
+        return []
+
+    pending = pending_migrations(engine, migrations)
+    if not dry_run and pending:
+        _ensure_migrations_table(engine)
+
+    applied = []
+    for migration in pending:
+        if dry_run:
+            # Только чтение: собираем SQL, ничего не меняя
+            with engine.connect() as conn:
+                ctx = MigrationContext(conn, dry_run=True)
+                migration.upgrade(ctx)
+                conn.rollback()
+        elif migration.transactional:
+            with engine.begin() as conn:
+                ctx = MigrationContext(conn)
+                migration.upgrade(ctx)
+                _record(conn, migration)
+        else:
+            # CONCURRENTLY нельзя в транзакции - каждый оператор сам по себе
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                ctx = MigrationContext(conn)
+                migration.upgrade(ctx)
+                _record(conn, migration)
+        applied.append((migration, ctx.statements))
+        action = "would apply" if dry_run else "applied"
+        logger.info(f"🗄 Migration {migration.version} ({migration.name}) {action}: {len(ctx.statements)} statements")
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("--dry-run", action="store_true", help="показать SQL, ничего не меняя")
+    parser.add_argument("--status", action="store_true", help="показать версию и ожидающие миграции")
+    args = parser.parse_args()
+
+    from app.db.database import engine
+
+    if args.status:
+        print(f"Current version: {current_version(engine)}, latest: {LATEST_VERSION}")
+        for migration in pending_migrations(engine):
+            print(f"  pending: {migration.version} {migration.name}")
+        return
+
+    for migration, statements in migrate(engine, dry_run=args.dry_run):
+        print(f"-- {migration.version} {migration.name}")
+        for sql in statements:
+            print(f"{sql};")
+    print("✅ Schema is up to date" if not args.dry_run else "ℹ️ Dry run, nothing changed")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,9 +13,11 @@ class User(Base):
     free_requests = Column(Integer, default=0)
     paid_requests = Column(Integer, default=0)
     total_requests_used = Column(Integer, default=0)
+    last_request_type = Column(String, nullable=True)  # "free" / "paid" - тип последнего списания
+    last_active_date = Column(Date, nullable=True)  # день последнего апдейта - для DAU
     
     # Сбросы
-    last_reset = Column(Date, default=datetime.date.today)
+    last_reset = Column(Date, default=datetime.date.today, index=True)
     reset_counter = Column(Integer, default=0)  # Счетчик сбросов
     
     # Промокоды
@@ -30,7 +32,7 @@ class PromoCode(Base):
     created_by = Column(Integer)  # ID админа, создавшего промокод
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
     expires_at = Column(DateTime)
-    used_by = Column(Integer, nullable=True)  # Кто использовал
+    used_by = Column(Integer, nullable=True, index=True)  # Кто использовал
     used_at = Column(DateTime, nullable=True)
     is_active = Column(Boolean, default=True)
 
@@ -47,4 +49,52 @@ class UserLimit(Base):
     __tablename__ = "user_limits"
     user_id = Column(Integer, primary_key=True)
     last_reset = Column(Date, nullable=False)
-    used_requests = Column(Integer, default=0)
\ No newline at end of file
+    used_requests = Column(Integer, default=0)
+
+class StatsTotals(Base):
+    """Накопленные итоги для /stats - одна строка (id=1)"""
+    __tablename__ = "stats_totals"
+    id = Column(Integer, primary_key=True)
+    users = Column(Integer, nullable=False, default=0)
+    promos_created = Column(Integer, nullable=False, default=0)
+    promos_used = Column(Integer, nullable=False, default=0)
+    promos_active = Column(Integer, nullable=False, default=0)
+    requests_free = Column(Integer, nullable=False, default=0)
+    requests_paid = Column(Integer, nullable=False, default=0)
+
+class StatsDaily(Base):
+    """Дневные срезы счетчиков - история"""
+    __tablename__ = "stats_daily"
+    day = Column(Date, primary_key=True)
+    new_users = Column(Integer, nullable=False, default=0)
+    active_users = Column(Integer, nullable=False, default=0)
+    promos_created = Column(Integer, nullable=False, default=0)
+    promos_used = Column(Integer, nullable=False, default=0)
+    requests_free = Column(Integer, nullable=False, default=0)
+    requests_paid = Column(Integer, nullable=False, default=0)
+
+class UsageEvent(Base):
+    """Журнал анализов - только добавление, пишется пачками (app/services/usage_ledger.py)"""
+    __tablename__ = "usage_ledger"
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    created_at = Column(DateTime, nullable=False, index=True)
+    request_type = Column(String, nullable=False)  # "free" / "paid"
+    outcome = Column(String, nullable=False)       # "ok" или тип ошибки анализа
+    latency_ms = Column(Integer, nullable=False)
+    cache_hit = Column(Boolean, nullable=False, default=False)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+
+class Payment(Base):
+    """Зачисленные платежи. Уникальный charge id - повторная доставка апдейта не зачисляет дважды"""
+    __tablename__ = "payments"
+    id = Column(Integer, primary_key=True)
+    telegram_payment_charge_id = Column(String, nullable=False, unique=True)
+    provider_payment_charge_id = Column(String, nullable=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    currency = Column(String, nullable=False)
+    amount = Column(Integer, nullable=False)    # Stars
+    requests = Column(Integer, nullable=False)  # зачислено запросов
+    payload = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.datetime.utcnow)
@@ -0,0 +1,91 @@
+# app/db/profiles.py
+"""Профили движков БД.
+
+sqlite-wal    - WAL, synchronous=NORMAL, mmap и busy_timeout на каждом соединении:
+                читатели не блокируются записью квоты
+sqlite-legacy - прежнее поведение (rollback journal), для сравнения
+postgres      - пул с запасом соединений и pre-ping
+Профиль выбирается DB_PROFILE; auto - по схеме DATABASE_URL.
+"""
+import logging
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+SQLITE_WAL = "sqlite-wal"
+SQLITE_LEGACY = "sqlite-legacy"
+POSTGRES = "postgres"
+PROFILES = (SQLITE_WAL, SQLITE_LEGACY, POSTGRES)
+
+
+def resolve_profile(url: str, profile: str = None) -> str:
+    profile = profile or DatabaseConfig.PROFILE
+    if profile == "auto":
+        return SQLITE_WAL if url.startswith("sqlite") else POSTGRES
+    if profile not in PROFILES:
+        raise ValueError(f"unknown DB profile {profile!r}, expected one of {PROFILES}")
+    return profile
+
+
+def insert_for(dialect: str):
+    """insert() с поддержкой ON CONFLICT для диалекта движка"""
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def sqlite_pragmas() -> dict:
+    return {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": DatabaseConfig.SQLITE_BUSY_TIMEOUT_MS,
+        "mmap_size": DatabaseConfig.SQLITE_MMAP_SIZE,
+        "cache_size": -DatabaseConfig.SQLITE_CACHE_KB,  # отрицательное значение - в КБ
+        "temp_store": "MEMORY",
+        "foreign_keys": "ON",
+    }
+
+
+def engine_kwargs(profile: str) -> dict:
+    if profile == POSTGRES:
+        return {
+            "pool_size": DatabaseConfig.POOL_SIZE,
+            "max_overflow": DatabaseConfig.MAX_OVERFLOW,
+            "pool_timeout": DatabaseConfig.POOL_TIMEOUT,
+            "pool_recycle": DatabaseConfig.POOL_RECYCLE,
+            "pool_pre_ping": True,
+        }
+    return {}
+
+
+def _install_sqlite_pragmas(sync_engine):
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(sync_engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_sync_engine(url: str, profile: str = None):
+    profile = resolve_profile(url, profile)
+    connect_args = {"check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(url, connect_args=connect_args, **engine_kwargs(profile))
+    if profile == SQLITE_WAL:
+        _install_sqlite_pragmas(engine)
+    return engine
+
+
+def create_async_engine_for(url: str, profile: str = None):
+    profile = resolve_profile(url, profile)
+    engine = create_async_engine(url, **engine_kwargs(profile))
+    if profile == SQLITE_WAL:
+        # События соединения вешаются на синхронное ядро async-движка
+        _install_sqlite_pragmas(engine.sync_engine)
+    return engine
@@ -0,0 +1,34 @@
+# app/db/quota_reset.py
+"""Правила сброса бесплатных запросов.
+
+Сброс ленивый: в БД хранится значение на момент last_reset, а актуальный лимит
+вычисляется при чтении. Материализуется он только при следующей записи квоты
+(reserve_request) или плановым bulk UPDATE в режиме RESET_MODE="eager".
+"""
+import datetime
+from app.config import RequestConfig
+
+
+def free_requests_limit() -> int:
+    """Размер бесплатной квоты на период"""
+    return RequestConfig.FREE_REQUESTS_DAILY if RequestConfig.RESET_TYPE == "daily" else RequestConfig.FREE_REQUESTS_WEEKLY
+
+
+def reset_threshold(today: datetime.date) -> datetime.date:
+    """Квота сбрасывается, если last_reset < этой даты"""
+    if RequestConfig.RESET_TYPE == "daily":
+        return today
+    return today - datetime.timedelta(days=6)  # weekly: прошло >= 7 дней
+
+
+def needs_reset(last_reset, today: datetime.date) -> bool:
+    return last_reset is None or last_reset < reset_threshold(today)
+
+
+def effective_free_requests(stored_free: int, last_reset, today: datetime.date) -> int:
+    """Сколько бесплатных запросов у пользователя с учетом невыполненного сброса"""
+    return free_requests_limit() if needs_reset(last_reset, today) else stored_free
+
+
+def effective_last_reset(last_reset, today: datetime.date):
+    return today if needs_reset(last_reset, today) else last_reset
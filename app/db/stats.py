@@ -0,0 +1,52 @@
+# app/db/stats.py
+"""Инкрементальные счетчики для /stats.
+
+stats_totals - одна строка с итогами, stats_daily - строка на день (история).
+Счетчики увеличиваются в той же транзакции, что и само событие (новый пользователь,
+промокод, списание запроса), так что /stats читает одну строку вместо count() по таблицам.
+Оба UPDATE - upsert: строка создается при первом событии.
+"""
+import datetime
+from app.db.models import StatsDaily, StatsTotals
+from app.db.profiles import insert_for
+
+TOTALS_ID = 1
+
+_totals = StatsTotals.__table__
+_daily = StatsDaily.__table__
+
+
+def _upsert(dialect: str, table, key: dict, deltas: dict):
+    stmt = insert_for(dialect)(table).values(**key, **deltas)
+    return stmt.on_conflict_do_update(
+        index_elements=list(key),
+        set_={name: table.c[name] + stmt.excluded[name] for name in deltas},
+    )
+
+
+def counter_statements(dialect: str, day: datetime.date = None, **deltas) -> list:
+    """Upsert итогов и дневной строки. Ключ deltas - колонка stats_totals и/или stats_daily"""
+    unknown = set(deltas) - set(_totals.c.keys()) - set(_daily.c.keys())
+    if unknown:
+        raise ValueError(f"unknown stats counters: {sorted(unknown)}")
+    statements = []
+    totals = {name: value for name, value in deltas.items() if name in _totals.c and name != "id"}
+    if totals:
+        statements.append(_upsert(dialect, _totals, {"id": TOTALS_ID}, totals))
+    daily = {name: value for name, value in deltas.items() if name in _daily.c and name != "day"}
+    if daily:
+        statements.append(_upsert(dialect, _daily, {"day": day or datetime.date.today()}, daily))
+    return statements
+
+
+async def bump(db, day: datetime.date = None, **deltas):
+    """Счетчики в транзакции AsyncSession - коммитит вызывающий"""
+    for stmt in counter_statements(db.get_bind().dialect.name, day, **deltas):
+        await db.execute(stmt)
+
+
+def bump_sync(db, day: datetime.date = None, **deltas):
+    """То же для синхронной Session (в т.ч. внутри run_sync)"""
+    for stmt in counter_statements(db.get_bind().dialect.name, day, **deltas):
+        db.execute(stmt)
+
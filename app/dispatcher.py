@@ -0,0 +1,104 @@
+# app/dispatcher.py
+"""Сборка dispatcher: роутеры и хуки запуска/остановки.
+
+Отдельный модуль, чтобы `python -m app.main` и воркеры (webhook, sharded)
+подключали роутеры ровно один раз.
+"""
+import asyncio
+import logging
+from app.bot_instance import bot, dp
+from app.config import RequestConfig, MetricsConfig, ProfilingConfig
+from app.services import metrics
+from app.services.analyzer_scheduler import analyzer_scheduler
+from app.services.single_flight import analysis_flights
+from app.services.state_store import pending_photos
+from app.middlewares.timing import setup_timing
+from app.middlewares.activity import ActivityMiddleware
+from app.services.loop_monitor import loop_monitor
+from app.services.usage_ledger import usage_ledger
+from app.services.pricing import pricing_registry
+
+# Импортируем ВСЕ роутеры
+from app.handlers.basic import router as basic_router
+from app.handlers.payment_handler import payment_router
+from app.handlers.admin_handler import admin_router
+
+# Подключаем роутеры в правильном порядке
+dp.include_router(basic_router)    # Основные команды и обработка текста
+dp.include_router(payment_router)  # Платежи
+dp.include_router(admin_router)    # Админка
+
+# Тайминг всех хендлеров: медленные - в лог, скользящая статистика - в /handler_stats
+setup_timing(dp)
+
+# DAU: первый апдейт пользователя за день
+dp.update.outer_middleware(ActivityMiddleware())
+
+logger = logging.getLogger(__name__)
+
+_background_tasks = []
+_metrics_runner = None
+
+# Gauge-метрики считываются в момент запроса /metrics
+metrics.analyzer_active.set_function(lambda: analyzer_scheduler.active)
+metrics.analyzer_queue_depth.set_function(lambda: analyzer_scheduler.queue_depth)
+metrics.analysis_in_flight.set_function(lambda: analysis_flights.in_flight)
+
+async def _pending_photos_count():
+    return (await pending_photos.stats())["entries"]
+
+metrics.pending_photos_count.set_function(_pending_photos_count)
+metrics.usage_pending.set_function(lambda: usage_ledger.pending if usage_ledger else 0)
+
+@dp.startup()
+async def on_startup(shard_index: int = 0):
+    # В режиме sharded сброс лимитов запускает только первый воркер
+    if RequestConfig.RESET_MODE == "eager" and shard_index == 0:
+        from app.services.reset_scheduler import run_reset_scheduler
+        _background_tasks.append(asyncio.create_task(run_reset_scheduler()))
+
+    if ProfilingConfig.LOOP_MONITOR:
+        loop_monitor.start()
+
+    # Импорт openai (~0.2 с) - в потоке сразу после старта, а не в первом анализе пользователя
+    from app.services.openai_analyzer import openai_analyzer
+    _background_tasks.append(asyncio.create_task(openai_analyzer.warm_up()))
+
+    if usage_ledger is not None:
+        usage_ledger.start()
+
+    # Тарифы из PRICING_FILE подхватываются без перезапуска
+    pricing_registry.start()
+
+    # Постоянный уровень кэша результатов открывается здесь, а не при импорте
+    from app.services.result_cache import result_cache
+    if result_cache is not None:
+        await result_cache.open()
+
+    # Процессы пережатия фото стартуют сейчас, а не на первом фото пользователя
+    from app.services.image_pipeline import warm_pipeline
+    await warm_pipeline()
+
+    global _metrics_runner
+    if MetricsConfig.ENABLED and _metrics_runner is None:
+        try:
+            _metrics_runner = await metrics.start_metrics_server(MetricsConfig.HOST, MetricsConfig.PORT + shard_index)
+        except OSError as e:
+            logger.warning(f"⚠️ Metrics server not started: {e}")
+
+@dp.shutdown()
+async def on_shutdown():
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    await loop_monitor.stop()
+    await pricing_registry.stop()
+    # Дописываем журнал анализов до закрытия соединений
+    if usage_ledger is not None:
+        await usage_ledger.stop()
+    global _metrics_runner
+    if _metrics_runner is not None:
+        await _metrics_runner.cleanup()
+        _metrics_runner = None
+    from app.services.image_pipeline import shutdown_pipeline
+    shutdown_pipeline()
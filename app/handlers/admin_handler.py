@@ -3,7 +3,12 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, CommandObject
 from app.config import RequestConfig, ADMIN_ID
 from app.services.promo_service import PromoService
-from app.db.database import SessionLocal, add_paid_requests
+from app.db.async_database import AsyncSessionLocal, add_paid_requests, get_stats, get_daily_stats
+from app.db.balance_cache import balance_cache
+from app.services.single_flight import analysis_flights
+from app.middlewares.timing import handler_stats
+from app.services.loop_monitor import loop_monitor, loop_blocks_total
+from app.services.pricing import pricing_registry
 from app.db.models import PromoCode
 from datetime import datetime, timedelta
 import logging
@@ -25,7 +30,8 @@ async def admin_panel(message: Message):
     await message.answer(
         "⚙️ **Админ панель**\n\n"
         "Доступные команды:\n"
-        "/stats - Статистика\n"
+        "/stats [дней] - Статистика\n"
+        "/handler_stats [reset] - Задержки хендлеров\n"
         "/create_promo <запросы> - Создать промокод\n"
         "/list_promos - Список промокодов\n"
         "/add_requests <user_id> <кол-во> - Добавить запросы\n"
@@ -40,7 +46,7 @@ async def service_code(message: Message):
         return
     
     # Добавляем запросы админу
-    new_balance = add_paid_requests(message.from_user.id, RequestConfig.SERVICE_CODE_REQUESTS)
+    new_balance = await add_paid_requests(message.from_user.id, RequestConfig.SERVICE_CODE_REQUESTS)
     
     await message.answer(
         f"🎯 **Сервисный код активирован!**\n\n"
@@ -64,10 +70,9 @@ async def create_promo(message: Message, command: CommandObject):
             await message.answer("❌ Используйте: /create_promo <количество_запросов> или без аргументов для значения по умолчанию")
             return
     
-    db = SessionLocal()
-    
     try:
-        promo = PromoService.create_promo_code(db, requests, message.from_user.id)
+        async with AsyncSessionLocal() as db:
+            promo = await db.run_sync(PromoService.create_promo_code, requests, message.from_user.id)
         
         expires_str = promo.expires_at.strftime("%d.%m.%Y %H:%M")
         
@@ -83,8 +88,6 @@ async def create_promo(message: Message, command: CommandObject):
     except Exception as e:
         logger.error(f"Error creating promo: {e}")
         await message.answer("❌ Ошибка при создании промокода")
-    finally:
-        db.close()
 
 @admin_router.message(Command("add_requests"))
 async def add_requests_admin(message: Message, command: CommandObject):
@@ -105,7 +108,7 @@ async def add_requests_admin(message: Message, command: CommandObject):
         user_id = int(args[0])
         requests = int(args[1])
         
-        new_balance = add_paid_requests(user_id, requests)
+        new_balance = await add_paid_requests(user_id, requests)
         
         await message.answer(
             f"✅ **Запросы добавлены!**\n\n"
@@ -119,48 +122,101 @@ async def add_requests_admin(message: Message, command: CommandObject):
         await message.answer("❌ Ошибка при добавлении запросов")
 
 @admin_router.message(Command("stats"))
-async def show_stats(message: Message):
-    """Показать статистику"""
+async def show_stats(message: Message, command: CommandObject):
+    """Показать статистику (/stats <дней> - история по дням)"""
     if not is_admin(message.from_user.id):
         return
     
-    from app.db.database import SessionLocal
-    from app.db.models import User, PromoCode
-    from sqlalchemy import func
+    if command.args:
+        await show_daily_stats(message, command.args.strip())
+        return
     
-    db = SessionLocal()
     try:
-        # Статистика пользователей
-        total_users = db.query(User).count()
-        active_today = db.query(User).filter(
-            User.last_reset == datetime.now().date()
-        ).count()
+        # Счетчики обновляются по событиям - здесь одна строка, без count() по таблицам
+        stats = await get_stats()
         
-        # Статистика промокодов
-        total_promos = db.query(PromoCode).count()
-        used_promos = db.query(PromoCode).filter(PromoCode.used_by.isnot(None)).count()
-        active_promos = db.query(PromoCode).filter(
-            PromoCode.is_active == True,
-            PromoCode.used_by.is_(None)
-        ).count()
+        cache_stats = balance_cache.stats()
+        flight_stats = analysis_flights.stats()
         
         await message.answer(
             f"📊 **Статистика системы:**\n\n"
             f"👥 **Пользователи:**\n"
-            f"• Всего: {total_users}\n"
-            f"• Активных сегодня: {active_today}\n\n"
+            f"• Всего: {stats['users']}\n"
+            f"• Активных сегодня: {stats['active_users']}\n"
+            f"• Новых сегодня: {stats['new_users']}\n\n"
             f"🎫 **Промокоды:**\n"
-            f"• Всего: {total_promos}\n"
-            f"• Использовано: {used_promos}\n"
-            f"• Активных: {active_promos}\n\n"
+            f"• Всего: {stats['promos_created']}\n"
+            f"• Использовано: {stats['promos_used']}\n"
+            f"• Активных: {stats['promos_active']}\n\n"
+            f"🧾 **Запросы:**\n"
+            f"• Бесплатных/платных всего: {stats['requests_free']}/{stats['requests_paid']}\n"
+            f"• Сегодня: {stats['today_requests_free']}/{stats['today_requests_paid']}\n\n"
+            f"🗄 **Кэш балансов:**\n"
+            f"• Записей: {cache_stats['size']}\n"
+            f"• Попаданий/промахов: {cache_stats['hits']}/{cache_stats['misses']} ({cache_stats['hit_rate']:.0%})\n\n"
+            f"🔗 **Анализы:**\n"
+            f"• Вызовов API: {flight_stats['calls']}\n"
+            f"• Схлопнуто дублей: {flight_stats['coalesced']}\n\n"
             f"⚙️ **Настройки:**\n"
             f"• Бесплатных запросов: {RequestConfig.FREE_REQUESTS_DAILY if RequestConfig.RESET_TYPE == 'daily' else RequestConfig.FREE_REQUESTS_WEEKLY} ({RequestConfig.RESET_TYPE})\n"
-            f"• Тарифов: {len(RequestConfig.PRICING)}",
+            f"• Тарифов: {len(pricing_registry.current.pricing)} ({pricing_registry.current.source})",
             parse_mode="Markdown"
         )
         
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         await message.answer("❌ Ошибка при получении статистики")
-    finally:
-        db.close()
\ No newline at end of file
+
+async def show_daily_stats(message: Message, args: str):
+    """История по дням из stats_daily"""
+    try:
+        days = max(1, min(int(args), 90))
+    except ValueError:
+        await message.answer("❌ Используйте: /stats или /stats <дней>")
+        return
+    
+    rows = await get_daily_stats(days)
+    lines = [f"📅 Статистика за {days} дн. (день: активных / новых / запросов беспл.+плат. / промо):", ""]
+    for row in rows:
+        lines.append(
+            f"{row.day.strftime('%d.%m')}: {row.active_users} / {row.new_users} / "
+            f"{row.requests_free}+{row.requests_paid} / {row.promos_used}"
+        )
+    if not rows:
+        lines.append("📭 Данных пока нет")
+    await message.answer("\n".join(lines), parse_mode=None)
+
+@admin_router.message(Command("handler_stats"))
+async def show_handler_stats(message: Message, command: CommandObject):
+    """Скользящие задержки хендлеров (p50/p95/p99)"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    if command.args and command.args.strip() == "reset":
+        handler_stats.reset()
+        await message.answer("✅ Статистика хендлеров сброшена")
+        return
+    
+    rows = handler_stats.snapshot()
+    lines = ["⏱ Хендлеры (мс, окно последних вызовов):", ""]
+    for row in rows[:20]:
+        lines.append(
+            f"{row['handler']}\n"
+            f"  вызовов {row['calls']}, ошибок {row['errors']} | "
+            f"p50 {row['p50_ms']:.0f} · p95 {row['p95_ms']:.0f} · p99 {row['p99_ms']:.0f} · max {row['max_ms']:.0f}"
+        )
+    if not rows:
+        lines.append("📭 Замеров пока нет")
+    
+    lag = loop_monitor.percentiles()
+    if lag:
+        lines += ["", f"🔄 Задержка event loop: p50 {lag['0.5'] * 1000:.1f} · p99 {lag['0.99'] * 1000:.1f} · max {lag['max'] * 1000:.0f} мс"]
+    if loop_monitor.blocks:
+        last_block = loop_monitor.blocks[-1]
+        # Последний кадр стека - место, где loop стоял
+        where = last_block["stack"].strip().splitlines()[-2:]
+        lines += [
+            f"🧊 Блокировок всего: {loop_blocks_total.value():.0f}, "
+            f"в памяти последних {len(loop_monitor.blocks)}; последняя {last_block['stalled_ms']:.0f}+ мс:"
+        ] + where
+    await message.answer("\n".join(lines), parse_mode=None)
@@ -4,14 +4,27 @@ from aiogram.filters import Command, CommandStart
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 import logging
 import random
-from app.db.database import get_user, use_free_request, use_paid_request
-from app.services.openai_analyzer import analyze_cat_image
+import time
+from app.db.async_database import get_balance
+from app.services.quota_service import consume_request, QuotaExhausted
+from app.services.openai_analyzer import (
+    analyze_cat_image, openai_analyzer, AnalysisResult, AnalysisFailed, ERROR_REQUEST, ERROR_NOT_CONFIGURED
+)
+from app.services.result_cache import result_cache, AnalysisResultCache, telegram_image_key, content_image_key
+from app.services.single_flight import analysis_flights
+from app.services.stream_editor import StreamingMessageEditor
+from app.config import AnalyzerConfig
+from app.services.state_store import pending_photos
+from app.services.image_pipeline import pick_photo_size, prepare_image
+from app.services.analyzer_scheduler import analyzer_scheduler, QueueFull, PRIORITY_PAID, PRIORITY_FREE
+from app.services.metrics import stage_seconds, analyses_total
+from app.services.usage_ledger import usage_ledger
+from app.services.pricing import pricing_registry
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-# Храним последние фото пользователей
-user_last_photos = {}
+QUEUE_FULL_TEXT = "🙀 Сейчас слишком много котиков на оценке. Попробуй через минуту!"
 
 # Главное меню с 3 кнопками
 MAIN_MENU_KEYBOARD = InlineKeyboardMarkup(
@@ -55,7 +68,7 @@ async def start_handler(message: Message):
 @router.callback_query(lambda c: c.data == "check_limit")
 async def check_limit_handler(callback: types.CallbackQuery):
     user_id = callback.from_user.id
-    user = get_user(user_id)
+    user = await get_balance(user_id)
     
     await callback.message.answer(
         f"📊 Ваш баланс:\n\n"
@@ -67,27 +80,9 @@ async def check_limit_handler(callback: types.CallbackQuery):
     
 @router.callback_query(lambda c: c.data == "topup_limit")
 async def topup_limit_handler(callback: types.CallbackQuery):
-    """Показ меню пополнения через Stars"""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(text="15 ⭐ - 3 запроса", callback_data="buy_15"),
-                InlineKeyboardButton(text="45 ⭐ - 10 запросов", callback_data="buy_45"),
-            ],
-            [
-                InlineKeyboardButton(text="80 ⭐ - 20 запросов", callback_data="buy_80"),
-            ]
-        ]
-    )
-    
-    await callback.message.answer(
-        "🎯 Выберите пакет запросов:\n\n"
-        "💫 15 ⭐ = 3 запроса\n"
-        "✨ 45 ⭐ = 10 запросов\n" 
-        "🌟 80 ⭐ = 20 запросов\n\n"
-        "⭐ Stars покупаются прямо в Telegram",
-        reply_markup=keyboard
-    )
+    """Показ меню пополнения через Stars - тот же текст и клавиатура, что у /replenish"""
+    pricing = pricing_registry.current
+    await callback.message.answer(pricing.menu_text, reply_markup=pricing.keyboard, parse_mode="Markdown")
     await callback.answer()
 
 @router.callback_query(lambda c: c.data == "rate_cat")
@@ -107,9 +102,9 @@ async def handle_photo_directly(message: Message):
     logger.info(f"✅ Photo received from user {user_id}")
     
     try:
-        # Сохраняем file_id последнего фото
-        photo = message.photo[-1]
-        user_last_photos[user_id] = photo.file_id
+        # Сохраняем file_id подходящего размера: самый маленький, что покрывает целевое разрешение
+        photo = pick_photo_size(message.photo)
+        await pending_photos.set(user_id, {"file_id": photo.file_id, "file_unique_id": photo.file_unique_id})
         
         await message.answer(
             "✅ Фото получено! Нажми 'Оценить этого котика' для анализа 🐱",
@@ -119,6 +114,110 @@ async def handle_photo_directly(message: Message):
         logger.error(f"❌ Error saving photo: {e}")
         await message.answer("Ой! Не удалось сохранить фото. Попробуй еще раз! 😿")
 
+async def _cached_result(analysis_key: str):
+    if result_cache is None:
+        return None
+    return await result_cache.get(analysis_key)
+
+async def _download_photo(file_id: str) -> bytes:
+    """Скачивает сохраненное фото"""
+    from app.bot_instance import bot
+    with stage_seconds.time(stage="get_file"):
+        file = await bot.get_file(file_id)
+    with stage_seconds.time(stage="download"):
+        photo_bytes = await bot.download_file(file.file_path)
+    raw_data = photo_bytes.getvalue()
+    logger.info(f"✅ Photo downloaded for analysis, size: {len(raw_data)} bytes")
+    return raw_data
+
+async def _analyze_image(raw_data: bytes, analysis_key: str, priority: str, on_queue_position, on_partial) -> AnalysisResult:
+    """Готовит фото, анализирует через планировщик и кладет результат в кэш"""
+    # Уменьшаем и пережимаем перед отправкой
+    with stage_seconds.time(stage="prepare_image"):
+        image_data = await prepare_image(raw_data)
+    
+    # Анализируем через общий планировщик (лимит параллельных запросов + очередь)
+    analysis = await analyzer_scheduler.run(
+        lambda: analyze_cat_image(image_data, on_partial), priority, on_queue_position
+    )
+    if result_cache is not None and analysis.ok:
+        await result_cache.put(analysis_key, analysis.text)
+    return analysis
+
+async def _single_flight(analysis_key: str, coro_factory) -> AnalysisResult:
+    """analysis_flights.do, но присоединившиеся получают копию без токенов (as_shared)"""
+    leader = []
+    
+    async def run():
+        leader.append(True)
+        return await coro_factory()
+    
+    analysis = await analysis_flights.do(analysis_key, run)
+    return analysis if leader else analysis.as_shared()
+
+async def analyze_pending_photo(pending: dict, priority: str = PRIORITY_FREE, on_queue_position=None,
+                                on_partial=None) -> AnalysisResult:
+    """Скачивает, готовит и анализирует фото.
+
+    Повторные фото берутся из кэша без скачивания, одинаковые одновременные
+    анализы схлопываются в один вызов API (single-flight). on_partial получает
+    частичный текст только у того вызова, который реально идет в API.
+    """
+    prompt_version = openai_analyzer.prompt_version
+    
+    if pending.get("file_unique_id"):
+        analysis_key = AnalysisResultCache.make_key(telegram_image_key(pending["file_unique_id"]), prompt_version)
+        cached = await _cached_result(analysis_key)
+        if cached is not None:
+            logger.info(f"♻️ Analysis cache hit for {pending['file_unique_id']}")
+            return AnalysisResult.success(cached, cached=True)
+        
+        async def download_and_analyze():
+            raw_data = await _download_photo(pending["file_id"])
+            return await _analyze_image(raw_data, analysis_key, priority, on_queue_position, on_partial)
+        
+        return await _single_flight(analysis_key, download_and_analyze)
+    
+    # Без file_unique_id ключ - хэш содержимого, он известен только после скачивания
+    raw_data = await _download_photo(pending["file_id"])
+    analysis_key = AnalysisResultCache.make_key(content_image_key(raw_data), prompt_version)
+    cached = await _cached_result(analysis_key)
+    if cached is not None:
+        logger.info("♻️ Analysis cache hit by content hash")
+        return AnalysisResult.success(cached, cached=True)
+    
+    return await _single_flight(
+        analysis_key, lambda: _analyze_image(raw_data, analysis_key, priority, on_queue_position, on_partial)
+    )
+
+def _record_usage(user_id: int, reservation, started: float, analysis: AnalysisResult = None, outcome: str = None):
+    """Событие в журнал анализов - в память, в БД запишется фоном.
+
+    reservation=None - запрос не резервировался; analysis=None - до анализа не дошло, нужен outcome.
+    """
+    if usage_ledger is None:
+        return
+    if outcome is None:
+        outcome = "ok" if analysis.ok else analysis.error
+    usage_ledger.record(
+        user_id,
+        reservation.request_type if reservation is not None else "none",
+        outcome,
+        (time.perf_counter() - started) * 1000,
+        cache_hit=analysis.cached if analysis is not None else False,
+        prompt_tokens=analysis.prompt_tokens if analysis is not None else 0,
+        completion_tokens=analysis.completion_tokens if analysis is not None else 0,
+    )
+
+async def _delete_processing_message(processing_msg):
+    """Убирает "Анализирую котика..." - ошибка удаления не должна подменять ответ пользователю"""
+    if processing_msg is None:
+        return
+    try:
+        await processing_msg.delete()
+    except Exception as e:
+        logger.warning(f"⚠️ Could not delete processing message: {e}")
+
 # ----------------- Обработка кнопки "Оценить этого котика" -----------------
 @router.message(F.text == "Оценить этого котика")
 async def analyze_photo_directly(message: Message):
@@ -128,60 +227,95 @@ async def analyze_photo_directly(message: Message):
     logger.info(f"🔍 Analyze photo button pressed by user {user_id}")
     
     # Проверяем есть ли фото
-    if user_id not in user_last_photos:
+    pending = await pending_photos.get(user_id)
+    if pending is None:
+        analyses_total.inc(outcome="no_photo")
         await message.answer("Сначала загрузи фото котика! 📸")
         return
     
-    # Проверяем баланс через новую систему
-    user = get_user(user_id)
-    
-    if user.free_requests <= 0 and user.paid_requests <= 0:
-        await message.answer(
-            "❌ У вас закончились запросы!\n\n"
-            "💫 Бесплатные запросы обновятся завтра\n"
-            "⭐ Или пополните баланс через меню"
-        )
+    # Очередь анализатора забита - отказываем сразу, ничего не списывая и не скачивая
+    started = time.perf_counter()
+    if analyzer_scheduler.is_saturated():
+        analyses_total.inc(outcome="queue_full")
+        _record_usage(user_id, None, started, outcome="queue_full")
+        await message.answer(QUEUE_FULL_TEXT, reply_markup=photo_received_keyboard)
         return
     
+    reservation = None
+    processing_msg = None
     try:
-        processing_msg = await message.answer("Анализирую котика... 🔍")
-        
-        # Получаем сохраненное фото
-        file_id = user_last_photos[user_id]
-        from app.bot_instance import bot
-        file = await bot.get_file(file_id)
-        photo_bytes = await bot.download_file(file.file_path)
-        
-        logger.info(f"✅ Photo downloaded for analysis, size: {len(photo_bytes.getvalue())} bytes")
+        # Резервируем запрос одним UPDATE: при ошибке скачивания/анализа он вернется
+        async with consume_request(user_id) as reservation:
+            # В потоковом режиме результат появится в этом же сообщении - клавиатуру "после оценки" ставим сразу
+            processing_msg = await message.answer(
+                "Анализирую котика... 🔍",
+                reply_markup=after_rating_keyboard if AnalyzerConfig.STREAMING else None
+            )
+            editor = StreamingMessageEditor(processing_msg, AnalyzerConfig.STREAM_EDIT_INTERVAL)
+            
+            async def show_queue_position(position: int):
+                await processing_msg.edit_text(f"Анализирую котика... 🔍\n⏳ Место в очереди: {position}")
+            
+            # Пользователи с оплаченным балансом - в приоритетной полосе
+            priority = PRIORITY_PAID if reservation.request_type == "paid" or reservation.paid_requests > 0 else PRIORITY_FREE
+            try:
+                analysis = await analyze_pending_photo(
+                    pending, priority, show_queue_position,
+                    on_partial=editor.update if AnalyzerConfig.STREAMING else None
+                )
+            finally:
+                # Дальше либо финальная правка, либо удаление сообщения - частичные правки больше не нужны
+                await editor.stop()
+            if not analysis.ok:
+                # Ошибка анализа - выходим из блока исключением, запрос вернется на баланс
+                raise AnalysisFailed(analysis)
         
-        # Анализируем
-        analysis_result = await analyze_cat_image(photo_bytes.getvalue())
-        
-        # Списываем запрос (сначала бесплатные, потом платные)
-        if user.free_requests > 0:
-            use_free_request(user_id)
-            request_type = "бесплатный"
-        else:
-            use_paid_request(user_id) 
-            request_type = "оплаченный"
-        
-        # Получаем обновленный баланс
-        user = get_user(user_id)
+        request_type = "бесплатный" if reservation.request_type == "free" else "оплаченный"
         
         # Удаляем фото
-        del user_last_photos[user_id]
+        await pending_photos.pop(user_id)
         
-        await processing_msg.delete()
-        await message.answer(
-            f"{analysis_result}\n\n"
+        result_text = (
+            f"{analysis.text}\n\n"
             f"📊 Использован {request_type} запрос\n"
-            f"🆓 Осталось бесплатных: {user.free_requests}\n"
-            f"⭐ Осталось оплаченных: {user.paid_requests}",
-            reply_markup=after_rating_keyboard
+            f"🆓 Осталось бесплатных: {reservation.free_requests}\n"
+            f"⭐ Осталось оплаченных: {reservation.paid_requests}"
         )
+        if AnalyzerConfig.STREAMING:
+            # Финальная правка с балансом вместо удаления и новой отправки
+            await editor.finish(result_text)
+        else:
+            await processing_msg.delete()
+            await message.answer(result_text, reply_markup=after_rating_keyboard)
+        analyses_total.inc(outcome="ok")
+        _record_usage(user_id, reservation, started, analysis)
         logger.info(f"✅ Photo analyzed successfully for user {user_id}")
         
+    except AnalysisFailed as e:
+        analyses_total.inc(outcome=f"failed_{e.result.error}")
+        _record_usage(user_id, reservation, started, e.result)
+        logger.error(f"❌ Analysis failed for user {user_id}: {e}")
+        await _delete_processing_message(processing_msg)
+        if e.result.error in (ERROR_REQUEST, ERROR_NOT_CONFIGURED):
+            text = "Ой! Не удалось проанализировать фото. Запрос не списан, попробуй еще раз! 😿"
+        else:
+            text = "😿 Сервис оценки котиков сейчас недоступен. Запрос не списан, попробуй чуть позже!"
+        await message.answer(text, reply_markup=photo_received_keyboard)
+    except QueueFull:
+        analyses_total.inc(outcome="queue_full")
+        _record_usage(user_id, reservation, started, outcome="queue_full")
+        await _delete_processing_message(processing_msg)
+        await message.answer(QUEUE_FULL_TEXT, reply_markup=photo_received_keyboard)
+    except QuotaExhausted:
+        analyses_total.inc(outcome="quota_exhausted")
+        await message.answer(
+            "❌ У вас закончились запросы!\n\n"
+            "💫 Бесплатные запросы обновятся завтра\n"
+            "⭐ Или пополните баланс через меню"
+        )
     except Exception as e:
+        analyses_total.inc(outcome="error")
+        _record_usage(user_id, reservation, started, outcome="error")
         logger.error(f"❌ Error analyzing photo: {e}")
         await message.answer("Ой! Не удалось проанализировать фото. Попробуй еще раз! 😿", reply_markup=photo_received_keyboard)
 
@@ -194,7 +328,7 @@ async def rate_another_cat_handler(message: Message):
     logger.info(f"🔄 User {user_id} wants to rate another cat")
     
     # Проверяем баланс через новую систему
-    user = get_user(user_id)
+    user = await get_balance(user_id)
     
     if user.free_requests <= 0 and user.paid_requests <= 0:
         await message.answer(
@@ -207,8 +341,7 @@ async def rate_another_cat_handler(message: Message):
         return
     
     # Очищаем старое фото если есть
-    if user_id in user_last_photos:
-        del user_last_photos[user_id]
+    await pending_photos.pop(user_id)
     
     await message.answer(
         "Загрузи фото следующего котика для оценки! 📸\n\n"
@@ -222,8 +355,7 @@ async def back_to_menu_directly(message: Message):
     """Возврат в главное меню"""
     logger.info(f"🟣 Обработчик 'Вернуться в меню' сработал для пользователя {message.from_user.id}")
     user_id = message.from_user.id
-    if user_id in user_last_photos:
-        del user_last_photos[user_id]
+    await pending_photos.pop(user_id)
     
     await message.answer("Возвращаемся в меню! 🏠", reply_markup=ReplyKeyboardRemove())
     await message.answer("Выбери действие:", reply_markup=MAIN_MENU_KEYBOARD)
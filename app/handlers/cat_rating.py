@@ -7,14 +7,13 @@ from app.db.models import UserLimit
 from datetime import date
 import logging
 from app.services.openai_analyzer import analyze_cat_image
+from app.services.state_store import pending_photos
 
 logger = logging.getLogger(__name__)
 
 cat_router = Router()
 MAX_REQUESTS = 10
 
-user_last_photos = {}
-
 photo_received_keyboard = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text="Оценить этого котика")],
@@ -40,7 +39,7 @@ async def handle_cat_photo(message: Message):
     
     try:
         photo = message.photo[-1]
-        user_last_photos[user_id] = photo.file_id
+        await pending_photos.set(user_id, {"file_id": photo.file_id, "file_unique_id": photo.file_unique_id})
         
         await message.answer(
             "✅ Фото получено! Что хотите сделать?",
@@ -60,7 +59,7 @@ async def analyze_current_photo(message: Message):
     
     logger.info(f"🔍 Analyze current photo by user {user_id}")
     
-    if user_id not in user_last_photos:
+    if await pending_photos.get(user_id) is None:
         await message.answer("📸 Сначала загрузи фото котика!", reply_markup=main_menu_keyboard)
         return
     
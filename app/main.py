@@ -1,55 +1,61 @@
 import asyncio
 import logging
-import os
-from dotenv import load_dotenv
 
-load_dotenv()
 logging.basicConfig(level=logging.INFO)
 
-print("=== НАСТРОЙКА БОТА ===")
+# Бот и роутеры импортируются в run(), а не здесь: дочерние процессы spawn/forkserver
+# (пул пережатия фото, воркеры webhook/sharded) заново импортируют этот модуль как __mp_main__
+from app.config import BotConfig, WebhookConfig
 
-# ЗАПУСКАЕМ ПРОСТУЮ МИГРАЦИЮ
-try:
-    from app.db.simple_migrate import simple_migrate
-    simple_migrate()
-    print("✅ Database migration completed")
-except Exception as e:
-    print(f"⚠️ Migration warning: {e}")
+def prepare_database():
+    """Версионные миграции схемы - один раз в главном процессе"""
+    print("=== НАСТРОЙКА БОТА ===")
 
-# Импортируем bot и dp
-from app.bot_instance import bot, dp
-print("✅ Bot instance loaded")
+    from app.db.migrations import migrate
+    from app.db.database import engine
 
-# Импортируем ВСЕ роутеры
-from app.handlers.basic import router as basic_router
-from app.handlers.payment_handler import payment_router
-from app.handlers.admin_handler import admin_router
+    # Без полной схемы бот не стартует: иначе, например, без payments оплата спишет Stars и не зачислится
+    try:
+        applied = migrate(engine)
+    except Exception as e:
+        print(f"❌ Migration failed, bot not started: {e}")
+        raise
+    if applied:
+        print(f"✅ Database migrated to version {applied[-1][0].version}")
+    else:
+        print("✅ Database schema is up to date")
 
-# Подключаем роутеры в правильном порядке
-dp.include_router(basic_router)    # Основные команды и обработка текста
-dp.include_router(payment_router)  # Платежи
-dp.include_router(admin_router)    # Админка
-print("✅ All routers loaded")
+    # Соединения главного процесса не должны достаться воркерам
+    engine.dispose()
 
-from app.db.models import Base
-from app.db.database import engine
+async def main():
+    from app.dispatcher import bot, dp
+    logging.info("Запуск бота...")
+    await dp.start_polling(bot)
 
-# Создаем только НОВЫЕ таблицы
-try:
-    Base.metadata.create_all(bind=engine)
-except:
-    pass
+def run():
+    # Импортируем bot и dp вместе с роутерами
+    import app.dispatcher  # noqa: F401
+    print("✅ Bot instance loaded")
+    print("✅ All routers loaded")
 
-print("=== ЗАПУСК БОТА ===")
+    prepare_database()
 
-# ПРОВЕРКА КОНФИГА
-from app.config import RequestConfig
-print("✅ Config loaded")
-print(f"PRICING: {RequestConfig.PRICING}")
+    print("=== ЗАПУСК БОТА ===")
 
-async def main():
-    logging.info("Запуск бота...")
-    await dp.start_polling(bot)
+    # ПРОВЕРКА КОНФИГА
+    print("✅ Config loaded")
+    from app.services.pricing import pricing_registry
+    print(f"PRICING: {pricing_registry.current}")
+
+    if BotConfig.MODE == "webhook":
+        from app.webhook import run_webhook
+        run_webhook(WebhookConfig.WORKERS)
+    elif BotConfig.MODE == "sharded":
+        from app.sharding import run_sharded
+        run_sharded(BotConfig.SHARD_WORKERS)
+    else:
+        asyncio.run(main())
 
 if __name__ == '__main__':
-    asyncio.run(main())
\ No newline at end of file
+    run()
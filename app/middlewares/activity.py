@@ -0,0 +1,40 @@
+# app/middlewares/activity.py
+"""Учет активных за день пользователей (DAU).
+
+Первый апдейт пользователя за день переводит users.last_active_date и увеличивает
+stats_daily.active_users. Уже отмеченные сегодня пользователи помнятся в памяти,
+так что на остальные апдейты запросов к БД нет.
+"""
+import datetime
+import logging
+from aiogram import BaseMiddleware
+from app.db.async_database import mark_user_active
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityMiddleware(BaseMiddleware):
+    def __init__(self, mark_active=None):
+        self._mark_active = mark_active or mark_user_active
+        self._day = None
+        self._seen = set()
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is not None:
+            await self._touch(user.id)
+        return await handler(event, data)
+
+    async def _touch(self, user_id: int):
+        today = datetime.date.today()
+        if today != self._day:
+            self._day = today
+            self._seen = set()
+        if user_id in self._seen:
+            return
+        self._seen.add(user_id)
+        try:
+            await self._mark_active(user_id, today)
+        except Exception as e:
+            self._seen.discard(user_id)
+            logger.warning(f"⚠️ Failed to mark user {user_id} active: {e}")
@@ -0,0 +1,138 @@
+# app/middlewares/timing.py
+"""Постоянный профайлер хендлеров.
+
+Outer-middleware на dp.update меряет полное время обработки апдейта (фильтры + хендлер),
+inner-middleware на событиях dispatcher сообщает ему, какой хендлер сработал.
+Медленные вызовы пишутся в лог структурной записью, по каждому хендлеру
+копится скользящее окно задержек для /handler_stats.
+"""
+import json
+import logging
+import statistics
+import time
+from collections import deque
+from app.config import ProfilingConfig
+from app.services.metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+handler_seconds = Histogram("catbot_handler_seconds", "Update handling time by handler", ["handler", "update_type"])
+
+UNHANDLED = "unhandled"
+
+
+class _Probe:
+    """Передается из outer в inner middleware через data"""
+    __slots__ = ("handler",)
+
+    def __init__(self):
+        self.handler = None
+
+
+def handler_name(handler_object) -> str:
+    callback = handler_object.callback
+    return f"{callback.__module__.rsplit('.', 1)[-1]}.{getattr(callback, '__qualname__', repr(callback))}"
+
+
+class HandlerStats:
+    """Скользящие задержки по хендлерам"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self._samples = {}  # имя хендлера -> deque секунд
+        self._calls = {}
+        self._errors = {}
+
+    def record(self, name: str, seconds: float, failed: bool = False):
+        samples = self._samples.get(name)
+        if samples is None:
+            samples = self._samples[name] = deque(maxlen=self.window)
+        samples.append(seconds)
+        self._calls[name] = self._calls.get(name, 0) + 1
+        if failed:
+            self._errors[name] = self._errors.get(name, 0) + 1
+
+    def snapshot(self) -> list:
+        """Список словарей по хендлерам, самые медленные (p95) первыми"""
+        rows = []
+        for name, samples in self._samples.items():
+            ordered = sorted(samples)
+            if len(ordered) > 1:
+                quantiles = statistics.quantiles(ordered, n=100)
+                p50, p95, p99 = quantiles[49], quantiles[94], quantiles[98]
+            else:
+                p50 = p95 = p99 = ordered[0]
+            rows.append({
+                "handler": name,
+                "calls": self._calls[name],
+                "errors": self._errors.get(name, 0),
+                "p50_ms": p50 * 1000,
+                "p95_ms": p95 * 1000,
+                "p99_ms": p99 * 1000,
+                "max_ms": ordered[-1] * 1000,
+            })
+        rows.sort(key=lambda row: row["p95_ms"], reverse=True)
+        return rows
+
+    def reset(self):
+        self._samples.clear()
+        self._calls.clear()
+        self._errors.clear()
+
+
+handler_stats = HandlerStats(ProfilingConfig.HANDLER_STATS_WINDOW)
+
+
+class HandlerTimingMiddleware:
+    """Outer-middleware для dp.update"""
+
+    def __init__(self, stats: HandlerStats, slow_ms: float):
+        self.stats = stats
+        self.slow_ms = slow_ms
+
+    async def __call__(self, handler, event, data):
+        probe = _Probe()
+        data["timing_probe"] = probe
+        started = time.perf_counter()
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            name = handler_name(probe.handler) if probe.handler is not None else UNHANDLED
+            update_type = event.event_type
+            self.stats.record(name, elapsed, failed)
+            handler_seconds.observe(elapsed, handler=name, update_type=update_type)
+            if elapsed * 1000 >= self.slow_ms:
+                event_user = data.get("event_from_user")
+                record = {
+                    "event": "slow_handler",
+                    "handler": name,
+                    "update_type": update_type,
+                    "update_id": event.update_id,
+                    "user_id": event_user.id if event_user else None,
+                    "duration_ms": round(elapsed * 1000, 1),
+                    "failed": failed,
+                }
+                logger.warning(f"🐢 Slow handler: {json.dumps(record, ensure_ascii=False)}")
+
+
+async def _mark_handler(handler, event, data):
+    """Inner-middleware: запоминает выбранный хендлер в probe"""
+    probe = data.get("timing_probe")
+    if probe is not None:
+        probe.handler = data.get("handler")
+    return await handler(event, data)
+
+
+def setup_timing(dispatcher, stats: HandlerStats = None, slow_ms: float = None):
+    """Подключает профайлер к dispatcher. Inner-middleware наследуются вложенными роутерами"""
+    dispatcher.update.outer_middleware(
+        HandlerTimingMiddleware(stats or handler_stats, ProfilingConfig.SLOW_HANDLER_MS if slow_ms is None else slow_ms)
+    )
+    for event_name, observer in dispatcher.observers.items():
+        if event_name not in ("update", "error"):
+            observer.middleware(_mark_handler)
@@ -0,0 +1,129 @@
+# app/services/analyzer_scheduler.py
+"""Планировщик вызовов анализатора.
+
+Глобальный лимит одновременных запросов к API и ограниченная очередь ожидания
+с двумя полосами: пользователи с оплаченным балансом идут раньше бесплатных.
+Если очередь заполнена, запрос сразу отклоняется (QueueFull), а не копится.
+"""
+import asyncio
+import logging
+from collections import deque
+from app.config import AnalyzerConfig
+from app.services.metrics import stage_seconds
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_PAID = "paid"
+PRIORITY_FREE = "free"
+
+
+class QueueFull(Exception):
+    """Очередь анализатора переполнена"""
+
+
+class _Waiter:
+    __slots__ = ("future", "on_position", "last_position")
+
+    def __init__(self, future, on_position):
+        self.future = future
+        self.on_position = on_position
+        self.last_position = None
+
+
+class AnalyzerScheduler:
+    def __init__(self, max_concurrency: int, max_queue: int):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._active = 0
+        self._lanes = {PRIORITY_PAID: deque(), PRIORITY_FREE: deque()}
+        self.rejected = 0
+        self.completed = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._lanes[PRIORITY_PAID]) + len(self._lanes[PRIORITY_FREE])
+
+    def is_saturated(self) -> bool:
+        """Новый запрос будет отклонен - можно не скачивать фото"""
+        return self._active >= self.max_concurrency and self.queue_depth >= self.max_queue
+
+    async def run(self, coro_factory, priority: str = PRIORITY_FREE, on_position=None):
+        """Выполняет coro_factory() когда освободится слот.
+
+        on_position(position) - async-колбэк, вызывается при изменении места в очереди.
+        """
+        with stage_seconds.time(stage="queue_wait"):
+            await self._acquire(priority, on_position)
+        try:
+            return await coro_factory()
+        finally:
+            self.completed += 1
+            self._release()
+
+    async def _acquire(self, priority: str, on_position):
+        if self._active < self.max_concurrency and self.queue_depth == 0:
+            self._active += 1
+            return
+
+        if self.queue_depth >= self.max_queue:
+            self.rejected += 1
+            raise QueueFull(f"analyzer queue is full ({self.queue_depth})")
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), on_position)
+        lane = self._lanes[priority if priority in self._lanes else PRIORITY_FREE]
+        lane.append(waiter)
+        self._notify_positions()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Слот уже передан нам - отдаем его следующему
+                self._release()
+            elif waiter in lane:
+                lane.remove(waiter)
+                self._notify_positions()
+            raise
+
+    def _release(self):
+        for lane in (self._lanes[PRIORITY_PAID], self._lanes[PRIORITY_FREE]):
+            while lane:
+                waiter = lane.popleft()
+                if not waiter.future.done():
+                    # Слот переходит ожидающему, счетчик активных не меняется
+                    waiter.future.set_result(None)
+                    self._notify_positions()
+                    return
+        self._active -= 1
+
+    def _notify_positions(self):
+        position = 0
+        for lane in (self._lanes[PRIORITY_PAID], self._lanes[PRIORITY_FREE]):
+            for waiter in lane:
+                position += 1
+                if waiter.on_position is not None and waiter.last_position != position:
+                    waiter.last_position = position
+                    asyncio.ensure_future(self._safe_notify(waiter.on_position, position))
+
+    @staticmethod
+    async def _safe_notify(callback, position: int):
+        try:
+            await callback(position)
+        except Exception as e:
+            logger.debug(f"Queue position callback failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queued_paid": len(self._lanes[PRIORITY_PAID]),
+            "queued_free": len(self._lanes[PRIORITY_FREE]),
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+analyzer_scheduler = AnalyzerScheduler(AnalyzerConfig.MAX_CONCURRENCY, AnalyzerConfig.MAX_QUEUE)
@@ -0,0 +1,128 @@
+# app/services/image_pipeline.py
+"""Подготовка фото к анализу: выбор подходящего PhotoSize и пережатие в JPEG.
+
+Пережатие - CPU-работа, поэтому выполняется в пуле процессов, а не в event loop.
+Без Pillow фото отправляется как есть.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from app.config import ImageConfig
+from app.services import metrics
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow не установлен - работаем без пережатия
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+# Накопительная статистика по пайплайну
+pipeline_stats = {"images": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def pick_photo_size(photo_sizes, target_side: int = None):
+    """Самый маленький PhotoSize, у которого длинная сторона >= target_side (иначе самый большой)"""
+    target_side = target_side or ImageConfig.TARGET_SIDE
+    ordered = sorted(photo_sizes, key=lambda size: max(size.width, size.height))
+    for size in ordered:
+        if max(size.width, size.height) >= target_side:
+            return size
+    return ordered[-1]
+
+
+def recompress_jpeg(data: bytes, max_side: int, quality: int, min_quality: int, max_bytes: int) -> bytes:
+    """Уменьшает фото до max_side и пережимает в JPEG, снижая качество до укладывания в max_bytes"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        image.thumbnail((max_side, max_side))
+
+        result = data
+        while True:
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=quality, optimize=True)
+            result = buffer.getvalue()
+            if len(result) <= max_bytes or quality <= min_quality:
+                break
+            quality = max(min_quality, quality - 10)
+
+    # Не ухудшаем то, что и так было меньше
+    return result if len(result) < len(data) else data
+
+
+def _start_method() -> str:
+    if ImageConfig.START_METHOD:
+        return ImageConfig.START_METHOD
+    return "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=ImageConfig.PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context(_start_method()),
+        )
+    return _executor
+
+
+def _warmup() -> int:
+    """Выполняется в воркере: модуль и Pillow уже импортированы"""
+    import os
+    return os.getpid()
+
+
+async def warm_pipeline():
+    """Поднимает все процессы пула заранее, чтобы первое фото не ждало их запуска"""
+    if Image is None:
+        return
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    started = time.perf_counter()
+    pids = await asyncio.gather(
+        *(loop.run_in_executor(executor, _warmup) for _ in range(ImageConfig.PROCESS_WORKERS))
+    )
+    logger.info(f"🗜 Image pipeline warmed: {len(set(pids))} workers in {time.perf_counter() - started:.2f}s")
+
+
+async def prepare_image(data: bytes) -> bytes:
+    """Пережимает фото в пуле процессов и считает сэкономленные байты"""
+    prepared = data
+    if Image is not None:
+        try:
+            loop = asyncio.get_running_loop()
+            prepared = await loop.run_in_executor(
+                _get_executor(),
+                recompress_jpeg,
+                data,
+                ImageConfig.MAX_SIDE,
+                ImageConfig.JPEG_QUALITY,
+                ImageConfig.MIN_JPEG_QUALITY,
+                ImageConfig.MAX_BYTES,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Image recompress failed, sending original: {e}")
+
+    pipeline_stats["images"] += 1
+    pipeline_stats["bytes_in"] += len(data)
+    pipeline_stats["bytes_out"] += len(prepared)
+    metrics.images_prepared_total.inc()
+    metrics.image_bytes_saved_total.inc(len(data) - len(prepared))
+    logger.info(f"🗜 Image prepared: {len(data)} -> {len(prepared)} bytes (saved {len(data) - len(prepared)})")
+    return prepared
+
+
+def bytes_saved() -> int:
+    return pipeline_stats["bytes_in"] - pipeline_stats["bytes_out"]
+
+
+def shutdown_pipeline():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -0,0 +1,120 @@
+# app/services/loop_monitor.py
+"""Монитор задержки event loop.
+
+Корутина-пульс раз в interval меряет, насколько позже положенного она проснулась.
+Отдельный поток-сторож следит за пульсом: если loop не отвечает дольше порога,
+снимает стек потока loop через sys._current_frames и пишет его в лог - так видно,
+какой синхронный вызов (БД, base64, промокоды) держит loop.
+"""
+import asyncio
+import logging
+import statistics
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from app.config import ProfilingConfig
+from app.services.metrics import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+loop_lag_seconds = Histogram(
+    "catbot_loop_lag_seconds", "Event loop lag per heartbeat",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+loop_lag_quantile_seconds = Gauge(
+    "catbot_loop_lag_quantile_seconds", "Event loop lag percentiles over the recent window", ["quantile"]
+)
+loop_blocks_total = Counter("catbot_loop_blocks_total", "Event loop stalls longer than the block threshold")
+
+# Как часто пересчитывать перцентили, в пульсах
+_QUANTILES_EVERY = 10
+
+
+class LoopMonitor:
+    def __init__(self, interval: float, block_threshold: float, window: int = 600, keep_blocks: int = 20):
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self._lags = deque(maxlen=window)
+        self.blocks = deque(maxlen=keep_blocks)  # последние снимки: {"at", "stalled_ms", "stack"}
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = 0.0
+        self._reported_beat = None
+        self._task = None
+        self._watchdog = None
+        self._stop = threading.Event()
+
+    # ----------------- пульс в event loop -----------------
+    async def _heartbeat(self):
+        beats = 0
+        while True:
+            self._last_beat = time.monotonic()
+            started = self._loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, self._loop.time() - started - self.interval)
+            self._lags.append(lag)
+            loop_lag_seconds.observe(lag)
+            beats += 1
+            if beats % _QUANTILES_EVERY == 0:
+                self._export_quantiles()
+
+    def _export_quantiles(self):
+        for name, value in self.percentiles().items():
+            loop_lag_quantile_seconds.set(value, quantile=name)
+
+    def percentiles(self) -> dict:
+        lags = list(self._lags)
+        if len(lags) < 2:
+            return {}
+        quantiles = statistics.quantiles(lags, n=100)
+        return {"0.5": quantiles[49], "0.95": quantiles[94], "0.99": quantiles[98], "max": max(lags)}
+
+    # ----------------- сторож в отдельном потоке -----------------
+    def _watch(self):
+        check_every = min(self.interval, self.block_threshold) / 2
+        while not self._stop.wait(check_every):
+            beat = self._last_beat
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.block_threshold or self._reported_beat == beat:
+                continue
+            # Один снимок на одну остановку loop
+            self._reported_beat = beat
+            self._capture(stalled)
+
+    def _capture(self, stalled: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else "<no frame>"
+        loop_blocks_total.inc()
+        self.blocks.append({"at": time.time(), "stalled_ms": stalled * 1000, "stack": stack})
+        logger.warning(f"🧊 Event loop blocked for {stalled * 1000:.0f}+ ms, loop thread stack:\n{stack}")
+
+    # ----------------- запуск/остановка -----------------
+    def start(self):
+        """Вызывать из работающего loop"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+
+
+loop_monitor = LoopMonitor(ProfilingConfig.LOOP_LAG_INTERVAL, ProfilingConfig.LOOP_BLOCK_MS / 1000)
@@ -0,0 +1,262 @@
+# app/services/metrics.py
+"""Метрики бота в текстовом формате Prometheus, без внешних зависимостей.
+
+Counter/Gauge/Histogram с метками, общий реестр и маленький aiohttp-сервер с /metrics.
+Стадии считаются через histogram.time(label=...) - и как with, и как декоратор.
+"""
+import asyncio
+import bisect
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы бакетов по умолчанию, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    async def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for suffix, labels, value in await metric.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry: Registry = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labelnames) or any(name not in labels for name in self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _pairs(self, key: tuple) -> list:
+        return list(zip(self.labelnames, key))
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        if amount < 0:
+            raise ValueError("counter can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    async def samples(self):
+        with self._lock:
+            return [("", self._pairs(key), value) for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry: Registry = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def set_function(self, function):
+        """Значение берется при каждом сборе: function() может быть обычной или async"""
+        if self.labelnames:
+            raise ValueError("set_function is only supported for gauges without labels")
+        self._function = function
+
+    async def samples(self):
+        if self._function is not None:
+            try:
+                value = self._function()
+                if inspect.isawaitable(value):
+                    value = await value
+            except Exception as e:
+                logger.warning(f"⚠️ Gauge {self.name} callback failed: {e}")
+                return []
+            return [("", [], value)]
+        with self._lock:
+            return [("", self._pairs(key), value) for key, value in self._values.items()]
+
+
+class _Timer:
+    """Замер длительности: with histogram.time(...) или @histogram.time(...)"""
+
+    def __init__(self, histogram, labels: dict):
+        self._histogram = histogram
+        self._labels = labels
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe(time.perf_counter() - self._started, **self._labels)
+        return False
+
+    def __call__(self, function):
+        histogram, labels = self._histogram, self._labels
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return function(*args, **kwargs)
+        return wrapper
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry: Registry = None,
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, **labels) -> _Timer:
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    async def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                pairs = self._pairs(key)
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    result.append(("_bucket", pairs + [("le", _format_value(float(bound)))], cumulative))
+                result.append(("_sum", pairs, total))
+                result.append(("_count", pairs, count))
+        return result
+
+
+# ----------------- Метрики бота -----------------
+stage_seconds = Histogram(
+    "catbot_stage_seconds", "Duration of photo analysis pipeline stages", ["stage"]
+)
+analyses_total = Counter("catbot_analyses_total", "Photo analyses by outcome", ["outcome"])
+db_seconds = Histogram(
+    "catbot_db_seconds", "Duration of async DB helpers", ["op"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+payments_total = Counter("catbot_payments_total", "Payment flow events by step and outcome", ["step", "outcome"])
+payment_stars_total = Counter("catbot_payment_stars_total", "Telegram Stars received")
+payment_seconds = Histogram("catbot_payment_seconds", "Duration of payment flow steps", ["step"])
+analyzer_active = Gauge("catbot_analyzer_active", "Analyzer calls in progress")
+analyzer_queue_depth = Gauge("catbot_analyzer_queue_depth", "Requests waiting for an analyzer slot")
+analysis_in_flight = Gauge("catbot_analysis_in_flight", "Distinct analyses in flight after coalescing")
+pending_photos_count = Gauge("catbot_pending_photos", "Photos waiting for the rate button")
+shard_backpressure_total = Counter(
+    "catbot_shard_backpressure_total", "Times polling paused because a shard queue was full", ["shard"]
+)
+usage_events_total = Counter("catbot_usage_events_total", "Usage ledger events by result", ["result"])
+images_prepared_total = Counter("catbot_images_prepared_total", "Photos passed through the image pipeline")
+image_bytes_saved_total = Counter("catbot_image_bytes_saved_total", "Bytes saved by recompressing photos")
+usage_pending = Gauge("catbot_usage_pending", "Usage ledger events waiting to be written")
+
+
+# ----------------- HTTP /metrics -----------------
+async def _metrics_handler(request: web.Request):
+    return web.Response(
+        body=(await REGISTRY.render()).encode("utf-8"),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+def add_metrics_route(app: web.Application, path: str = "/metrics"):
+    app.router.add_get(path, _metrics_handler)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    add_metrics_route(app)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"📈 Metrics on http://{host}:{port}/metrics")
+    return runner
@@ -1,39 +1,128 @@
 # app/services/openai_analyzer.py
-from openai import AsyncOpenAI
+import asyncio
 import base64
 import logging
 import os
-from dotenv import load_dotenv
+from app.config import ImageConfig, AnalyzerConfig, OPENAI_API_KEY
+from app.services.result_cache import prompt_hash
+from app.services.resilience import CircuitBreaker, call_with_retries
+from app.services.metrics import stage_seconds
 
 logger = logging.getLogger(__name__)
 
+# Типы ошибок анализа
+ERROR_NOT_CONFIGURED = "not_configured"
+ERROR_CIRCUIT_OPEN = "circuit_open"
+ERROR_TIMEOUT = "timeout"
+ERROR_UPSTREAM = "upstream"  # 429/5xx/сеть - апстрим недоступен
+ERROR_REQUEST = "request"    # прочие ошибки (невалидный запрос и т.п.)
+
+
+class AnalysisResult:
+    """Результат анализа: либо text, либо error (тип ошибки) и detail.
+    cached - ответ взят из кэша или общего вызова, токены тогда не тратились"""
+    __slots__ = ("text", "error", "detail", "cached", "prompt_tokens", "completion_tokens")
+
+    def __init__(self, text: str = None, error: str = None, detail: str = None,
+                 cached: bool = False, prompt_tokens: int = 0, completion_tokens: int = 0):
+        self.text = text
+        self.error = error
+        self.detail = detail
+        self.cached = cached
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @classmethod
+    def success(cls, text: str, prompt_tokens: int = 0, completion_tokens: int = 0, cached: bool = False):
+        return cls(text=text, cached=cached, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    @classmethod
+    def failure(cls, error: str, detail: str = None):
+        return cls(error=error, detail=detail)
+
+    def as_shared(self):
+        """Копия для того, кто получил чужой результат: токены учтены у первого вызова"""
+        return AnalysisResult(self.text, self.error, self.detail, cached=True)
+
+    def __repr__(self):
+        return "AnalysisResult(ok)" if self.ok else f"AnalysisResult(error={self.error!r}, detail={self.detail!r})"
+
+
+class AnalysisFailed(Exception):
+    """Анализ не удался - запрос пользователя списывать нельзя"""
+
+    def __init__(self, result: AnalysisResult):
+        super().__init__(f"{result.error}: {result.detail}")
+        self.result = result
+
+
+def _token_counts(usage) -> tuple:
+    if usage is None:
+        return 0, 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """429, 5xx, таймауты и сетевые ошибки имеет смысл повторить"""
+    import openai
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError,
+                          openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
 class OpenAICatAnalyzer:
     def __init__(self):
-        # Загружаем .env
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.join(current_dir, '..', '..')
-        env_path = os.path.join(project_root, '.env')
-        
-        if os.path.exists(env_path):
-            load_dotenv(env_path)
-        else:
-            load_dotenv()
-        
-        self.api_key = os.getenv("OPENAI_API_KEY")
+        # .env уже загружен в app.config
+        self.api_key = OPENAI_API_KEY
         
         # Загружаем промпт из файла
         self.prompt_text = self._load_prompt()
+        # Версия промпта - часть ключа кэша результатов
+        self.prompt_version = prompt_hash(self.prompt_text)
+        
+        self.breaker = CircuitBreaker(
+            AnalyzerConfig.BREAKER_FAILURES, AnalyzerConfig.BREAKER_RESET_TIMEOUT, name="openai"
+        )
         
-        if self.api_key:
-            try:
-                self.client = AsyncOpenAI(api_key=self.api_key)
-                logger.info("✅ OpenAI client initialized!")
-            except Exception as e:
-                logger.error(f"OpenAI client error: {e}")
-                self.client = None
-        else:
+        # Клиент (и тяжелый импорт openai) создается в потоке: фоном после старта
+        # (warm_up из startup-хука) или, если не успел, при первом анализе - но не на event loop
+        self._client = None
+        self._client_failed = False
+        self._warming = None
+        if not self.api_key:
             logger.error("OPENAI_API_KEY not found!")
-            self.client = None
+    
+    @property
+    def client(self):
+        return self._client
+    
+    @client.setter
+    def client(self, value):
+        self._client = value
+    
+    def _create_client(self):
+        try:
+            from openai import AsyncOpenAI
+            # Повторяем сами, с джиттером и общим дедлайном
+            self._client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+            logger.info("✅ OpenAI client initialized!")
+        except Exception as e:
+            logger.error(f"OpenAI client error: {e}")
+            self._client_failed = True
+    
+    async def warm_up(self):
+        """Импортирует openai и создает клиент в пуле потоков; параллельные вызовы ждут один прогрев"""
+        if self._client is not None or not self.api_key or self._client_failed:
+            return
+        if self._warming is None or self._warming.get_loop() is not asyncio.get_running_loop():
+            self._warming = asyncio.ensure_future(asyncio.to_thread(self._create_client))
+        await asyncio.shield(self._warming)
     
     def _load_prompt(self):
         """Загружает промпт из файла"""
@@ -56,48 +145,102 @@ class OpenAICatAnalyzer:
             logger.error(f"Error loading prompt: {e}")
             return "Опиши этого котика на русском смешно и забавно! 2-3 предложения."
     
-    async def analyze_cat_image(self, image_data: bytes) -> str:
+    def _build_messages(self, image_base64: str):
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text", 
+                        "text": self.prompt_text
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{image_base64}",
+                            "detail": ImageConfig.DETAIL
+                        }
+                    }
+                ]
+            }
+        ]
+    
+    async def _request_analysis(self, image_base64: str, on_partial=None) -> AnalysisResult:
+        """Один запрос к API без повторов. С on_partial ответ читается потоком"""
+        streaming = on_partial is not None
+        response = await self.client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=self._build_messages(image_base64),
+            max_tokens=150,
+            temperature=0.9,
+            timeout=AnalyzerConfig.ATTEMPT_TIMEOUT,
+            stream=streaming,
+            # В потоке usage приходит последним чанком, только если попросить
+            **({"stream_options": {"include_usage": True}} if streaming else {})
+        )
+        if not streaming:
+            return AnalysisResult.success(response.choices[0].message.content, *_token_counts(response.usage))
+        
+        parts = []
+        usage = None
+        async for chunk in response:
+            if chunk.usage is not None:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+                await on_partial("".join(parts))
+        return AnalysisResult.success("".join(parts), *_token_counts(usage))
+    
+    async def analyze_cat_image(self, image_data: bytes, on_partial=None) -> AnalysisResult:
+        """Анализ фото. on_partial(text) - async-колбэк для частичного текста в потоковом режиме.
+
+        Колбэк вызывается внутри попытки с таймаутом, поэтому не должен ждать сеть (см. StreamingMessageEditor).
+        """
+        await self.warm_up()
         if not self.client:
-            return "❌ OpenAI API не настроен"
+            return AnalysisResult.failure(ERROR_NOT_CONFIGURED, "OPENAI_API_KEY not set")
+        
+        if not self.breaker.allow():
+            logger.warning("⚡ OpenAI circuit is open, failing fast")
+            return AnalysisResult.failure(ERROR_CIRCUIT_OPEN)
         
         try:
             logger.info("🔍 Анализируем котика через GPT-4o Mini...")
             
             # Кодируем изображение
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            
-            response = await self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text", 
-                                "text": self.prompt_text
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_base64}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=150,
-                temperature=0.9
-            )
+            with stage_seconds.time(stage="base64"):
+                image_base64 = base64.b64encode(image_data).decode('utf-8')
             
-            result = response.choices[0].message.content
-            logger.info(f"✅ OpenAI response: {result}")
+            with stage_seconds.time(stage="openai"):
+                result = await call_with_retries(
+                    lambda: self._request_analysis(image_base64, on_partial),
+                    is_retryable=is_retryable_error,
+                    max_retries=AnalyzerConfig.MAX_RETRIES,
+                    attempt_timeout=AnalyzerConfig.ATTEMPT_TIMEOUT,
+                    deadline=AnalyzerConfig.DEADLINE,
+                    backoff_base=AnalyzerConfig.BACKOFF_BASE,
+                    backoff_max=AnalyzerConfig.BACKOFF_MAX,
+                )
+            self.breaker.record_success()
+            logger.info(f"✅ OpenAI response: {result.text}")
             return result
             
         except Exception as e:
             logger.error(f"❌ Ошибка OpenAI: {e}")
-            return f"😿 Ошибка: {str(e)}"
+            if isinstance(e, asyncio.TimeoutError):
+                self.breaker.record_failure()
+                return AnalysisResult.failure(ERROR_TIMEOUT, str(e))
+            if is_retryable_error(e):
+                self.breaker.record_failure()
+                return AnalysisResult.failure(ERROR_UPSTREAM, str(e))
+            self.breaker.release_probe()
+            return AnalysisResult.failure(ERROR_REQUEST, str(e))
+        except BaseException:
+            # Отмена (CancelledError) - вердикта нет, но пробную попытку надо отпустить
+            self.breaker.release_probe()
+            raise
 
 openai_analyzer = OpenAICatAnalyzer()
 
-async def analyze_cat_image(image_data: bytes) -> str:
-    return await openai_analyzer.analyze_cat_image(image_data)
\ No newline at end of file
+async def analyze_cat_image(image_data: bytes, on_partial=None) -> AnalysisResult:
+    return await openai_analyzer.analyze_cat_image(image_data, on_partial)
\ No newline at end of file
@@ -0,0 +1,51 @@
+# app/services/payment_service.py
+"""Payload инвойса и проверка pre_checkout_query.
+
+Проверка идет только по памяти (текущий снимок реестра тарифов), без БД и сетевых вызовов -
+Telegram ждет ответ на pre_checkout не дольше 10 секунд.
+"""
+from app.services.pricing import pricing_registry
+
+CURRENCY = "XTR"
+
+
+def make_invoice_payload(stars: int, user_id: int, requests: int) -> str:
+    return f"stars_{stars}_{user_id}_{requests}"
+
+
+def parse_invoice_payload(payload: str):
+    """stars_<stars>_<user_id>[_<requests>] -> (stars, user_id, requests или None); None если формат другой"""
+    parts = (payload or "").split("_")
+    if len(parts) not in (3, 4) or parts[0] != "stars":
+        return None
+    try:
+        numbers = [int(part) for part in parts[1:]]
+    except ValueError:
+        return None
+    stars, user_id = numbers[0], numbers[1]
+    return stars, user_id, numbers[2] if len(numbers) == 3 else None
+
+
+def validate_pre_checkout(payload: str, currency: str, total_amount: int, user_id: int, pricing: dict = None):
+    """Текст ошибки для пользователя или None, если платеж можно принимать"""
+    pricing = pricing_registry.current.pricing if pricing is None else pricing
+    parsed = parse_invoice_payload(payload)
+    if parsed is None or currency != CURRENCY:
+        return "Некорректный платеж"
+    stars, payload_user_id, requests = parsed
+    if payload_user_id != user_id:
+        return "Этот счет выставлен другому пользователю"
+    if stars not in pricing or total_amount != stars:
+        return "Тариф не найден, выберите пакет заново"
+    if requests is not None and pricing[stars] != requests:
+        return "Тарифы изменились, выберите пакет заново"
+    return None
+
+
+def requests_for_payment(payload: str, total_amount: int, pricing: dict = None) -> int:
+    """Сколько запросов зачислить: из payload (сверен на pre_checkout), иначе по тарифу"""
+    pricing = pricing_registry.current.pricing if pricing is None else pricing
+    parsed = parse_invoice_payload(payload)
+    if parsed is not None and parsed[2] is not None:
+        return parsed[2]
+    return pricing.get(total_amount, total_amount // 5)
@@ -0,0 +1,144 @@
+# app/services/pricing.py
+"""Реестр тарифов Stars -> запросы.
+
+Клавиатуры и тексты меню пополнения собираются один раз на версию тарифов
+(PricingSnapshot) и отдаются всем точкам покупки как есть. Тарифы берутся из
+JSON-файла PRICING_FILE ({"15": 3, "45": 10, ...}), без файла - из RequestConfig.PRICING.
+Фоновая задача следит за mtime файла и при изменении подменяет снимок целиком:
+обработчики видят либо старый, либо новый набор, но не смесь.
+"""
+import asyncio
+import json
+import logging
+import os
+from types import MappingProxyType
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from app.config import PricingConfig, RequestConfig, get_free_requests_info
+
+logger = logging.getLogger(__name__)
+
+
+class PricingSnapshot:
+    """Неизменяемый набор тарифов с готовыми текстами и клавиатурами (общие объекты - не менять)"""
+    __slots__ = ("pricing", "source", "display_text", "menu_text", "prices_text", "keyboard", "keyboard_with_promo")
+
+    def __init__(self, pricing: dict, source: str = "config"):
+        ordered = dict(sorted((int(stars), int(requests)) for stars, requests in pricing.items()))
+        display_text = "\n".join(f"• {stars} ⭐ → {requests} запросов" for stars, requests in ordered.items())
+        rows = _button_rows(ordered)
+        values = {
+            "pricing": MappingProxyType(ordered),
+            "source": source,
+            "display_text": display_text,
+            "menu_text": (
+                f"🎯 **Выберите пакет запросов:**\n\n"
+                f"💫 {display_text}\n\n"
+                f"⭐ Stars покупаются прямо в Telegram"
+            ),
+            "prices_text": (
+                f"💫 **Доступные тарифы:**\n{display_text}\n\n"
+                f"{get_free_requests_info()}\n\n"
+                f"Выберите вариант пополнения:"
+            ),
+            "keyboard": InlineKeyboardMarkup(inline_keyboard=rows),
+            "keyboard_with_promo": InlineKeyboardMarkup(
+                inline_keyboard=rows + [[InlineKeyboardButton(text="🎁 Ввести промокод", callback_data="enter_promo")]]
+            ),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def requests_for(self, stars: int):
+        return self.pricing.get(stars)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PricingSnapshot is immutable")
+
+    def __repr__(self):
+        return f"PricingSnapshot({dict(self.pricing)}, source={self.source!r})"
+
+
+def _button_rows(pricing: dict) -> list:
+    """По две кнопки в ряд"""
+    buttons = [
+        InlineKeyboardButton(text=f"{stars} ⭐ - {requests} запросов", callback_data=f"buy_{stars}")
+        for stars, requests in pricing.items()
+    ]
+    return [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+
+
+def load_pricing_file(path: str) -> dict:
+    """{"15": 3, ...} или {"pricing": {...}}; ValueError при неверном содержимом"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and isinstance(data.get("pricing"), dict):
+        data = data["pricing"]
+    if not isinstance(data, dict) or not data:
+        raise ValueError("pricing file must contain a non-empty object")
+    pricing = {}
+    for stars, requests in data.items():
+        # 2.5, "3" и true не должны молча превратиться в число запросов
+        if not isinstance(requests, int) or isinstance(requests, bool):
+            raise ValueError(f"invalid tariff {stars}: {requests!r} is not an integer")
+        stars = int(stars)
+        if stars <= 0 or requests <= 0:
+            raise ValueError(f"invalid tariff {stars}: {requests}")
+        pricing[stars] = requests
+    return pricing
+
+
+class PricingRegistry:
+    def __init__(self, path: str, default_pricing: dict):
+        self.path = path
+        self._default = dict(default_pricing)
+        self._file_state = None
+        self._task = None
+        self.current = PricingSnapshot(self._default)
+        self.reload_if_changed()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self) -> bool:
+        """Перечитывает файл, если изменились mtime/размер. True - снимок подменен"""
+        if not self.path:
+            return False
+        state = self._stat()
+        if state is None or state == self._file_state:
+            # Файл удален - остаемся на последнем загруженном наборе
+            return False
+        self._file_state = state
+        try:
+            snapshot = PricingSnapshot(load_pricing_file(self.path), source=self.path)
+        except (OSError, ValueError, TypeError) as e:
+            logger.error(f"❌ Pricing file {self.path} ignored, keeping {dict(self.current.pricing)}: {e}")
+            return False
+        # Одно присваивание - атомарная подмена для всех обработчиков
+        self.current = snapshot
+        logger.info(f"💫 Pricing loaded from {self.path}: {dict(snapshot.pricing)}")
+        return True
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            self.reload_if_changed()
+
+    def start(self, interval: float = None):
+        if self._task is None and self.path:
+            self._task = asyncio.create_task(self._watch(interval or PricingConfig.WATCH_INTERVAL))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+pricing_registry = PricingRegistry(PricingConfig.FILE, RequestConfig.PRICING)
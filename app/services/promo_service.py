@@ -4,6 +4,7 @@ import string
 from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from app.db.models import PromoCode
+from app.db.stats import bump_sync
 from app.config import RequestConfig
 
 logger = logging.getLogger(__name__)
@@ -36,6 +37,7 @@ class PromoService:
         )
         
         db.add(promo)
+        bump_sync(db, promos_created=1, promos_active=1)
         db.commit()
         db.refresh(promo)
         
@@ -63,6 +65,7 @@ class PromoService:
         promo.used_by = user_id
         promo.used_at = datetime.now()
         promo.is_active = False
+        bump_sync(db, promos_used=1, promos_active=-1)
         
         db.commit()
         
@@ -0,0 +1,34 @@
+# app/services/quota_service.py
+import logging
+from contextlib import asynccontextmanager
+from app.db.async_database import get_balance, reserve_request, refund_request
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExhausted(Exception):
+    """У пользователя нет ни бесплатных, ни оплаченных запросов"""
+
+
+@asynccontextmanager
+async def consume_request(user_id: int):
+    """Резервирует запрос на время анализа и возвращает его, если внутри блока что-то упало
+
+    async with consume_request(user_id) as reservation:
+        ...  # скачивание и анализ
+    """
+    reservation = await reserve_request(user_id)
+    if reservation is None:
+        # Строки пользователя может еще не быть - get_balance создаст ее
+        balance = await get_balance(user_id)
+        if balance.free_requests > 0 or balance.paid_requests > 0:
+            reservation = await reserve_request(user_id)
+    if reservation is None:
+        raise QuotaExhausted(user_id)
+
+    try:
+        yield reservation
+    except BaseException:
+        await refund_request(reservation)
+        logger.info(f"↩️ Refunded {reservation.request_type} request to user {user_id}")
+        raise
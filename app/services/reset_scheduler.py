@@ -0,0 +1,30 @@
+# app/services/reset_scheduler.py
+import asyncio
+import datetime
+import logging
+from app.db.async_database import bulk_reset_free_requests
+
+logger = logging.getLogger(__name__)
+
+
+def seconds_until_next_run(now: datetime.datetime) -> float:
+    """Секунд до ближайшей полуночи (+1 секунда запаса)"""
+    tomorrow = (now + datetime.timedelta(days=1)).date()
+    next_run = datetime.datetime.combine(tomorrow, datetime.time(0, 0, 1))
+    return (next_run - now).total_seconds()
+
+
+async def run_reset_scheduler():
+    """Плановый bulk UPDATE сброса квоты для RESET_MODE="eager".
+
+    Чтения от этого не зависят - квота и так вычисляется лениво, задача лишь
+    заранее материализует сброс одной транзакцией вместо волны записей после полуночи.
+    """
+    logger.info("🕛 Eager quota reset scheduler started")
+    while True:
+        try:
+            reset_count = await bulk_reset_free_requests()
+            logger.info(f"🔄 Bulk quota reset: {reset_count} users")
+        except Exception as e:
+            logger.error(f"❌ Bulk quota reset failed: {e}")
+        await asyncio.sleep(seconds_until_next_run(datetime.datetime.now()))
@@ -0,0 +1,96 @@
+# app/services/resilience.py
+"""Повторы с джиттером, дедлайны и circuit breaker для внешних вызовов"""
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(Exception):
+    """Цепь разомкнута - апстрим недавно падал, вызов не выполняется"""
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """Истек общий дедлайн вызова вместе с повторами"""
+
+
+class CircuitBreaker:
+    """closed -> (N ошибок подряд) -> open -> (reset_timeout) -> half-open -> closed/open"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, name: str = "upstream"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+
+    def allow(self) -> bool:
+        """Можно ли делать вызов. В half-open пропускается одна пробная попытка"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"✅ Circuit '{self.name}' closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"⚡ Circuit '{self.name}' opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Пробный вызов завершился без вердикта (например, ошибка клиента) - даем сделать следующий"""
+        self._probe_in_flight = False
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full jitter: случайная пауза от 0 до min(cap, base * 2^attempt)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+async def call_with_retries(coro_factory, *, is_retryable, max_retries: int, attempt_timeout: float,
+                            deadline: float, backoff_base: float, backoff_max: float):
+    """Вызывает coro_factory() с таймаутом на попытку, повторами и общим дедлайном"""
+    deadline_at = time.monotonic() + deadline
+    attempt = 0
+    while True:
+        remaining = deadline_at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"deadline of {deadline}s exceeded")
+        try:
+            return await asyncio.wait_for(coro_factory(), timeout=min(attempt_timeout, remaining))
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, backoff_base, backoff_max)
+            if time.monotonic() + delay >= deadline_at:
+                raise
+            attempt += 1
+            logger.warning(f"🔁 Retry {attempt}/{max_retries} in {delay:.2f}s after {type(e).__name__}: {e}")
+            await asyncio.sleep(delay)
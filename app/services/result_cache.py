@@ -0,0 +1,162 @@
+# app/services/result_cache.py
+"""Кэш результатов анализа по содержимому фото.
+
+Ключ - Telegram file_unique_id (одинаков у пересланных копий) или sha256 байтов,
+плюс хэш текущего промпта: после правки cat_prompt.txt старые ответы не выдаются.
+Уровни: in-memory LRU и постоянный SQLite с TTL.
+"""
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from app.config import ResultCacheConfig
+
+logger = logging.getLogger(__name__)
+
+# Как часто чистить просроченные записи постоянного уровня
+_PURGE_EVERY_PUTS = 500
+
+
+def telegram_image_key(file_unique_id: str) -> str:
+    return f"tg:{file_unique_id}"
+
+
+def content_image_key(data: bytes) -> str:
+    return f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+
+def prompt_hash(prompt_text: str) -> str:
+    return hashlib.sha256(prompt_text.encode("utf-8")).hexdigest()[:16]
+
+
+class AnalysisResultCache:
+    """Двухуровневый кэш: память (LRU + TTL) -> SQLite (TTL)"""
+
+    def __init__(self, memory_size: int, ttl: float, sqlite_path: str = ""):
+        self.memory_size = memory_size
+        self.ttl = ttl
+        self._memory = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        # Файл открывается при первом обращении (или в open()), а не при импорте модуля
+        self.sqlite_path = sqlite_path
+        self._conn = None
+        self._puts = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(image_key: str, prompt_version: str) -> str:
+        return f"{prompt_version}:{image_key}"
+
+    def _memory_get(self, key):
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return entry[1]
+
+    def _memory_put(self, key, result, expires_at):
+        self._memory[key] = (expires_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _connection(self):
+        """Соединение с постоянным уровнем; вызывается под self._lock"""
+        if self._conn is None:
+            conn = sqlite3.connect(self.sqlite_path, check_same_thread=False, isolation_level=None, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                " key TEXT PRIMARY KEY,"
+                " result TEXT NOT NULL,"
+                " expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_analysis_cache_expires ON analysis_cache (expires_at)")
+            self._conn = conn
+        return self._conn
+
+    def _open(self):
+        with self._lock:
+            self._connection()
+
+    async def open(self):
+        """Открывает постоянный уровень заранее (startup-хук), чтобы не платить за это в первом запросе"""
+        if self.sqlite_path:
+            await asyncio.to_thread(self._open)
+
+    def _disk_get(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT result, expires_at FROM analysis_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row
+
+    def _disk_put(self, key, result, expires_at):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO analysis_cache (key, result, expires_at) VALUES (?, ?, ?)",
+                (key, result, expires_at),
+            )
+
+    def _disk_purge(self):
+        with self._lock:
+            return self._connection().execute("DELETE FROM analysis_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    async def get(self, key: str):
+        result = self._memory_get(key)
+        if result is not None:
+            self.memory_hits += 1
+            return result
+        if self.sqlite_path:
+            row = await asyncio.to_thread(self._disk_get, key)
+            if row is not None:
+                self._memory_put(key, row[0], row[1])
+                self.disk_hits += 1
+                return row[0]
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, result: str):
+        expires_at = time.time() + self.ttl
+        self._memory_put(key, result, expires_at)
+        if self.sqlite_path:
+            await asyncio.to_thread(self._disk_put, key, result, expires_at)
+            self._puts += 1
+            if self._puts % _PURGE_EVERY_PUTS == 0:
+                await self.purge_expired()
+
+    async def purge_expired(self) -> int:
+        """Удаляет просроченные записи постоянного уровня"""
+        if not self.sqlite_path:
+            return 0
+        return await asyncio.to_thread(self._disk_purge)
+
+    def stats(self) -> dict:
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Общий экземпляр; None если кэш выключен в конфиге
+result_cache = AnalysisResultCache(
+    ResultCacheConfig.MEMORY_SIZE,
+    ResultCacheConfig.TTL,
+    ResultCacheConfig.SQLITE_PATH,
+) if ResultCacheConfig.ENABLED else None
@@ -0,0 +1,49 @@
+# app/services/single_flight.py
+"""Single-flight: одновременные одинаковые вызовы ждут один общий результат.
+
+Пример - фото переслали в группу или пользователь дважды нажал кнопку:
+к API уходит один запрос, остальные вызывающие получают его результат.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Task
+        self.calls = 0       # реальных вызовов
+        self.coalesced = 0   # вызовов, присоединившихся к уже идущему
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Забираем исключение, чтобы не было "exception was never retrieved", если все ожидающие отменены
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, coro_factory):
+        """Возвращает результат coro_factory(); параллельные вызовы с тем же key его разделяют"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info(f"🔗 Coalesced in-flight call for {key}")
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(coro_factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        # shield: отмена одного ожидающего не отменяет общий вызов для остальных
+        return await asyncio.shield(task)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+
+# Общие анализы одного и того же фото
+analysis_flights = SingleFlight()
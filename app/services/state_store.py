@@ -0,0 +1,240 @@
+# app/services/state_store.py
+"""Хранилище краткоживущего состояния пользователей (например, ожидающих оценки фото).
+
+memory - в процессе, LRU + TTL;
+sqlite - общий файл, чтобы несколько процессов бота с одним токеном видели одно состояние
+(LRU по touched_at, который обновляют и запись, и чтение).
+"""
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from app.config import StateConfig
+
+logger = logging.getLogger(__name__)
+
+# Примерные накладные расходы на запись в памяти: узел OrderedDict, кортеж, float, int-ключ
+_ENTRY_OVERHEAD_BYTES = 200
+
+
+def _value_size(value) -> int:
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+class StateStore(ABC):
+    """Интерфейс хранилища: значения должны сериализоваться в JSON"""
+
+    @abstractmethod
+    async def get(self, key):
+        ...
+
+    @abstractmethod
+    async def set(self, key, value):
+        ...
+
+    @abstractmethod
+    async def pop(self, key):
+        ...
+
+    @abstractmethod
+    async def purge_expired(self) -> int:
+        ...
+
+    @abstractmethod
+    async def stats(self) -> dict:
+        ...
+
+    async def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """In-memory LRU с TTL и учетом занимаемой памяти"""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, size, value), порядок - по давности обращения
+        self._expiry = OrderedDict()  # key -> expires_at, порядок - по времени записи
+        self.memory_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        del self._expiry[key]
+        self.memory_bytes -= size
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry[2]
+
+    async def set(self, key, value):
+        if key in self._entries:
+            self._drop(key)
+        size = _ENTRY_OVERHEAD_BYTES + _value_size(value)
+        expires_at = time.monotonic() + self.ttl
+        self._entries[key] = (expires_at, size, value)
+        self._expiry[key] = expires_at
+        self.memory_bytes += size
+
+        await self.purge_expired()
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    async def pop(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._drop(key)
+        return entry[2] if entry[0] > time.monotonic() else None
+
+    async def purge_expired(self) -> int:
+        now = time.monotonic()
+        purged = 0
+        # TTL у всех одинаковый, поэтому в _expiry самые старые записи - в начале
+        while self._expiry:
+            key, expires_at = next(iter(self._expiry.items()))
+            if expires_at > now:
+                break
+            self._drop(key)
+            purged += 1
+        self.expirations += purged
+        return purged
+
+    async def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "memory_bytes": self.memory_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteStateStore(StateStore):
+    """Общее для нескольких процессов хранилище в SQLite (WAL).
+
+    Операции короткие, поэтому выполняются в пуле потоков на одном соединении.
+    """
+
+    def __init__(self, path: str, namespace: str, ttl: float, max_entries: int):
+        self.path = path
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state_store ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " touched_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_state_store_touched ON state_store (namespace, touched_at)")
+
+    def _run(self, fn, *args):
+        with self._lock:
+            return fn(*args)
+
+    def _get(self, key):
+        # Чтение обновляет touched_at - ограничение max_entries вытесняет давно не использованные записи
+        now = time.time()
+        row = self._conn.execute(
+            "UPDATE state_store SET touched_at = ? WHERE namespace = ? AND key = ? AND expires_at > ? RETURNING value",
+            (now, self.namespace, str(key), now),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key, value):
+        encoded = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state_store (namespace, key, value, size, expires_at, touched_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.namespace, str(key), encoded, len(encoded.encode("utf-8")), now + self.ttl, now),
+            )
+            self._conn.execute("DELETE FROM state_store WHERE namespace = ? AND expires_at <= ?", (self.namespace, now))
+            # LRU-ограничение: удаляем самые давно обновленные записи сверх лимита
+            self._conn.execute(
+                "DELETE FROM state_store WHERE namespace = ? AND key IN ("
+                " SELECT key FROM state_store WHERE namespace = ?"
+                " ORDER BY touched_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries),
+            )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def _pop(self, key):
+        row = self._conn.execute(
+            "DELETE FROM state_store WHERE namespace = ? AND key = ? RETURNING value, expires_at",
+            (self.namespace, str(key)),
+        ).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def _purge(self):
+        cursor = self._conn.execute(
+            "DELETE FROM state_store WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time())
+        )
+        return cursor.rowcount
+
+    def _stats(self):
+        entries, memory_bytes = self._conn.execute(
+            "SELECT count(*), coalesce(sum(size), 0) FROM state_store WHERE namespace = ? AND expires_at > ?",
+            (self.namespace, time.time()),
+        ).fetchone()
+        return {"backend": "sqlite", "entries": entries, "memory_bytes": memory_bytes}
+
+    async def get(self, key):
+        return await asyncio.to_thread(self._run, self._get, key)
+
+    async def set(self, key, value):
+        await asyncio.to_thread(self._run, self._set, key, value)
+
+    async def pop(self, key):
+        return await asyncio.to_thread(self._run, self._pop, key)
+
+    async def purge_expired(self) -> int:
+        return await asyncio.to_thread(self._run, self._purge)
+
+    async def stats(self) -> dict:
+        return await asyncio.to_thread(self._run, self._stats)
+
+    async def close(self):
+        self._run(self._conn.close)
+
+
+def create_state_store(namespace: str, ttl: float, max_entries: int) -> StateStore:
+    """Создает хранилище по StateConfig.BACKEND"""
+    if StateConfig.BACKEND == "sqlite":
+        logger.info(f"🗂 State store '{namespace}': sqlite ({StateConfig.SQLITE_PATH})")
+        return SQLiteStateStore(StateConfig.SQLITE_PATH, namespace, ttl, max_entries)
+    return MemoryStateStore(ttl, max_entries)
+
+
+# Фото, загруженные пользователями и ожидающие нажатия "Оценить этого котика"
+pending_photos = create_state_store("pending_photos", StateConfig.PENDING_PHOTO_TTL, StateConfig.PENDING_PHOTO_MAX)
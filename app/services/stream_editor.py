@@ -0,0 +1,82 @@
+# app/services/stream_editor.py
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Курсор в конце незавершенного текста
+STREAM_CURSOR = " ▌"
+
+
+class StreamingMessageEditor:
+    """Постепенно редактирует одно сообщение по мере прихода текста.
+
+    update() только запоминает последний текст - правки отправляет отдельная задача,
+    поэтому чтение потока OpenAI никогда не ждет Telegram. Правки не чаще
+    min_interval секунд (лимиты Telegram на editMessageText), промежуточные
+    тексты схлопываются до последнего, одинаковый текст повторно не отправляется.
+    """
+
+    def __init__(self, message, min_interval: float):
+        self.message = message
+        self.min_interval = min_interval
+        self._last_edit_at = 0.0
+        self._last_text = None
+        self._pending_text = None
+        self._pump = None
+        self._editing = False
+        self.edits = 0
+
+    async def _edit(self, text: str) -> bool:
+        if text == self._last_text:
+            return True
+        try:
+            await self.message.edit_text(text)
+        except Exception as e:
+            logger.debug(f"Stream edit failed: {e}")
+            return False
+        self._last_text = text
+        self._last_edit_at = time.monotonic()
+        self.edits += 1
+        return True
+
+    async def _run(self):
+        while self._pending_text is not None:
+            delay = self.min_interval - (time.monotonic() - self._last_edit_at)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self._pending_text is None:
+                break
+            text, self._pending_text = self._pending_text, None
+            self._editing = True
+            try:
+                await self._edit(text + STREAM_CURSOR)
+            finally:
+                self._editing = False
+
+    async def update(self, partial_text: str):
+        """Частичный текст: запоминаем и при необходимости запускаем задачу правок"""
+        self._pending_text = partial_text
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Прекращает частичные правки. Идущая правка дожидается, чтобы не обогнать финальную"""
+        self._pending_text = None
+        pump, self._pump = self._pump, None
+        if pump is None or pump.done():
+            return
+        if not self._editing:
+            # Задача ждет троттлинга - просто отменяем
+            pump.cancel()
+        try:
+            await pump
+        except asyncio.CancelledError:
+            pass
+
+    async def finish(self, final_text: str):
+        """Финальная правка (без троттлинга). Если не вышло - отправляем новым сообщением"""
+        await self.stop()
+        if not await self._edit(final_text):
+            await self.message.answer(final_text)
@@ -0,0 +1,107 @@
+# app/services/usage_ledger.py
+"""Журнал анализов с отложенной записью.
+
+record() только кладет событие в память - на горячем пути нет коммита.
+Фоновая задача сбрасывает накопленное многострочными INSERT раз в flush_interval
+или как только набралось batch_size событий. stop() дописывает остаток.
+Если БД недоступна, пачка возвращается в очередь; при переполнении
+очереди новые события отбрасываются (и считаются в метрике).
+"""
+import asyncio
+import datetime
+import logging
+from collections import deque
+from app.config import UsageLedgerConfig
+from app.services.metrics import usage_events_total
+
+logger = logging.getLogger(__name__)
+
+class UsageLedger:
+    def __init__(self, flush_interval: float, batch_size: int, max_pending: int, write_batch=None):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self._write_batch = write_batch
+        self._pending = deque()
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task = None
+        self.written = 0
+        self.dropped = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def record(self, user_id: int, request_type: str, outcome: str, latency_ms: float,
+               cache_hit: bool = False, prompt_tokens: int = 0, completion_tokens: int = 0):
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            usage_events_total.inc(result="dropped")
+            return
+        self._pending.append({
+            "user_id": user_id,
+            "created_at": datetime.datetime.utcnow(),
+            "request_type": request_type,
+            "outcome": outcome,
+            "latency_ms": int(latency_ms),
+            "cache_hit": cache_hit,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        })
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Дописывает все накопленное и останавливает фоновую задачу"""
+        if self._task is not None:
+            self._closing = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Пишет накопленное пачками по batch_size. Возвращает число записанных событий"""
+        write_batch = self._write_batch
+        if write_batch is None:
+            from app.db.async_database import insert_usage_events
+            write_batch = insert_usage_events
+
+        written = 0
+        while self._pending:
+            batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+            try:
+                await write_batch(batch)
+            except Exception as e:
+                # Вернем в начало очереди - допишем при следующем сбросе
+                self._pending.extendleft(reversed(batch))
+                logger.warning(f"⚠️ Usage ledger flush failed, {len(self._pending)} events pending: {e}")
+                break
+            written += len(batch)
+        if written:
+            self.written += written
+            usage_events_total.inc(written, result="written")
+        return written
+
+
+# Общий экземпляр; None если журнал выключен в конфиге
+usage_ledger = UsageLedger(
+    UsageLedgerConfig.FLUSH_INTERVAL_MS / 1000,
+    UsageLedgerConfig.BATCH_SIZE,
+    UsageLedgerConfig.MAX_PENDING,
+) if UsageLedgerConfig.ENABLED else None
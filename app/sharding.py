@@ -0,0 +1,256 @@
+# app/sharding.py
+"""Шардирование апдейтов по процессам.
+
+Супервизор получает апдейты (long polling) и раскладывает их по N воркерам
+по from_user.id: все апдейты одного пользователя идут в один процесс и
+обрабатываются по порядку, поэтому per-process состояние (ожидающие фото)
+остается согласованным. Админские команды, меняющие чужой баланс, уходят
+в шард целевого пользователя - там живет его снимок в кэше балансов.
+Упавший воркер перезапускается отдельно от остальных.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue as queue_module
+import signal
+import time
+from app.config import BotConfig, MetricsConfig
+from app.services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Поля апдейта, в которых есть from
+_USER_FIELDS = (
+    "message", "edited_message", "callback_query", "pre_checkout_query",
+    "shipping_query", "inline_query", "chosen_inline_result", "my_chat_member",
+    "chat_member", "chat_join_request", "message_reaction", "poll_answer",
+)
+# Не перезапускаем воркер чаще, чем раз в столько секунд
+_RESTART_BACKOFF = 1.0
+
+
+def update_user_id(update: dict):
+    """from_user.id сырого апдейта или None"""
+    for field in _USER_FIELDS:
+        payload = update.get(field)
+        if payload:
+            user = payload.get("from") or payload.get("user")
+            if user:
+                return user["id"]
+    return None
+
+
+# Команды, меняющие баланс другого пользователя: /add_requests <user_id> <количество>
+_FOREIGN_BALANCE_COMMANDS = ("/add_requests",)
+
+
+def balance_owner_id(update: dict):
+    """Чей баланс меняет апдейт: для админских команд - целевой пользователь, иначе отправитель.
+
+    Кэш балансов у каждого воркера свой, поэтому изменение должно выполниться
+    в шарде владельца, иначе у него останется устаревший снимок.
+    """
+    text = (update.get("message") or {}).get("text") or ""
+    command, _, args = text.partition(" ")
+    if command.split("@", 1)[0] in _FOREIGN_BALANCE_COMMANDS:
+        target = args.split(maxsplit=1)[:1]
+        if target and target[0].isdigit():
+            return int(target[0])
+    return update_user_id(update)
+
+
+def shard_for(update: dict, workers: int) -> int:
+    user_id = balance_owner_id(update)
+    key = user_id if user_id is not None else update.get("update_id", 0)
+    return key % workers
+
+
+class ShardWorker:
+    """Обработка апдейтов одного шарда: разные пользователи параллельно, один пользователь - по порядку"""
+
+    def __init__(self, dispatcher, bot, updates_queue, shard_index: int = 0):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.queue = updates_queue
+        self.shard_index = shard_index
+        self._tails = {}  # user_id -> задача последнего апдейта пользователя
+        self.processed = 0
+
+    async def _process(self, update: dict, previous):
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await self.dispatcher.feed_raw_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"❌ Shard {self.shard_index}: update {update.get('update_id')} failed: {e}")
+        finally:
+            self.processed += 1
+
+    def submit(self, update: dict) -> asyncio.Task:
+        user_id = update_user_id(update)
+        task = asyncio.create_task(self._process(update, self._tails.get(user_id)))
+        if user_id is not None:
+            self._tails[user_id] = task
+            task.add_done_callback(lambda done, uid=user_id: self._forget(uid, done))
+        return task
+
+    def _forget(self, user_id, task):
+        if self._tails.get(user_id) is task:
+            del self._tails[user_id]
+
+    async def run(self):
+        """Читает очередь до сентинела None и дожидается начатых апдейтов"""
+        pending = set()
+        while True:
+            update = await asyncio.to_thread(self.queue.get)
+            if update is None:
+                break
+            task = self.submit(update)
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.wait(pending)
+
+
+def _worker_main(shard_index: int, updates_queue):
+    # Останавливается по сентинелу от супервизора, а не по Ctrl+C всей группы
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from app.dispatcher import bot, dp
+
+    async def serve():
+        await dp.emit_startup(bot=bot, dispatcher=dp, shard_index=shard_index)
+        try:
+            await ShardWorker(dp, bot, updates_queue, shard_index).run()
+        finally:
+            await dp.emit_shutdown(bot=bot, dispatcher=dp, shard_index=shard_index)
+            await bot.session.close()
+
+    logger.info(f"🚀 Shard worker {shard_index} started (pid {os.getpid()})")
+    asyncio.run(serve())
+
+
+class ShardSupervisor:
+    def __init__(self, workers: int, queue_size: int = 0):
+        self.workers = workers
+        self._context = multiprocessing.get_context("spawn")
+        # Очереди живут в супервизоре и переживают перезапуск воркера
+        self.queues = [self._context.Queue(queue_size) for _ in range(workers)]
+        self.processes = [None] * workers
+        self._started_at = [0.0] * workers
+        self.restarts = 0
+        self.backpressure_waits = 0
+
+    def _start(self, index: int):
+        process = self._context.Process(
+            target=_worker_main, args=(index, self.queues[index]), name=f"shard-worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        self._started_at[index] = time.monotonic()
+
+    def start(self):
+        for index in range(self.workers):
+            self._start(index)
+
+    def check_workers(self):
+        """Перезапускает упавшие воркеры"""
+        for index, process in enumerate(self.processes):
+            if process.is_alive():
+                continue
+            if time.monotonic() - self._started_at[index] < _RESTART_BACKOFF:
+                continue
+            logger.error(f"💥 Shard worker {index} exited with code {process.exitcode}, restarting")
+            self.restarts += 1
+            self._start(index)
+
+    def dispatch(self, update: dict) -> bool:
+        """Кладет апдейт в очередь шарда без ожидания. False - очередь полна, апдейт не принят"""
+        try:
+            self.queues[shard_for(update, self.workers)].put_nowait(update)
+        except queue_module.Full:
+            return False
+        return True
+
+    async def dispatch_with_backpressure(self, update: dict, retry_interval: float = 0.05):
+        """Ждет места в очереди шарда, не блокируя event loop. Апдейты не отбрасываются никогда"""
+        if self.dispatch(update):
+            return
+        shard = shard_for(update, self.workers)
+        self.backpressure_waits += 1
+        metrics.shard_backpressure_total.inc(shard=shard)
+        logger.warning(f"⚠️ Shard {shard} queue is full, holding getUpdates until it drains")
+        started = time.monotonic()
+        while not self.dispatch(update):
+            await asyncio.sleep(retry_interval)
+        logger.info(f"✅ Shard {shard} queue drained after {time.monotonic() - started:.1f}s")
+
+    def stop(self, timeout: float = 10.0):
+        """Сентинел каждому воркеру, ожидание до timeout, затем terminate. Не зависает на полной очереди"""
+        deadline = time.monotonic() + timeout
+        for updates_queue in self.queues:
+            try:
+                updates_queue.put(None, timeout=max(0.0, min(1.0, deadline - time.monotonic())))
+            except queue_module.Full:
+                logger.warning("⚠️ Shard queue is full, worker will be terminated")
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                # Непрочитанные апдейты в очереди не должны держать выход супервизора
+                self.queues[index].cancel_join_thread()
+
+
+async def _watch_workers(supervisor: ShardSupervisor, interval: float):
+    """Проверка воркеров по своему таймеру: long polling может висеть до POLLING_TIMEOUT"""
+    while True:
+        supervisor.check_workers()
+        await asyncio.sleep(interval)
+
+
+async def _poll(supervisor: ShardSupervisor, bot, allowed_updates):
+    offset = None
+    watcher = asyncio.create_task(_watch_workers(supervisor, BotConfig.SHARD_CHECK_INTERVAL))
+    metrics_runner = None
+    if MetricsConfig.ENABLED:
+        # Воркеры занимают PORT..PORT+N-1, супервизор - следующий
+        try:
+            metrics_runner = await metrics.start_metrics_server(MetricsConfig.HOST, MetricsConfig.PORT + supervisor.workers)
+        except OSError as e:
+            logger.warning(f"⚠️ Metrics server not started: {e}")
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=BotConfig.POLLING_TIMEOUT, allowed_updates=allowed_updates)
+            except Exception as e:
+                logger.error(f"❌ getUpdates failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            # offset сдвигается только после того, как апдейт принят очередью шарда:
+            # пока очередь полна, getUpdates не вызывается и Telegram хранит остальные апдейты
+            for update in updates:
+                await supervisor.dispatch_with_backpressure(
+                    update.model_dump(mode="json", by_alias=True, exclude_none=True)
+                )
+                offset = update.update_id + 1
+    finally:
+        watcher.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await bot.session.close()
+
+
+def run_sharded(workers: int):
+    from app.dispatcher import bot, dp
+
+    supervisor = ShardSupervisor(workers, BotConfig.SHARD_QUEUE_SIZE)
+    supervisor.start()
+    logger.info(f"🧩 Sharded mode: {workers} workers")
+    try:
+        asyncio.run(_poll(supervisor, bot, dp.resolve_used_update_types()))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.stop()
@@ -0,0 +1,86 @@
+# app/webhook.py
+"""Прием апдейтов через webhook (aiohttp) - альтернатива dp.start_polling.
+
+Несколько воркеров слушают один порт через SO_REUSEPORT, ядро раскидывает
+соединения между ними. Webhook в Telegram регистрирует только воркер 0.
+"""
+import logging
+import multiprocessing
+from aiohttp import web
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from app.config import WebhookConfig, StateConfig
+
+logger = logging.getLogger(__name__)
+
+
+def build_webhook_app(dispatcher, bot, path: str = None, secret_token: str = None, **workflow_data) -> web.Application:
+    """aiohttp-приложение, которое передает апдейты в dispatcher"""
+    app = web.Application()
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=secret_token or None,
+    ).register(app, path=path or WebhookConfig.PATH)
+    setup_application(app, dispatcher, bot=bot, **workflow_data)
+    return app
+
+
+async def register_webhook(bot, dispatcher):
+    """Сообщает Telegram адрес webhook (startup-хук воркера 0)"""
+    url = WebhookConfig.BASE_URL.rstrip("/") + WebhookConfig.PATH
+    await bot.set_webhook(
+        url,
+        secret_token=WebhookConfig.SECRET or None,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+    )
+    logger.info(f"🌐 Webhook set to {url}")
+
+
+def check_workers_config(workers: int):
+    """Несколько воркеров получают апдейты одного пользователя вперемешку - состояние должно быть общим"""
+    if workers > 1 and StateConfig.BACKEND != "sqlite":
+        raise RuntimeError(
+            f"WEBHOOK_WORKERS={workers} requires STATE_STORE_BACKEND=sqlite, got {StateConfig.BACKEND!r}"
+        )
+
+
+def serve_worker(worker_index: int, workers: int = 1):
+    """Точка входа процесса-воркера"""
+    from app.dispatcher import bot, dp
+    from app.db.balance_cache import balance_cache
+
+    if workers > 1:
+        # Баланс меняют и соседние воркеры - локальный снимок мог бы устареть
+        balance_cache.disable()
+
+    if worker_index == 0 and WebhookConfig.BASE_URL:
+        dp.startup.register(register_webhook)
+
+    app = build_webhook_app(dp, bot, WebhookConfig.PATH, WebhookConfig.SECRET, shard_index=worker_index)
+    logger.info(f"🚀 Webhook worker {worker_index} on {WebhookConfig.HOST}:{WebhookConfig.PORT}{WebhookConfig.PATH}")
+    web.run_app(app, host=WebhookConfig.HOST, port=WebhookConfig.PORT, reuse_port=workers > 1, print=None)
+
+
+def run_webhook(workers: int = 1):
+    check_workers_config(workers)
+    if not WebhookConfig.BASE_URL:
+        logger.warning("WEBHOOK_BASE_URL is not set - webhook will not be registered in Telegram")
+
+    if workers <= 1:
+        serve_worker(0)
+        return
+
+    # spawn: у каждого воркера свои соединения с БД и event loop
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=serve_worker, args=(index, workers), name=f"webhook-worker-{index}")
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
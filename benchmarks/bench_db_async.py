@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# benchmarks/bench_db_async.py
+"""Сравнение пропускной способности sync и async слоя БД при конкурентных пользователях.
+
+Запуск: python -m benchmarks.bench_db_async [--users 1 10 50 100] [--updates 20]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Временная БД - задаем ДО импорта app.*
+_tmp_dir = tempfile.mkdtemp(prefix="cat_bot_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import RequestConfig  # noqa: E402
+from app.db import database as sync_db  # noqa: E402
+from app.db import async_database as async_db  # noqa: E402
+from app.db.models import Base  # noqa: E402
+
+
+async def _lag_probe(stop: asyncio.Event, samples: list):
+    """Меряет задержку event loop - насколько позже просыпается sleep(0.005)"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(0.005)
+        samples.append(loop.time() - started - 0.005)
+
+
+async def _sync_update(user_id: int):
+    """Апдейт как раньше: блокирующие вызовы прямо в корутине"""
+    user = sync_db.get_user(user_id)
+    if user.free_requests > 0:
+        sync_db.use_free_request(user_id)
+    else:
+        sync_db.add_paid_requests(user_id, 1)
+    await asyncio.sleep(0)
+
+
+async def _async_update(user_id: int):
+    """Тот же апдейт через async слой"""
+    user = await async_db.get_user(user_id)
+    if user.free_requests > 0:
+        await async_db.use_free_request(user_id)
+    else:
+        await async_db.add_paid_requests(user_id, 1)
+
+
+async def run_case(update, users: int, updates: int):
+    stop = asyncio.Event()
+    lag = []
+    probe = asyncio.create_task(_lag_probe(stop, lag))
+
+    async def user_loop(user_id: int):
+        for _ in range(updates):
+            await update(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(1_000_000 + i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe
+    lag.sort()
+    max_lag = lag[-1] * 1000 if lag else 0.0
+    return users * updates / elapsed, max_lag
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--updates", type=int, default=20)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=sync_db.engine)
+    RequestConfig.FREE_REQUESTS_DAILY = args.updates // 2
+
+    print(f"{'users':>6} | {'sync upd/s':>11} | {'sync max lag':>13} | {'async upd/s':>12} | {'async max lag':>14}")
+    print("-" * 70)
+    for users in args.users:
+        sync_rate, sync_lag = await run_case(_sync_update, users, args.updates)
+        async_rate, async_lag = await run_case(_async_update, users, args.updates)
+        print(f"{users:>6} | {sync_rate:>11.1f} | {sync_lag:>10.1f} ms | {async_rate:>12.1f} | {async_lag:>11.1f} ms")
+
+    await async_db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# benchmarks/bench_db_contention.py
+"""Конкурентные списания квоты и чтения баланса под разными профилями БД.
+
+Писатели крутят reserve_request, читатели - get_user (всегда из БД, мимо кэша).
+Для каждого профиля - своя свежая SQLite БД; PostgreSQL - если передан --postgres-url.
+
+Запуск: python -m benchmarks.bench_db_contention [--writers 8] [--readers 32] [--seconds 5]
+        [--postgres-url postgresql+asyncpg://...]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+# Временная БД - задаем ДО импорта app.*
+_tmp_dir = tempfile.mkdtemp(prefix="cat_bot_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker  # noqa: E402
+from app.config import RequestConfig  # noqa: E402
+from app.db import async_database as async_db  # noqa: E402
+from app.db.migrations import migrate  # noqa: E402
+from app.db.profiles import POSTGRES, SQLITE_LEGACY, SQLITE_WAL, create_async_engine_for, create_sync_engine  # noqa: E402
+
+USERS = 200
+
+
+def _percentile(samples: list, fraction: float) -> float:
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def _prepare(sync_url: str, profile: str):
+    engine = create_sync_engine(sync_url, profile)
+    migrate(engine)
+    engine.dispose()
+
+
+async def run_profile(profile: str, sync_url: str, writers: int, readers: int, seconds: float) -> dict:
+    _prepare(sync_url, profile)
+    engine = create_async_engine_for(async_db.to_async_url(sync_url), profile)
+    # Хелперы async_database берут сессию из модуля - подменяем на движок профиля
+    async_db.async_engine = engine
+    async_db.AsyncSessionLocal = async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+
+    for user_id in range(1, USERS + 1):
+        await async_db.get_user(user_id)
+
+    stats = {"writes": 0, "reads": 0, "errors": 0, "write_ms": [], "read_ms": []}
+    deadline = time.perf_counter() + seconds
+
+    async def worker(kind: str, index: int):
+        user_id = index
+        while time.perf_counter() < deadline:
+            user_id = user_id % USERS + 1
+            started = time.perf_counter()
+            try:
+                if kind == "write":
+                    await async_db.reserve_request(user_id)
+                else:
+                    await async_db.get_user(user_id)
+            except Exception:
+                stats["errors"] += 1
+                continue
+            stats[f"{kind}_ms"].append((time.perf_counter() - started) * 1000)
+            stats[f"{kind}s"] += 1
+
+    await asyncio.gather(
+        *(worker("write", index) for index in range(writers)),
+        *(worker("read", index) for index in range(readers)),
+    )
+    await engine.dispose()
+    return stats
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--postgres-url", default="", help="sync URL PostgreSQL, например postgresql://user@host/db")
+    args = parser.parse_args()
+
+    # Квоты хватает на весь прогон - меряем только конкуренцию
+    RequestConfig.FREE_REQUESTS_DAILY = 10 ** 9
+
+    cases = [
+        (SQLITE_LEGACY, f"sqlite:///{os.path.join(_tmp_dir, 'legacy.db')}"),
+        (SQLITE_WAL, f"sqlite:///{os.path.join(_tmp_dir, 'wal.db')}"),
+    ]
+    if args.postgres_url:
+        cases.append((POSTGRES, args.postgres_url))
+
+    print(f"writers={args.writers} readers={args.readers} seconds={args.seconds}")
+    print(f"{'profile':>14} | {'writes/s':>9} | {'write p99':>10} | {'reads/s':>8} | {'read p99':>9} | {'errors':>6}")
+    print("-" * 72)
+    for profile, url in cases:
+        stats = await run_profile(profile, url, args.writers, args.readers, args.seconds)
+        print(
+            f"{profile:>14} | {stats['writes'] / args.seconds:>9.1f} | "
+            f"{_percentile(stats['write_ms'], 0.99):>7.1f} ms | {stats['reads'] / args.seconds:>8.1f} | "
+            f"{_percentile(stats['read_ms'], 0.99):>6.1f} ms | {stats['errors']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
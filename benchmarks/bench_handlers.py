@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# benchmarks/bench_handlers.py
+"""Бенчмарк хендлеров: синтетические апдейты через настоящие роутеры.
+
+Bot работает с подменной сессией (ответы Bot API без сети), анализатор заменен
+заглушкой, БД - временная SQLite. Для каждого сценария печатает ops/s и p50/p95/p99.
+Запуск: python -m benchmarks.bench_handlers [--users 20] [--ops 200] [--api-latency 0] [--analyzer-latency 0.05]
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Временная БД - задаем ДО импорта app.*
+_tmp_dir = tempfile.mkdtemp(prefix="cat_bot_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench")
+os.environ.setdefault("RESULT_CACHE_PATH", os.path.join(_tmp_dir, "analysis_cache.db"))
+os.environ.setdefault("STATE_STORE_PATH", os.path.join(_tmp_dir, "bot_state.db"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.types import File, Message, Update  # noqa: E402
+from app.config import RequestConfig  # noqa: E402
+from app.dispatcher import bot, dp  # noqa: E402
+from app.db import async_database as async_db  # noqa: E402
+from app.db.database import engine  # noqa: E402
+from app.db.models import Base  # noqa: E402
+from app.handlers import basic  # noqa: E402
+from app.services.image_pipeline import shutdown_pipeline  # noqa: E402
+from app.services.openai_analyzer import AnalysisResult  # noqa: E402
+from app.services.payment_service import make_invoice_payload  # noqa: E402
+from app.services.pricing import pricing_registry  # noqa: E402
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+_MESSAGE_METHODS = {"sendMessage", "editMessageText", "sendInvoice", "sendPhoto"}
+
+
+def _make_jpeg() -> bytes:
+    if Image is None:
+        return b"\xff\xd8\xff" + os.urandom(200_000)
+    buffer = io.BytesIO()
+    Image.new("RGB", (1280, 960), (180, 120, 90)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class FakeBotSession(BaseSession):
+    """Сессия Bot API без сети: отвечает правдоподобными объектами"""
+
+    def __init__(self, photo: bytes, latency: float = 0.0):
+        super().__init__()
+        self.photo = photo
+        self.latency = latency
+        self.calls = 0
+        self._message_ids = itertools.count(1)
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        name = method.__api_method__
+        if name in _MESSAGE_METHODS:
+            chat_id = getattr(method, "chat_id", 0) or 0
+            return Message.model_validate(
+                {
+                    "message_id": next(self._message_ids),
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "text": getattr(method, "text", None) or "",
+                },
+                context={"bot": bot},
+            )
+        if name == "getFile":
+            return File(file_id=method.file_id, file_unique_id=method.file_id, file_path=f"photos/{method.file_id}.jpg")
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        for offset in range(0, len(self.photo), chunk_size):
+            yield self.photo[offset:offset + chunk_size]
+
+    async def close(self):
+        pass
+
+
+def _stub_analyzer(latency: float):
+    async def analyze_cat_image(image_data: bytes, on_partial=None) -> AnalysisResult:
+        await asyncio.sleep(latency)
+        if on_partial is not None:
+            await on_partial("Пушистый котик")
+        return AnalysisResult.success("Пушистый котик, 10/10 🐱")
+    return analyze_cat_image
+
+
+# ----------------- Синтетические апдейты -----------------
+_update_ids = itertools.count(1)
+
+
+def _message(user_id: int, **fields) -> Update:
+    update_id = next(_update_ids)
+    data = {
+        "message_id": update_id,
+        "date": datetime.now(),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+    }
+    data.update(fields)
+    return Update.model_validate({"update_id": update_id, "message": data}, context={"bot": bot})
+
+
+def photo_update(user_id: int) -> Update:
+    unique = f"ph{next(_update_ids)}"
+    sizes = [
+        {"file_id": f"{unique}_{side}", "file_unique_id": f"{unique}_{side}", "width": side, "height": side * 3 // 4}
+        for side in (90, 320, 800, 1280)
+    ]
+    return _message(user_id, photo=sizes)
+
+
+def text_update(user_id: int, text: str) -> Update:
+    fields = {"text": text}
+    if text.startswith("/"):
+        fields["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return _message(user_id, **fields)
+
+
+def payment_update(user_id: int) -> Update:
+    stars, requests = next(iter(pricing_registry.current.pricing.items()))
+    payment = {
+        "currency": "XTR",
+        "total_amount": stars,
+        "invoice_payload": make_invoice_payload(stars, user_id, requests),
+        "telegram_payment_charge_id": f"tg_{next(_update_ids)}",
+        "provider_payment_charge_id": "",
+    }
+    return _message(user_id, successful_payment=payment)
+
+
+async def _prepare_rate(user_id: int):
+    # Оценка требует сохраненного фото - загрузка не входит в замер
+    await dp.feed_update(bot, photo_update(user_id))
+
+
+SCENARIOS = [
+    # (название, апдейт, подготовка перед замером)
+    ("photo_upload", photo_update, None),
+    ("rate_cat", lambda user_id: text_update(user_id, "Оценить этого котика"), _prepare_rate),
+    ("balance", lambda user_id: text_update(user_id, "/balance"), None),
+    ("replenish", lambda user_id: text_update(user_id, "/replenish"), None),
+    ("promo_text", lambda user_id: text_update(user_id, "X" * RequestConfig.PROMO_CODE_LENGTH), None),
+    ("successful_payment", payment_update, None),
+]
+
+
+def _percentile(quantiles, p: int) -> float:
+    return quantiles[p - 1] * 1000
+
+
+async def run_scenario(make_update, prepare, users: int, ops: int):
+    latencies = []
+    per_user = max(1, ops // users)
+
+    async def user_loop(user_id: int):
+        for _ in range(per_user):
+            if prepare is not None:
+                await prepare(user_id)
+            update = make_update(user_id)
+            started = time.perf_counter()
+            await dp.feed_update(bot, update)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user_loop(1_000_000 + index) for index in range(users)))
+    elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--ops", type=int, default=200, help="апдейтов на сценарий")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, сек")
+    parser.add_argument("--analyzer-latency", type=float, default=0.05, help="задержка заглушки анализатора, сек")
+    parser.add_argument("--only", nargs="*", help="запустить только эти сценарии")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    bot.session = FakeBotSession(_make_jpeg(), args.api_latency)
+    basic.analyze_cat_image = _stub_analyzer(args.analyzer_latency)
+
+    # У всех пользователей достаточно запросов, чтобы rate_cat не упирался в лимит
+    for index in range(args.users):
+        await async_db.add_paid_requests(1_000_000 + index, args.ops)
+
+    print(f"\n{'scenario':>20} | {'ops':>5} | {'ops/s':>8} | {'p50 ms':>7} | {'p95 ms':>7} | {'p99 ms':>7}")
+    print("-" * 70)
+    for name, make_update, prepare in SCENARIOS:
+        if args.only and name not in args.only:
+            continue
+        latencies, elapsed = await run_scenario(make_update, prepare, args.users, args.ops)
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        print(
+            f"{name:>20} | {len(latencies):>5} | {len(latencies) / elapsed:>8.1f} | "
+            f"{_percentile(quantiles, 50):>7.2f} | {_percentile(quantiles, 95):>7.2f} | {_percentile(quantiles, 99):>7.2f}"
+        )
+
+    shutdown_pipeline()
+    await async_db.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
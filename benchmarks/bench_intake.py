@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# benchmarks/bench_intake.py
+"""Сравнение пропускной способности приема апдейтов: long polling vs webhook.
+
+Бот из app.main работает против локальной заглушки Bot API (benchmarks/fake_telegram.py).
+Запуск: python -m benchmarks.bench_intake [--updates 2000] [--users 200] [--latency 0.005]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+_tmp_dir = tempfile.mkdtemp(prefix="cat_bot_bench_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ["TELEGRAM_BOT_TOKEN"] = "123456:BENCH"
+os.environ.setdefault("RESULT_CACHE_PATH", "")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp  # noqa: E402
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramAPI, make_text_update  # noqa: E402
+from app.dispatcher import dp  # noqa: E402
+from app.main import prepare_database  # noqa: E402
+from app.webhook import build_webhook_app  # noqa: E402
+from app.db.async_database import async_engine  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+TOKEN = os.environ["TELEGRAM_BOT_TOKEN"]
+TEXTS = ["/start", "/balance", "котик?"]
+
+
+class CompletionCounter:
+    """Outer-middleware: считает полностью обработанные апдейты"""
+
+    def __init__(self):
+        self.target = 0
+        self.done = 0
+        self.event = asyncio.Event()
+
+    def reset(self, target: int):
+        self.target, self.done = target, 0
+        self.event = asyncio.Event()
+
+    async def __call__(self, handler, event, data):
+        try:
+            return await handler(event, data)
+        finally:
+            self.done += 1
+            if self.done >= self.target:
+                self.event.set()
+
+
+def make_updates(api: FakeTelegramAPI, count: int, users: int):
+    return [
+        make_text_update(api.next_update_id(), 1_000_000 + i % users, TEXTS[i % len(TEXTS)])
+        for i in range(count)
+    ]
+
+
+async def bench_polling(counter, count: int, users: int, latency: float) -> float:
+    api = FakeTelegramAPI(TOKEN, latency)
+    base_url = await api.start()
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+    for update in make_updates(api, count, users):
+        api.add_update(update)
+
+    counter.reset(count)
+    started = time.perf_counter()
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+    await counter.event.wait()
+    elapsed = time.perf_counter() - started
+
+    await dp.stop_polling()
+    await polling
+    await bot.session.close()
+    await api.stop()
+    return count / elapsed
+
+
+async def bench_webhook(counter, count: int, users: int, latency: float, concurrency: int) -> float:
+    api = FakeTelegramAPI(TOKEN, latency)
+    base_url = await api.start()
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+
+    runner = web.AppRunner(build_webhook_app(dp, bot, "/webhook", "bench-secret"), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    url = f"http://127.0.0.1:{port}/webhook"
+
+    updates = make_updates(api, count, users)
+    counter.reset(count)
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"X-Telegram-Bot-Api-Secret-Token": "bench-secret"}
+
+    async with aiohttp.ClientSession() as client:
+        async def post(update):
+            async with semaphore:
+                async with client.post(url, json=update, headers=headers) as response:
+                    await response.read()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in updates))
+        await counter.event.wait()
+        elapsed = time.perf_counter() - started
+
+    await runner.cleanup()
+    await bot.session.close()
+    await api.stop()
+    return count / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="задержка ответа Bot API, сек")
+    parser.add_argument("--concurrency", type=int, default=50, help="параллельных POST в webhook")
+    args = parser.parse_args()
+
+    prepare_database()
+    counter = CompletionCounter()
+    dp.update.outer_middleware(counter)
+
+    polling_rate = await bench_polling(counter, args.updates, args.users, args.latency)
+    webhook_rate = await bench_webhook(counter, args.updates, args.users, args.latency, args.concurrency)
+    await async_engine.dispose()
+
+    print(f"\n{'mode':>8} | {'updates/s':>10}")
+    print("-" * 22)
+    print(f"{'polling':>8} | {polling_rate:>10.1f}")
+    print(f"{'webhook':>8} | {webhook_rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
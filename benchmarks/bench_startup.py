@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# benchmarks/bench_startup.py
+"""Время старта бота по шагам, каждый замер - в отдельном процессе.
+
+import      - импорт app.dispatcher (роутеры, сервисы, конфиг)
+db cold     - prepare_database() на пустой БД
+db warm     - prepare_database() на уже подготовленной БД (обычный рестарт)
+boot        - от запуска `python -m app.main` до первого getUpdates (заглушка Bot API, БД теплая)
+Запуск: python -m benchmarks.bench_startup [--runs 5]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_telegram import FakeTelegramAPI  # noqa: E402
+
+TOKEN = "123456:STARTUP"
+
+_IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app.dispatcher; "
+    "print(time.perf_counter() - started)"
+)
+_PREPARE_SNIPPET = (
+    "import time; from app.main import prepare_database; started = time.perf_counter(); "
+    "prepare_database(); print(time.perf_counter() - started)"
+)
+
+
+def _env(db_path: str, **extra) -> dict:
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        DATABASE_URL=f"sqlite:///{db_path}",
+        RESULT_CACHE_PATH="",
+        STATE_STORE_BACKEND="memory",
+        METRICS_ENABLED="0",
+    )
+    env.update(extra)
+    return env
+
+
+def _measure_snippet(snippet: str, env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", snippet], env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+async def _measure_boot(db_path: str) -> float:
+    api = FakeTelegramAPI(TOKEN)
+    api_url = await api.start()
+    started = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-m", "app.main",
+        env=_env(db_path, TELEGRAM_API_URL=api_url), cwd=ROOT,
+        stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        while api.calls["getUpdates"] == 0:
+            if process.returncode is not None:
+                raise RuntimeError(f"bot exited with code {process.returncode}")
+            await asyncio.sleep(0.01)
+        return time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.wait_for(process.wait(), 15)
+        except asyncio.TimeoutError:
+            process.kill()
+        await api.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="cat_bot_startup_")
+    warm_db = os.path.join(tmp_dir, "warm.db")
+    _measure_snippet(_PREPARE_SNIPPET, _env(warm_db))  # подготовка теплой БД
+
+    results = {"import": [], "db cold": [], "db warm": [], "boot": []}
+    for run in range(args.runs):
+        results["import"].append(_measure_snippet(_IMPORT_SNIPPET, _env(warm_db)))
+        cold_db = os.path.join(tmp_dir, f"cold_{run}.db")
+        results["db cold"].append(_measure_snippet(_PREPARE_SNIPPET, _env(cold_db)))
+        results["db warm"].append(_measure_snippet(_PREPARE_SNIPPET, _env(warm_db)))
+        results["boot"].append(asyncio.run(_measure_boot(warm_db)))
+
+    print(f"\n{'step':>8} | {'median ms':>9} | {'min ms':>8} | {'max ms':>8}")
+    print("-" * 44)
+    for step, samples in results.items():
+        print(
+            f"{step:>8} | {statistics.median(samples) * 1000:>9.1f} | "
+            f"{min(samples) * 1000:>8.1f} | {max(samples) * 1000:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# benchmarks/fake_openai.py
+"""Локальная заглушка OpenAI chat completions на aiohttp.
+
+Поддерживает обычный и потоковый (SSE) ответ, задержку и долю ошибок (429/500).
+Бот направляется сюда через OPENAI_BASE_URL.
+"""
+import asyncio
+import json
+import random
+import time
+from aiohttp import web
+
+ANSWER = (
+    "Оценка котика: 9/10 🐱\n"
+    "Пушистость на высоте, взгляд уверенный, поза - классическая буханка. "
+    "Снимаю балл только за то, что котик не смотрит в камеру."
+)
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float = 0.5, error_rate: float = 0.0, chunks: int = 8):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.chunks = chunks
+        self.requests = 0
+        self.errors = 0
+        self._runner = None
+        self.app = web.Application(client_max_size=32 * 1024 * 1024)
+        self.app.router.add_post("/v1/chat/completions", self._completions)
+
+    @staticmethod
+    def _usage():
+        return {"prompt_tokens": 850, "completion_tokens": 60, "total_tokens": 910}
+
+    async def _completions(self, request: web.Request):
+        self.requests += 1
+        payload = await request.json()
+        model = payload.get("model", "gpt-4o-mini")
+
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            status = random.choice((429, 500))
+            await asyncio.sleep(self.latency * 0.1)
+            return web.json_response({"error": {"message": "injected error", "type": "server_error"}}, status=status)
+
+        if payload.get("stream"):
+            return await self._stream(request, model)
+
+        await asyncio.sleep(self.latency)
+        return web.json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+            "usage": self._usage(),
+        })
+
+    async def _stream(self, request: web.Request, model: str):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        step = max(1, len(ANSWER) // self.chunks)
+        pieces = [ANSWER[i:i + step] for i in range(0, len(ANSWER), step)]
+        for index, piece in enumerate(pieces):
+            await asyncio.sleep(self.latency / len(pieces))
+            chunk = {
+                "id": f"chatcmpl-{self.requests}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": piece} if index == 0 else {"content": piece},
+                    "finish_reason": None,
+                }],
+            }
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode())
+        final = {
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": self._usage(),
+        }
+        await response.write(f"data: {json.dumps(final)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер, возвращает base_url для OPENAI_BASE_URL"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}/v1"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,169 @@
+# benchmarks/fake_telegram.py
+"""Локальная заглушка Telegram Bot API на aiohttp для бенчмарков и soak-тестов.
+
+Отдает апдейты через getUpdates из очереди, отвечает на getFile и скачивание
+файлов, на остальные методы - правдоподобными объектами. Задержка ответа и
+доля ошибок (HTTP 500) настраиваются. Исходящие тексты бота по каждому чату
+доступны через wait_for_text.
+"""
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter, defaultdict, deque
+from aiohttp import web
+
+BOT_USER = {"id": 100000001, "is_bot": True, "first_name": "Bench", "username": "bench_cat_bot"}
+# Методы, которые отдают Message и показывают пользователю текст
+_TEXT_METHODS = ("sendMessage", "editMessageText", "sendInvoice")
+
+
+def make_user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "language_code": "ru"}
+
+
+def make_message(message_id: int, user_id: int, **fields) -> dict:
+    message = {
+        "message_id": message_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private"},
+        "from": make_user(user_id),
+    }
+    message.update(fields)
+    return message
+
+
+def make_text_update(update_id: int, user_id: int, text: str) -> dict:
+    message = make_message(update_id, user_id, text=text)
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": update_id, "message": message}
+
+
+def make_photo_update(update_id: int, user_id: int) -> dict:
+    """Фото в четырех размерах с уникальными file_id"""
+    sizes = [
+        {"file_id": f"p{update_id}_{side}", "file_unique_id": f"u{update_id}_{side}", "width": side, "height": side * 3 // 4}
+        for side in (90, 320, 800, 1280)
+    ]
+    return {"update_id": update_id, "message": make_message(update_id, user_id, photo=sizes)}
+
+
+class FakeTelegramAPI:
+    def __init__(self, token: str, latency: float = 0.0, error_rate: float = 0.0, photo: bytes = b""):
+        self.token = token
+        self.latency = latency
+        self.error_rate = error_rate
+        self.photo = photo
+        self.updates = deque()
+        self.calls = Counter()
+        self.errors = 0
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        self._outgoing = defaultdict(asyncio.Queue)  # chat_id -> тексты бота
+        self._runner = None
+        self.app = web.Application()
+        self.app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self.app.router.add_get("/file/bot{token}/{path:.*}", self._download)
+
+    def add_update(self, update: dict):
+        self.updates.append(update)
+        self._new_updates.set()
+
+    def next_update_id(self) -> int:
+        return next(self._update_ids)
+
+    async def wait_for_text(self, chat_id: int, predicate, timeout: float) -> str:
+        """Ждет исходящий текст в чате, для которого predicate(text) истинно"""
+        queue = self._outgoing[chat_id]
+
+        async def wait():
+            while True:
+                text = await queue.get()
+                if predicate(text):
+                    return text
+
+        return await asyncio.wait_for(wait(), timeout)
+
+    def drain_texts(self, chat_id: int):
+        queue = self._outgoing[chat_id]
+        while not queue.empty():
+            queue.get_nowait()
+
+    @staticmethod
+    def _ok(result):
+        return web.json_response({"ok": True, "result": result})
+
+    async def _delay(self):
+        if self.latency:
+            # Равномерный разброс вокруг заданной задержки
+            await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset", 0) or 0)
+        limit = int(params.get("limit", 100) or 100)
+        timeout = float(params.get("timeout", 0) or 0)
+
+        # offset подтверждает все апдейты до него
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=min(timeout, 1.0))
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self.updates, 0, limit))
+
+    async def _handle(self, request: web.Request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        params = dict(await request.post())
+        params.update(request.query)
+
+        if method == "getUpdates":
+            return self._ok(await self._get_updates(params))
+        if method == "getMe":
+            return self._ok(BOT_USER)
+
+        await self._delay()
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response(
+                {"ok": False, "error_code": 500, "description": "Internal Server Error"}, status=500
+            )
+
+        if method in _TEXT_METHODS:
+            chat_id = int(params.get("chat_id", 0) or 0)
+            text = params.get("text") or params.get("title", "")
+            self._outgoing[chat_id].put_nowait(text)
+            return self._ok(make_message(next(self._message_ids), chat_id, text=text))
+        if method == "getFile":
+            file_id = params.get("file_id", "")
+            return self._ok({
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_size": len(self.photo),
+                "file_path": f"photos/{file_id}.jpg",
+            })
+        return self._ok(True)
+
+    async def _download(self, request: web.Request):
+        self.calls["download"] += 1
+        await self._delay()
+        return web.Response(body=self.photo, content_type="image/jpeg")
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Запускает сервер, возвращает базовый URL для TelegramAPIServer.from_base"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
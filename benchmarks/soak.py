@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# benchmarks/soak.py
+"""Soak-тест: настоящий `python -m app.main` против локальных заглушек Bot API и OpenAI.
+
+N пользователей по кругу загружают фото, жмут "Оценить этого котика" и иногда
+смотрят /balance. Периодически пишется срез: действия/с, RSS, открытые fd и сокеты
+процесса бота; в конце - перцентили задержек по действиям и рост RSS.
+Запуск: python -m benchmarks.soak [--users 50] [--duration 300] [--openai-error-rate 0.05]
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import signal
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_openai import FakeOpenAI  # noqa: E402
+from benchmarks.fake_telegram import FakeTelegramAPI, make_photo_update, make_text_update  # noqa: E402
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+TOKEN = "123456:SOAK"
+FIRST_USER_ID = 2_000_000
+
+
+def _make_jpeg() -> bytes:
+    if Image is None:
+        return b"\xff\xd8\xff" + os.urandom(300_000)
+    buffer = io.BytesIO()
+    Image.effect_noise((1280, 960), 40).convert("RGB").save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+# ----------------- Снимки процесса -----------------
+def process_snapshot(pid: int) -> dict:
+    """RSS (МБ), открытые fd и сокеты процесса по /proc (только Linux)"""
+    snapshot = {"rss_mb": None, "fds": None, "sockets": None}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    snapshot["rss_mb"] = int(line.split()[1]) / 1024
+        fd_dir = f"/proc/{pid}/fd"
+        links = []
+        for fd in os.listdir(fd_dir):
+            try:
+                links.append(os.readlink(os.path.join(fd_dir, fd)))
+            except OSError:
+                pass
+        snapshot["fds"] = len(links)
+        snapshot["sockets"] = sum(1 for link in links if link.startswith("socket:"))
+    except OSError:
+        pass
+    return snapshot
+
+
+def _fmt(value, pattern="{:.1f}"):
+    return "n/a" if value is None else pattern.format(value)
+
+
+# ----------------- Нагрузка -----------------
+class LoadStats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(lambda: defaultdict(int))
+        self.completed = 0
+
+    def record(self, action: str, outcome: str, latency: float):
+        self.outcomes[action][outcome] += 1
+        if outcome != "timeout":
+            self.latencies[action].append(latency)
+        self.completed += 1
+
+
+def _rate_outcome(text: str):
+    if "📊" in text:
+        return "ok"
+    if "😿" in text or "❌" in text or "⏳ Очередь" in text:
+        return "error"
+    return None
+
+
+ACTIONS = {
+    # действие -> (апдейт, распознавание финального ответа)
+    "photo_upload": (
+        lambda api, user_id: make_photo_update(api.next_update_id(), user_id),
+        lambda text: "ok" if "Фото получено" in text else ("error" if "😿" in text else None),
+    ),
+    "rate_cat": (
+        lambda api, user_id: make_text_update(api.next_update_id(), user_id, "Оценить этого котика"),
+        _rate_outcome,
+    ),
+    "balance": (
+        lambda api, user_id: make_text_update(api.next_update_id(), user_id, "/balance"),
+        lambda text: "ok" if "баланс" in text.lower() else None,
+    ),
+}
+
+
+async def perform(api, stats: LoadStats, user_id: int, action: str, timeout: float):
+    make_update, classify = ACTIONS[action]
+    api.drain_texts(user_id)
+    started = time.perf_counter()
+    api.add_update(make_update(api, user_id))
+    try:
+        text = await api.wait_for_text(user_id, lambda text: classify(text) is not None, timeout)
+        stats.record(action, classify(text), time.perf_counter() - started)
+    except asyncio.TimeoutError:
+        stats.record(action, "timeout", timeout)
+
+
+async def user_loop(api, stats: LoadStats, user_id: int, deadline: float, think: float, timeout: float):
+    iteration = 0
+    while time.monotonic() < deadline:
+        await perform(api, stats, user_id, "photo_upload", timeout)
+        await perform(api, stats, user_id, "rate_cat", timeout)
+        iteration += 1
+        if iteration % 5 == 0:
+            await perform(api, stats, user_id, "balance", timeout)
+        await asyncio.sleep(random.uniform(0.5, 1.5) * think)
+
+
+async def sampler(pid: int, stats: LoadStats, interval: float, samples: list, stop: asyncio.Event):
+    print(f"\n{'t, s':>6} | {'actions/s':>9} | {'RSS MB':>7} | {'fds':>5} | {'sockets':>7}")
+    print("-" * 48)
+    started = time.monotonic()
+    last_completed = 0
+    while not stop.is_set():
+        try:
+            await asyncio.wait_for(stop.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        snapshot = process_snapshot(pid)
+        rate = (stats.completed - last_completed) / interval
+        last_completed = stats.completed
+        samples.append(snapshot)
+        print(
+            f"{time.monotonic() - started:>6.0f} | {rate:>9.1f} | {_fmt(snapshot['rss_mb']):>7} | "
+            f"{_fmt(snapshot['fds'], '{}'):>5} | {_fmt(snapshot['sockets'], '{}'):>7}",
+            flush=True,
+        )
+
+
+def print_summary(stats: LoadStats, samples: list, elapsed: float, api, openai):
+    print(f"\n{'action':>14} | {'ok':>5} | {'error':>5} | {'timeout':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    print("-" * 75)
+    for action in ACTIONS:
+        outcomes = stats.outcomes[action]
+        latencies = stats.latencies[action]
+        if len(latencies) > 1:
+            quantiles = statistics.quantiles(latencies, n=100)
+            p50, p95, p99 = (quantiles[p - 1] * 1000 for p in (50, 95, 99))
+        else:
+            p50 = p95 = p99 = latencies[0] * 1000 if latencies else 0.0
+        print(
+            f"{action:>14} | {outcomes['ok']:>5} | {outcomes['error']:>5} | {outcomes['timeout']:>7} | "
+            f"{p50:>8.1f} | {p95:>8.1f} | {p99:>8.1f}"
+        )
+
+    print(f"\nThroughput: {stats.completed / elapsed:.1f} actions/s over {elapsed:.0f}s")
+    rss = [sample["rss_mb"] for sample in samples if sample["rss_mb"] is not None]
+    if rss:
+        print(f"RSS: {rss[0]:.1f} -> {rss[-1]:.1f} MB (growth {rss[-1] - rss[0]:+.1f} MB, peak {max(rss):.1f})")
+    sockets = [sample["sockets"] for sample in samples if sample["sockets"] is not None]
+    if sockets:
+        print(f"Sockets: min {min(sockets)}, max {max(sockets)}, last {sockets[-1]}")
+    print(f"Bot API calls: {dict(api.calls)}, injected errors: {api.errors}")
+    print(f"OpenAI requests: {openai.requests}, injected errors: {openai.errors}")
+
+
+async def wait_until_polling(api, process, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while api.calls["getUpdates"] == 0:
+        if process.returncode is not None:
+            raise RuntimeError(f"bot exited with code {process.returncode}")
+        if time.monotonic() > deadline:
+            raise RuntimeError("bot did not start polling in time")
+        await asyncio.sleep(0.2)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=300, help="длительность нагрузки, сек")
+    parser.add_argument("--think", type=float, default=1.0, help="пауза пользователя между циклами, сек")
+    parser.add_argument("--timeout", type=float, default=60, help="ожидание ответа бота, сек")
+    parser.add_argument("--sample-interval", type=float, default=5)
+    parser.add_argument("--tg-latency", type=float, default=0.02)
+    parser.add_argument("--tg-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-latency", type=float, default=1.0)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="cat_bot_soak_")
+    api = FakeTelegramAPI(TOKEN, args.tg_latency, args.tg_error_rate, _make_jpeg())
+    openai = FakeOpenAI(args.openai_latency, args.openai_error_rate)
+    api_url = await api.start()
+    openai_url = await openai.start()
+
+    env = dict(
+        os.environ,
+        TELEGRAM_BOT_TOKEN=TOKEN,
+        TELEGRAM_API_URL=api_url,
+        OPENAI_API_KEY="sk-soak",
+        OPENAI_BASE_URL=openai_url,
+        BOT_MODE="polling",
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp_dir, 'soak.db')}",
+        RESULT_CACHE_PATH=os.path.join(tmp_dir, "analysis_cache.db"),
+        STATE_STORE_PATH=os.path.join(tmp_dir, "bot_state.db"),
+        FREE_REQUESTS_DAILY="1000000",
+    )
+    log_path = os.path.join(tmp_dir, "bot.log")
+    with open(log_path, "wb") as log:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "app.main",
+            env=env, stdout=log, stderr=asyncio.subprocess.STDOUT,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+    print(f"🚀 Bot pid {process.pid}, log: {log_path}")
+
+    try:
+        await wait_until_polling(api, process)
+        stats = LoadStats()
+        samples = []
+        stop = asyncio.Event()
+        sampling = asyncio.create_task(sampler(process.pid, stats, args.sample_interval, samples, stop))
+
+        started = time.monotonic()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            user_loop(api, stats, FIRST_USER_ID + index, deadline, args.think, args.timeout)
+            for index in range(args.users)
+        ))
+        elapsed = time.monotonic() - started
+        stop.set()
+        await sampling
+        print_summary(stats, samples, elapsed, api, openai)
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGINT)
+            try:
+                await asyncio.wait_for(process.wait(), 15)
+            except asyncio.TimeoutError:
+                process.kill()
+        await api.stop()
+        await openai.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,10 @@
+# tests/conftest.py
+import os
+import tempfile
+
+# Тесты работают на временной SQLite БД - задаем ДО импорта app.*
+_tmp_dir = tempfile.mkdtemp(prefix="cat_bot_tests_")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_tmp_dir, 'test.db')}")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:test")
+os.environ.setdefault("RESULT_CACHE_PATH", os.path.join(_tmp_dir, "analysis_cache.db"))
+os.environ.setdefault("STATE_STORE_PATH", os.path.join(_tmp_dir, "bot_state.db"))
@@ -0,0 +1,14 @@
+# tests/helpers.py
+import asyncio
+from app.db.async_database import async_engine
+
+
+def run_async(coro):
+    """Запускает корутину в новом loop и закрывает пул async движка (соединения привязаны к loop)"""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await async_engine.dispose()
+
+    return asyncio.run(runner())
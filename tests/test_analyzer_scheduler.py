@@ -0,0 +1,70 @@
+# tests/test_analyzer_scheduler.py
+import asyncio
+import pytest
+from app.services.analyzer_scheduler import AnalyzerScheduler, QueueFull, PRIORITY_PAID, PRIORITY_FREE
+
+
+def test_concurrency_cap_and_paid_lane_first():
+    async def scenario():
+        scheduler = AnalyzerScheduler(max_concurrency=1, max_queue=10)
+        gate = asyncio.Event()
+        order = []
+
+        async def job(name):
+            order.append(name)
+            await gate.wait()
+
+        first = asyncio.create_task(scheduler.run(lambda: job("first")))
+        await asyncio.sleep(0)
+        free = asyncio.create_task(scheduler.run(lambda: job("free"), PRIORITY_FREE))
+        paid = asyncio.create_task(scheduler.run(lambda: job("paid"), PRIORITY_PAID))
+        await asyncio.sleep(0)
+
+        assert scheduler.active == 1 and scheduler.queue_depth == 2
+        gate.set()
+        await asyncio.gather(first, free, paid)
+        assert order == ["first", "paid", "free"]
+        assert scheduler.active == 0
+    asyncio.run(scenario())
+
+
+def test_queue_positions_and_fast_reject():
+    async def scenario():
+        scheduler = AnalyzerScheduler(max_concurrency=1, max_queue=1)
+        gate = asyncio.Event()
+        positions = []
+
+        async def on_position(position):
+            positions.append(position)
+
+        running = asyncio.create_task(scheduler.run(gate.wait))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run(gate.wait, on_position=on_position))
+        await asyncio.sleep(0)
+
+        assert scheduler.is_saturated()
+        with pytest.raises(QueueFull):
+            await scheduler.run(gate.wait)
+
+        gate.set()
+        await asyncio.gather(running, queued)
+        assert positions == [1]
+        assert scheduler.stats()["rejected"] == 1
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        scheduler = AnalyzerScheduler(max_concurrency=1, max_queue=5)
+        gate = asyncio.Event()
+        running = asyncio.create_task(scheduler.run(gate.wait))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(scheduler.run(gate.wait))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth == 0
+        gate.set()
+        await running
+        assert scheduler.active == 0
+    asyncio.run(scenario())
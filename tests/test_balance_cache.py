@@ -0,0 +1,62 @@
+# tests/test_balance_cache.py
+import datetime
+import pytest
+from app.db.balance_cache import BalanceCache, BalanceSnapshot, balance_cache
+from app.db.database import engine
+from app.db.models import Base
+from app.db.async_database import get_balance, add_paid_requests, reserve_request
+from tests.helpers import run_async
+
+Base.metadata.create_all(bind=engine)
+
+
+def _snapshot(user_id, paid=0):
+    return BalanceSnapshot(user_id, 5, paid, 0, datetime.date.today())
+
+
+def test_snapshot_is_immutable():
+    snapshot = _snapshot(1)
+    with pytest.raises(AttributeError):
+        snapshot.paid_requests = 100
+
+
+def test_lru_eviction_and_counters():
+    cache = BalanceCache(max_entries=2, ttl=60)
+    cache.put(_snapshot(1))
+    cache.put(_snapshot(2))
+    assert cache.get(1) is not None  # 1 становится самым свежим
+    cache.put(_snapshot(3))          # вытесняет 2
+    assert cache.get(2) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_expiry():
+    cache = BalanceCache(max_entries=10, ttl=0)
+    cache.put(_snapshot(1))
+    assert cache.get(1) is None
+
+
+def test_mutations_write_through():
+    async def scenario():
+        first = await get_balance(601)
+        assert balance_cache.get(601) is first
+
+        await add_paid_requests(601, 3)
+        assert balance_cache.get(601).paid_requests == 3
+
+        await reserve_request(601)
+        cached = balance_cache.get(601)
+        assert cached.free_requests == first.free_requests - 1
+        assert cached.total_requests_used == 1
+    run_async(scenario())
+
+
+def test_disabled_cache_never_serves_snapshots():
+    cache = BalanceCache(max_entries=10, ttl=60)
+    cache.put(_snapshot(1))
+    cache.disable()
+    assert cache.get(1) is None
+    cache.put(_snapshot(2))
+    assert cache.get(2) is None and len(cache) == 0
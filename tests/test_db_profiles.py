@@ -0,0 +1,50 @@
+# tests/test_db_profiles.py
+import asyncio
+import pytest
+from sqlalchemy import text
+from app.config import DatabaseConfig
+from app.db.profiles import (
+    POSTGRES, SQLITE_LEGACY, SQLITE_WAL, create_async_engine_for, create_sync_engine, engine_kwargs, resolve_profile,
+)
+
+
+def test_auto_profile_follows_url():
+    assert resolve_profile("sqlite:///x.db", "auto") == SQLITE_WAL
+    assert resolve_profile("postgresql://u@h/db", "auto") == POSTGRES
+    assert resolve_profile("sqlite:///x.db", SQLITE_LEGACY) == SQLITE_LEGACY
+    with pytest.raises(ValueError):
+        resolve_profile("sqlite:///x.db", "mysql-turbo")
+
+
+def test_wal_pragmas_applied_on_connect(tmp_path):
+    engine = create_sync_engine(f"sqlite:///{tmp_path / 'wal.db'}", SQLITE_WAL)
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert conn.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert conn.execute(text("PRAGMA busy_timeout")).scalar() == DatabaseConfig.SQLITE_BUSY_TIMEOUT_MS
+    engine.dispose()
+
+    legacy = create_sync_engine(f"sqlite:///{tmp_path / 'legacy.db'}", SQLITE_LEGACY)
+    with legacy.connect() as conn:
+        assert conn.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+    legacy.dispose()
+
+
+def test_async_engine_gets_pragmas(tmp_path):
+    async def scenario():
+        engine = create_async_engine_for(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}", SQLITE_WAL)
+        try:
+            async with engine.connect() as conn:
+                return (await conn.execute(text("PRAGMA journal_mode"))).scalar()
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(scenario()) == "wal"
+
+
+def test_postgres_profile_tunes_pool():
+    kwargs = engine_kwargs(POSTGRES)
+    assert kwargs["pool_pre_ping"] is True
+    assert kwargs["pool_size"] == DatabaseConfig.POOL_SIZE
+    assert kwargs["max_overflow"] == DatabaseConfig.MAX_OVERFLOW
+    assert engine_kwargs(SQLITE_WAL) == {}
@@ -0,0 +1,67 @@
+# tests/test_image_pipeline.py
+import asyncio
+import importlib
+import io
+import sys
+from types import SimpleNamespace
+import pytest
+from app.services import image_pipeline, metrics
+from app.services.image_pipeline import pick_photo_size, recompress_jpeg, prepare_image
+
+PIL = pytest.importorskip("PIL.Image")
+
+
+def _jpeg(width, height, quality=100):
+    buffer = io.BytesIO()
+    PIL.effect_noise((width, height), 64).convert("RGB").save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def test_pick_smallest_size_meeting_target():
+    sizes = [SimpleNamespace(width=w, height=h, file_id=str(w)) for w, h in [(90, 60), (320, 213), (800, 533), (1280, 853)]]
+    assert pick_photo_size(sizes, 768).file_id == "800"
+    assert pick_photo_size(sizes, 4000).file_id == "1280"
+
+
+def test_recompress_shrinks_and_caps_size():
+    original = _jpeg(2000, 1500)
+    result = recompress_jpeg(original, max_side=1024, quality=80, min_quality=40, max_bytes=200_000)
+    assert len(result) < len(original)
+    with PIL.open(io.BytesIO(result)) as image:
+        assert max(image.size) == 1024
+
+
+def test_prepare_image_reports_saved_bytes():
+    original = _jpeg(1600, 1200)
+    before = image_pipeline.bytes_saved()
+    metric_before = metrics.image_bytes_saved_total.value()
+    prepared = asyncio.run(prepare_image(original))
+    image_pipeline.shutdown_pipeline()
+    assert image_pipeline.bytes_saved() - before == len(original) - len(prepared) > 0
+    assert metrics.image_bytes_saved_total.value() - metric_before == len(original) - len(prepared)
+
+
+def test_pipeline_does_not_fork_the_event_loop_process():
+    executor = image_pipeline._get_executor()
+    try:
+        assert executor._mp_context.get_start_method() in ("forkserver", "spawn")
+    finally:
+        image_pipeline.shutdown_pipeline()
+
+
+def _bot_loaded_in_worker() -> bool:
+    # Так воркер spawn/forkserver повторяет импорт главного модуля при `python -m app.main`
+    importlib.import_module("app.main")
+    return "app.dispatcher" in sys.modules
+
+
+def test_pool_worker_does_not_load_the_bot():
+    async def scenario():
+        await image_pipeline.warm_pipeline()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(image_pipeline._get_executor(), _bot_loaded_in_worker)
+
+    try:
+        assert asyncio.run(scenario()) is False
+    finally:
+        image_pipeline.shutdown_pipeline()
@@ -0,0 +1,25 @@
+# tests/test_loop_monitor.py
+import asyncio
+import time
+from app.services.loop_monitor import LoopMonitor
+
+
+def _blocking_db_call():
+    time.sleep(0.3)
+
+
+def test_blocking_call_is_captured_with_its_stack():
+    monitor = LoopMonitor(interval=0.02, block_threshold=0.1)
+
+    async def scenario():
+        monitor.start()
+        await asyncio.sleep(0.1)
+        _blocking_db_call()
+        await asyncio.sleep(0.1)
+        await monitor.stop()
+
+    asyncio.run(scenario())
+
+    assert len(monitor.blocks) == 1
+    assert "_blocking_db_call" in monitor.blocks[0]["stack"]
+    assert monitor.percentiles()["max"] >= 0.2
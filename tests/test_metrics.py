@@ -0,0 +1,50 @@
+# tests/test_metrics.py
+import asyncio
+import pytest
+from app.services.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_and_histogram_render_prometheus_text():
+    registry = Registry()
+    requests = Counter("t_requests_total", "Requests", ["outcome"], registry=registry)
+    latency = Histogram("t_latency_seconds", "Latency", ["stage"], registry=registry, buckets=(0.1, 1.0))
+
+    requests.inc(outcome="ok")
+    requests.inc(2, outcome="ok")
+    latency.observe(0.05, stage="download")
+    latency.observe(0.5, stage="download")
+    latency.observe(1.0, stage="download")
+
+    text = asyncio.run(registry.render())
+    assert "# TYPE t_requests_total counter" in text
+    assert 't_requests_total{outcome="ok"} 3' in text
+    assert 't_latency_seconds_bucket{stage="download",le="0.1"} 1' in text
+    assert 't_latency_seconds_bucket{stage="download",le="1"} 3' in text
+    assert 't_latency_seconds_bucket{stage="download",le="+Inf"} 3' in text
+    assert 't_latency_seconds_count{stage="download"} 3' in text
+
+
+def test_timer_works_as_decorator_and_labels_are_checked():
+    registry = Registry()
+    latency = Histogram("t_db_seconds", "DB", ["op"], registry=registry)
+
+    @latency.time(op="load")
+    async def load():
+        await asyncio.sleep(0)
+        return 42
+
+    assert asyncio.run(load()) == 42
+    assert latency.count(op="load") == 1
+    with pytest.raises(ValueError):
+        latency.observe(1.0, stage="load")
+
+
+def test_gauge_function_may_be_async():
+    registry = Registry()
+    depth = Gauge("t_queue_depth", "Queue depth", registry=registry)
+
+    async def current():
+        return 7
+
+    depth.set_function(current)
+    assert "t_queue_depth 7" in asyncio.run(registry.render())
@@ -0,0 +1,52 @@
+# tests/test_payments.py
+import asyncio
+from sqlalchemy import func, select
+from app.db.database import engine
+from app.db.models import Base, Payment
+from app.db.async_database import AsyncSessionLocal, credit_payment, get_user
+from app.services.payment_service import (
+    make_invoice_payload, parse_invoice_payload, requests_for_payment, validate_pre_checkout,
+)
+from tests.helpers import run_async
+
+Base.metadata.create_all(bind=engine)
+
+PRICING = {15: 3, 45: 10}
+
+
+def test_redelivered_payment_is_credited_once():
+    async def scenario():
+        before = (await get_user(901)).paid_requests
+        results = await asyncio.gather(*(credit_payment(901, "charge-901", 45, 10) for _ in range(3)))
+        async with AsyncSessionLocal() as db:
+            rows = await db.scalar(select(func.count()).select_from(Payment).where(Payment.user_id == 901))
+        return before, results, rows, (await get_user(901)).paid_requests
+
+    before, results, rows, after = run_async(scenario())
+    credited = [result for result in results if result is not None]
+    assert len(credited) == 1 and credited[0].paid_requests == before + 10
+    assert rows == 1 and after == before + 10
+
+
+def test_payment_for_unknown_user_creates_row():
+    snapshot = run_async(credit_payment(902, "charge-902", 15, 3))
+    assert snapshot.paid_requests == 3
+    assert run_async(get_user(902)).paid_requests == 3
+
+
+def test_pre_checkout_checks_payload_against_pricing():
+    payload = make_invoice_payload(45, 7, 10)
+    assert parse_invoice_payload(payload) == (45, 7, 10)
+    assert validate_pre_checkout(payload, "XTR", 45, 7, PRICING) is None
+    # Старый формат без количества запросов тоже принимается
+    assert validate_pre_checkout("stars_15_7", "XTR", 15, 7, PRICING) is None
+
+    assert validate_pre_checkout("garbage", "XTR", 45, 7, PRICING)
+    assert validate_pre_checkout(payload, "USD", 45, 7, PRICING)
+    assert validate_pre_checkout(payload, "XTR", 45, 8, PRICING)
+    assert validate_pre_checkout(payload, "XTR", 15, 7, PRICING)
+    assert validate_pre_checkout(make_invoice_payload(45, 7, 99), "XTR", 45, 7, PRICING)
+    assert validate_pre_checkout(make_invoice_payload(200, 7, 50), "XTR", 200, 7, PRICING)
+
+    assert requests_for_payment(payload, 45, PRICING) == 10
+    assert requests_for_payment("stars_15_7", 15, PRICING) == 3
@@ -0,0 +1,58 @@
+# tests/test_pricing.py
+import json
+import os
+import pytest
+from app.services.pricing import PricingRegistry, PricingSnapshot, load_pricing_file
+
+
+def _write(path, pricing, mtime=None):
+    path.write_text(json.dumps(pricing), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+def test_snapshot_is_built_once_and_immutable():
+    snapshot = PricingSnapshot({80: 20, 15: 3, 45: 10})
+    assert list(snapshot.pricing) == [15, 45, 80]
+    assert [[button.callback_data for button in row] for row in snapshot.keyboard.inline_keyboard] == [
+        ["buy_15", "buy_45"], ["buy_80"],
+    ]
+    assert snapshot.keyboard_with_promo.inline_keyboard[-1][0].callback_data == "enter_promo"
+    assert "80 ⭐ → 20 запросов" in snapshot.menu_text
+    with pytest.raises(AttributeError):
+        snapshot.pricing = {}
+    with pytest.raises(TypeError):
+        snapshot.pricing[15] = 100
+
+
+def test_registry_swaps_snapshot_when_file_changes(tmp_path):
+    path = tmp_path / "pricing.json"
+    registry = PricingRegistry(str(path), {15: 3})
+    assert dict(registry.current.pricing) == {15: 3} and registry.current.source == "config"
+
+    _write(path, {"15": 5, "100": 30}, mtime=1_000_000_000)
+    assert registry.reload_if_changed()
+    first = registry.current
+    assert dict(first.pricing) == {15: 5, 100: 30}
+    # Файл не менялся - тот же объект, без пересборки
+    assert not registry.reload_if_changed() and registry.current is first
+
+    # Битый файл игнорируется, остается последний рабочий набор
+    path.write_text("{not json", encoding="utf-8")
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    assert not registry.reload_if_changed() and registry.current is first
+
+    _write(path, {"pricing": {"45": 10}}, mtime=3_000_000_000)
+    assert registry.reload_if_changed()
+    assert dict(registry.current.pricing) == {45: 10}
+
+
+@pytest.mark.parametrize("requests", [2.5, "3", True, None, [3]])
+def test_non_integer_tariffs_are_rejected(tmp_path, requests):
+    path = tmp_path / "pricing.json"
+    _write(path, {"15": requests})
+    with pytest.raises(ValueError):
+        load_pricing_file(str(path))
+
+    registry = PricingRegistry(str(path), {15: 3})
+    assert dict(registry.current.pricing) == {15: 3} and registry.current.source == "config"
@@ -0,0 +1,63 @@
+# tests/test_quota_reset.py
+import datetime
+from sqlalchemy import update
+from app.config import RequestConfig
+from app.db.database import engine
+from app.db.models import Base, User
+from app.db.async_database import AsyncSessionLocal, get_balance, reserve_request, bulk_reset_free_requests
+from app.db.balance_cache import balance_cache
+from app.db.quota_reset import needs_reset
+from tests.helpers import run_async
+
+Base.metadata.create_all(bind=engine)
+
+TODAY = datetime.date(2026, 3, 10)
+
+
+async def _age_user(user_id: int, days: int):
+    """Сдвигает last_reset в прошлое и обнуляет бесплатные запросы"""
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(User).where(User.id == user_id)
+            .values(free_requests=0, last_reset=datetime.date.today() - datetime.timedelta(days=days))
+        )
+        await db.commit()
+    balance_cache.invalidate(user_id)
+
+
+def test_needs_reset_daily_and_weekly(monkeypatch):
+    assert needs_reset(TODAY - datetime.timedelta(days=1), TODAY)
+    assert not needs_reset(TODAY, TODAY)
+    monkeypatch.setattr(RequestConfig, "RESET_TYPE", "weekly")
+    assert not needs_reset(TODAY - datetime.timedelta(days=6), TODAY)
+    assert needs_reset(TODAY - datetime.timedelta(days=7), TODAY)
+
+
+def test_read_is_virtual_and_write_materializes():
+    async def scenario():
+        await get_balance(701)
+        await _age_user(701, days=1)
+
+        balance = await get_balance(701)
+        assert balance.free_requests == RequestConfig.FREE_REQUESTS_DAILY
+        assert balance.stored_free_requests == 0  # чтение ничего не записало
+
+        reservation = await reserve_request(701)
+        assert reservation.request_type == "free"
+        assert reservation.free_requests == RequestConfig.FREE_REQUESTS_DAILY - 1
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, 701)
+            assert user.last_reset == datetime.date.today()
+            assert user.reset_counter == 1
+    run_async(scenario())
+
+
+def test_bulk_reset():
+    async def scenario():
+        await get_balance(702)
+        await _age_user(702, days=2)
+        assert await bulk_reset_free_requests() >= 1
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, 702)
+            assert user.free_requests == RequestConfig.FREE_REQUESTS_DAILY
+    run_async(scenario())
@@ -0,0 +1,45 @@
+# tests/test_quota_service.py
+import asyncio
+import pytest
+from app.config import RequestConfig
+from app.db.database import engine
+from app.db.models import Base
+from app.db.async_database import get_user, reserve_request
+from app.services.quota_service import consume_request, QuotaExhausted
+from tests.helpers import run_async
+
+Base.metadata.create_all(bind=engine)
+
+
+def test_reserve_uses_free_then_paid():
+    async def scenario():
+        user = await get_user(501)
+        free = user.free_requests
+        for _ in range(free):
+            reservation = await reserve_request(501)
+            assert reservation.request_type == "free"
+        assert await reserve_request(501) is None
+    run_async(scenario())
+
+
+def test_consume_refunds_on_error():
+    async def scenario():
+        await get_user(502)
+        with pytest.raises(RuntimeError):
+            async with consume_request(502):
+                raise RuntimeError("download failed")
+        user = await get_user(502)
+        assert user.free_requests == RequestConfig.FREE_REQUESTS_DAILY
+        assert user.total_requests_used == 0
+    run_async(scenario())
+
+
+def test_parallel_presses_cannot_overspend():
+    async def scenario():
+        await get_user(503)
+        results = await asyncio.gather(*(reserve_request(503) for _ in range(20)))
+        assert sum(r is not None for r in results) == RequestConfig.FREE_REQUESTS_DAILY
+        with pytest.raises(QuotaExhausted):
+            async with consume_request(503):
+                pass
+    run_async(scenario())
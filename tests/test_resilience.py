@@ -0,0 +1,204 @@
+# tests/test_resilience.py
+import asyncio
+import pytest
+from app.services.resilience import CircuitBreaker, call_with_retries
+from app.config import AnalyzerConfig
+from app.services.openai_analyzer import OpenAICatAnalyzer, ERROR_TIMEOUT, ERROR_CIRCUIT_OPEN
+
+
+class Flaky(Exception):
+    pass
+
+
+def _retry(factory, **overrides):
+    options = dict(is_retryable=lambda e: isinstance(e, Flaky), max_retries=2, attempt_timeout=1.0,
+                   deadline=5.0, backoff_base=0.001, backoff_max=0.002)
+    options.update(overrides)
+    return call_with_retries(factory, **options)
+
+
+def test_retries_retryable_errors_then_succeeds():
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise Flaky()
+        return "ok"
+
+    assert asyncio.run(_retry(flaky)) == "ok"
+    assert len(attempts) == 3
+
+
+def test_non_retryable_error_is_raised_immediately():
+    attempts = []
+
+    async def broken():
+        attempts.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        asyncio.run(_retry(broken))
+    assert len(attempts) == 1
+
+
+def test_deadline_bounds_total_time():
+    async def slow():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(_retry(slow, is_retryable=lambda e: True, attempt_timeout=0.02, deadline=0.05, max_retries=10))
+
+
+def test_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    # reset_timeout прошел - одна пробная попытка
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_analyzer_returns_typed_failures_and_fails_fast(monkeypatch):
+    analyzer = OpenAICatAnalyzer()
+    analyzer.client = object()
+    analyzer.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+
+    async def upstream_down(image_base64, on_partial=None):
+        raise asyncio.TimeoutError()
+
+    analyzer._request_analysis = upstream_down
+    monkeypatch.setattr(AnalyzerConfig, "MAX_RETRIES", 0)
+    first = asyncio.run(analyzer.analyze_cat_image(b"cat"))
+    second = asyncio.run(analyzer.analyze_cat_image(b"cat"))
+    assert not first.ok and first.error == ERROR_TIMEOUT
+    assert second.error == ERROR_CIRCUIT_OPEN
+
+
+def test_cancelled_probe_is_released():
+    analyzer = OpenAICatAnalyzer()
+    analyzer.client = object()
+    analyzer.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    analyzer.breaker.record_failure()
+
+    async def hangs(image_base64, on_partial=None):
+        await asyncio.sleep(10)
+
+    analyzer._request_analysis = hangs
+
+    async def scenario():
+        task = asyncio.create_task(analyzer.analyze_cat_image(b"cat"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    # Отмененная пробная попытка не держит half-open навсегда
+    assert analyzer.breaker.allow()
+
+
+def _completion(content: str) -> dict:
+    return {
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "gpt-4o-mini",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 11, "completion_tokens": 7, "total_tokens": 18},
+    }
+
+
+def _chunk(content=None, usage=None) -> dict:
+    choices = [] if content is None else [{"index": 0, "delta": {"content": content}, "finish_reason": None}]
+    return {"id": "chatcmpl-test", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+            "choices": choices, "usage": usage}
+
+
+async def _with_fake_openai(scenario):
+    """Поднимает локальный HTTP-сервер вместо api.openai.com и запускает scenario(client, requests)"""
+    import json
+    from aiohttp import web
+    from openai import AsyncOpenAI
+
+    requests = []
+
+    async def completions(request):
+        body = await request.json()
+        requests.append(body)
+        if not body.get("stream"):
+            return web.json_response(_completion("Пушистый"))
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        events = [_chunk("Пуши"), _chunk("стый"),
+                  _chunk(usage={"prompt_tokens": 11, "completion_tokens": 7, "total_tokens": 18})]
+        for event in events:
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8"))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", completions)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = AsyncOpenAI(api_key="test", base_url=f"http://127.0.0.1:{port}/v1", max_retries=0)
+    try:
+        await scenario(client, requests)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+def test_analyzer_through_real_client_signature():
+    analyzer = OpenAICatAnalyzer()
+    analyzer.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    partials = []
+
+    async def on_partial(text):
+        partials.append(text)
+
+    async def scenario(client, requests):
+        analyzer.client = client
+        plain = await analyzer.analyze_cat_image(b"cat")
+        streamed = await analyzer.analyze_cat_image(b"cat", on_partial=on_partial)
+
+        assert plain.ok and plain.text == "Пушистый"
+        assert (plain.prompt_tokens, plain.completion_tokens) == (11, 7)
+        assert streamed.ok and streamed.text == "Пушистый"
+        assert (streamed.prompt_tokens, streamed.completion_tokens) == (11, 7)
+        assert partials == ["Пуши", "Пушистый"]
+
+        assert "stream_options" not in requests[0]
+        assert requests[1]["stream"] is True
+        assert requests[1]["stream_options"] == {"include_usage": True}
+        assert requests[0]["messages"][0]["content"][1]["type"] == "image_url"
+
+    asyncio.run(_with_fake_openai(scenario))
+
+
+def test_client_is_created_off_the_event_loop_once():
+    import threading
+
+    analyzer = OpenAICatAnalyzer()
+    analyzer.api_key = "test"
+    created_in = []
+
+    def create_client():
+        created_in.append(threading.get_ident())
+        analyzer.client = object()
+
+    analyzer._create_client = create_client
+
+    async def scenario():
+        await asyncio.gather(analyzer.warm_up(), analyzer.warm_up(), analyzer.warm_up())
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(scenario())
+    assert len(created_in) == 1 and created_in[0] != loop_thread
+    assert analyzer.client is not None
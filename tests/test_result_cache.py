@@ -0,0 +1,92 @@
+# tests/test_result_cache.py
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import tempfile
+from app.services.result_cache import AnalysisResultCache, telegram_image_key, content_image_key
+
+
+def test_memory_then_disk_tier():
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), "cache.db")
+        cache = AnalysisResultCache(memory_size=1, ttl=60, sqlite_path=path)
+        key_a = cache.make_key(telegram_image_key("AQAD1"), "v1")
+        key_b = cache.make_key(telegram_image_key("AQAD2"), "v1")
+        await cache.put(key_a, "рыжий котик")
+        await cache.put(key_b, "серый котик")  # key_a вытеснен из памяти, но есть на диске
+
+        assert await cache.get(key_a) == "рыжий котик"
+        assert cache.stats()["disk_hits"] == 1
+        assert await cache.get(key_a) == "рыжий котик"
+        assert cache.stats()["memory_hits"] == 1
+
+        # Другая версия промпта - другой ключ
+        assert await cache.get(cache.make_key(telegram_image_key("AQAD1"), "v2")) is None
+
+        restarted = AnalysisResultCache(memory_size=10, ttl=60, sqlite_path=path)
+        assert await restarted.get(key_b) == "серый котик"
+        cache.close()
+        restarted.close()
+    asyncio.run(scenario())
+
+
+def test_expired_entries_are_purged():
+    async def scenario():
+        cache = AnalysisResultCache(memory_size=10, ttl=-1, sqlite_path=os.path.join(tempfile.mkdtemp(), "c.db"))
+        key = cache.make_key(content_image_key(b"cat"), "v1")
+        await cache.put(key, "old")
+        assert await cache.get(key) is None
+        assert await cache.purge_expired() == 1
+        cache.close()
+    asyncio.run(scenario())
+
+
+def test_cache_hit_skips_download_and_analyzer(monkeypatch):
+    import app.bot_instance
+    from app.handlers import basic
+    from app.services.openai_analyzer import AnalysisResult
+
+    calls = []
+
+    class FakeBot:
+        async def get_file(self, file_id):
+            calls.append("get_file")
+            return type("File", (), {"file_path": "photos/1.jpg"})()
+
+        async def download_file(self, path):
+            calls.append("download_file")
+            return io.BytesIO(b"not really a jpeg")
+
+    async def fake_analyze(image_data, on_partial=None):
+        calls.append("analyze")
+        return AnalysisResult.success("пушистый котик")
+
+    monkeypatch.setattr(app.bot_instance, "bot", FakeBot())
+    monkeypatch.setattr(basic, "analyze_cat_image", fake_analyze)
+    monkeypatch.setattr(basic, "result_cache", AnalysisResultCache(memory_size=10, ttl=60))
+
+    pending = {"file_id": "f1", "file_unique_id": "u1"}
+    assert asyncio.run(basic.analyze_pending_photo(pending)).text == "пушистый котик"
+    assert calls == ["get_file", "download_file", "analyze"]
+
+    calls.clear()
+    assert asyncio.run(basic.analyze_pending_photo(pending)).text == "пушистый котик"
+    assert calls == []
+
+
+def test_sqlite_tier_is_opened_lazily(tmp_path):
+    path = tmp_path / "cache.db"
+    cache = AnalysisResultCache(memory_size=10, ttl=60, sqlite_path=str(path))
+    assert not path.exists()
+    asyncio.run(cache.open())
+    assert path.exists()
+    cache.close()
+
+    # Импорт модуля с настройками по умолчанию не создает ./analysis_cache.db
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    env.pop("RESULT_CACHE_PATH", None)
+    subprocess.run([sys.executable, "-c", "import app.services.result_cache"], cwd=tmp_path, env=env, check=True)
+    assert not (tmp_path / "analysis_cache.db").exists()
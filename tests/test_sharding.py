@@ -0,0 +1,148 @@
+# tests/test_sharding.py
+import asyncio
+import queue
+import time
+import pytest
+from app import sharding
+from app.config import MetricsConfig
+from app.services import metrics
+from app.sharding import ShardSupervisor, ShardWorker, shard_for, update_user_id
+
+
+def _message(update_id, user_id, text="hi"):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": text,
+        },
+    }
+
+
+def test_same_user_always_goes_to_same_shard():
+    callback = {"update_id": 7, "callback_query": {"id": "1", "from": {"id": 42}, "chat_instance": "x"}}
+    assert update_user_id(callback) == 42
+    assert shard_for(callback, 4) == shard_for(_message(1, 42), 4)
+    assert shard_for({"update_id": 9}, 4) == 9 % 4
+
+
+def test_admin_balance_command_goes_to_target_user_shard():
+    command = _message(1, 5, "/add_requests 42 10")
+    assert shard_for(command, 4) == 42 % 4
+    assert shard_for(_message(2, 5, "/add_requests@cat_bot 43 10"), 4) == 43 % 4
+    # Без корректного user_id команда остается в шарде отправителя
+    assert shard_for(_message(3, 5, "/add_requests"), 4) == 5 % 4
+    assert shard_for(_message(4, 5, "/add_requests abc 1"), 4) == 5 % 4
+
+
+class _RecordingDispatcher:
+    def __init__(self):
+        self.order = []
+
+    async def feed_raw_update(self, bot, update):
+        user_id = update_user_id(update)
+        # Первый апдейт пользователя обрабатывается дольше следующих
+        await asyncio.sleep(0.05 if update["message"]["text"] == "slow" else 0)
+        self.order.append((user_id, update["update_id"]))
+
+
+def test_worker_keeps_per_user_order_and_drains_queue():
+    updates = queue.Queue()
+    for update in (_message(1, 10, "slow"), _message(2, 10), _message(3, 20), _message(4, 10)):
+        updates.put(update)
+    updates.put(None)
+
+    dispatcher = _RecordingDispatcher()
+    worker = ShardWorker(dispatcher, bot=None, updates_queue=updates)
+    asyncio.run(worker.run())
+
+    assert worker.processed == 4
+    assert [update_id for user_id, update_id in dispatcher.order if user_id == 10] == [1, 2, 4]
+    # Другой пользователь не ждет медленный апдейт
+    assert dispatcher.order[0] == (20, 3)
+
+
+class _Update:
+    def __init__(self, raw):
+        self.raw = raw
+        self.update_id = raw["update_id"]
+
+    def model_dump(self, **kwargs):
+        return self.raw
+
+
+class _FakeBot:
+    """get_updates отдает заранее заданные пачки, затем висит"""
+
+    def __init__(self, batches):
+        self.batches = list(batches)
+        self.offsets = []
+        self.session = self
+
+    async def get_updates(self, offset=None, **kwargs):
+        self.offsets.append(offset)
+        if self.batches:
+            return [_Update(raw) for raw in self.batches.pop(0)]
+        await asyncio.sleep(3600)
+
+    async def close(self):
+        pass
+
+
+def test_full_shard_queue_holds_polling_instead_of_dropping(monkeypatch):
+    monkeypatch.setattr(MetricsConfig, "ENABLED", False)
+    supervisor = ShardSupervisor(workers=1, queue_size=1)
+    monkeypatch.setattr(supervisor, "check_workers", lambda: None)
+    bot = _FakeBot([[_message(1, 10), _message(2, 10)], [_message(3, 10)]])
+    waits_before = metrics.shard_backpressure_total.value(shard=0)
+
+    async def scenario():
+        poller = asyncio.create_task(sharding._poll(supervisor, bot, []))
+        await asyncio.sleep(0.3)
+        # Второй апдейт ждет места: getUpdates больше не вызывался, offset не сдвинут
+        assert bot.offsets == [None]
+        assert supervisor.queues[0].get(timeout=1)["update_id"] == 1
+        await asyncio.sleep(0.3)
+        assert supervisor.queues[0].get(timeout=1)["update_id"] == 2
+        assert bot.offsets[:2] == [None, 3]
+        poller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await poller
+
+    try:
+        asyncio.run(scenario())
+        # Ждали апдейт 2 (очередь занята первым) и апдейт 3 (вторым)
+        assert supervisor.backpressure_waits == 2
+        assert metrics.shard_backpressure_total.value(shard=0) - waits_before == 2
+    finally:
+        for updates_queue in supervisor.queues:
+            updates_queue.cancel_join_thread()
+            updates_queue.close()
+
+
+class _StuckProcess:
+    def __init__(self):
+        self.terminated = False
+
+    def join(self, timeout=None):
+        time.sleep(min(timeout or 0, 0.05))
+
+    def is_alive(self):
+        return not self.terminated
+
+    def terminate(self):
+        self.terminated = True
+
+
+def test_stop_does_not_hang_on_a_full_queue():
+    supervisor = ShardSupervisor(workers=1, queue_size=1)
+    supervisor.queues[0].put(_message(1, 10))
+    supervisor.processes = [_StuckProcess()]
+    started = time.monotonic()
+    supervisor.stop(timeout=0.2)
+    assert time.monotonic() - started < 2
+    assert supervisor.processes[0].terminated
+    supervisor.queues[0].close()
@@ -0,0 +1,46 @@
+# tests/test_single_flight.py
+import asyncio
+import pytest
+from app.services.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    async def scenario():
+        flights = SingleFlight()
+        upstream_calls = 0
+
+        async def analyze():
+            nonlocal upstream_calls
+            upstream_calls += 1
+            await asyncio.sleep(0.01)
+            return "котик"
+
+        results = await asyncio.gather(*(flights.do("photo-1", analyze) for _ in range(5)))
+        assert results == ["котик"] * 5
+        assert upstream_calls == 1
+        assert flights.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+        # После завершения новый вызов идет в API заново
+        await flights.do("photo-1", analyze)
+        assert upstream_calls == 2
+    asyncio.run(scenario())
+
+
+def test_errors_propagate_and_cancelled_waiter_does_not_cancel_others():
+    async def scenario():
+        flights = SingleFlight()
+        gate = asyncio.Event()
+
+        async def failing():
+            await gate.wait()
+            raise RuntimeError("upstream down")
+
+        first = asyncio.create_task(flights.do("photo-2", failing))
+        second = asyncio.create_task(flights.do("photo-2", failing))
+        await asyncio.sleep(0)
+        first.cancel()
+        gate.set()
+        with pytest.raises(RuntimeError):
+            await second
+        assert first.cancelled()
+    asyncio.run(scenario())
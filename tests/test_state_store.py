@@ -0,0 +1,95 @@
+# tests/test_state_store.py
+import asyncio
+import os
+import tempfile
+import pytest
+from app.services.state_store import MemoryStateStore, SQLiteStateStore, StateStore
+
+
+def test_memory_store_ttl_lru_and_accounting():
+    async def scenario():
+        store = MemoryStateStore(ttl=60, max_entries=2)
+        await store.set(1, "photo-1")
+        await store.set(2, "photo-2")
+        await store.set(3, "photo-3")  # вытесняет 1
+        assert await store.get(1) is None
+        assert await store.get(3) == "photo-3"
+        stats = await store.stats()
+        assert stats["entries"] == 2 and stats["evictions"] == 1
+        assert stats["memory_bytes"] > 0
+
+        assert await store.pop(3) == "photo-3"
+        assert await store.pop(3) is None
+
+        expired = MemoryStateStore(ttl=0, max_entries=10)
+        await expired.set(1, "photo")
+        assert await expired.get(1) is None
+        assert (await expired.stats())["memory_bytes"] == 0
+    asyncio.run(scenario())
+
+
+def test_sqlite_store_is_shared_between_instances():
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), "state.db")
+        worker_a = SQLiteStateStore(path, "pending_photos", ttl=60, max_entries=2)
+        worker_b = SQLiteStateStore(path, "pending_photos", ttl=60, max_entries=2)
+
+        await worker_a.set(42, {"file_id": "abc"})
+        assert await worker_b.get(42) == {"file_id": "abc"}
+
+        await worker_a.set(43, "x")
+        await worker_a.set(44, "y")  # лимит 2 - самая старая запись удаляется
+        assert await worker_b.get(42) is None
+
+        assert await worker_b.pop(44) == "y"
+        assert await worker_a.get(44) is None
+        assert (await worker_a.stats())["entries"] == 1
+
+        await worker_a.close()
+        await worker_b.close()
+    asyncio.run(scenario())
+
+
+def test_memory_store_get_refreshes_lru_position():
+    async def scenario():
+        store = MemoryStateStore(ttl=60, max_entries=2)
+        await store.set(1, "photo-1")
+        await store.set(2, "photo-2")
+        assert await store.get(1) == "photo-1"
+        await store.set(3, "photo-3")  # вытесняет 2, а не недавно прочитанную 1
+        assert await store.get(1) == "photo-1"
+        assert await store.get(2) is None
+        assert await store.purge_expired() == 0
+    asyncio.run(scenario())
+
+
+def test_sqlite_store_stats_skip_expired_rows():
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), "state.db")
+        store = SQLiteStateStore(path, "pending_photos", ttl=60, max_entries=10)
+        await store.set(1, "photo")
+        # Просроченная, но еще не удаленная строка
+        store._conn.execute("UPDATE state_store SET expires_at = 0")
+        stats = await store.stats()
+        assert stats["entries"] == 0 and stats["memory_bytes"] == 0
+        await store.close()
+    asyncio.run(scenario())
+
+
+def test_sqlite_store_get_refreshes_lru_position():
+    async def scenario():
+        path = os.path.join(tempfile.mkdtemp(), "state.db")
+        store = SQLiteStateStore(path, "pending_photos", ttl=60, max_entries=2)
+        await store.set(1, "photo-1")
+        await store.set(2, "photo-2")
+        assert await store.get(1) == "photo-1"
+        await store.set(3, "photo-3")  # вытесняет 2, а не недавно прочитанную 1
+        assert await store.get(1) == "photo-1"
+        assert await store.get(2) is None
+        await store.close()
+    asyncio.run(scenario())
+
+
+def test_state_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        StateStore()
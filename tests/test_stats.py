@@ -0,0 +1,69 @@
+# tests/test_stats.py
+import datetime
+from sqlalchemy import create_engine, text
+from app.db.database import engine, SessionLocal
+from app.db.models import Base
+from app.db.async_database import get_daily_stats, get_stats, get_user, mark_user_active, refund_request, reserve_request
+from app.db.migrations import migrate
+from app.services.promo_service import PromoService
+from tests.helpers import run_async
+
+Base.metadata.create_all(bind=engine)
+
+
+def test_counters_follow_events():
+    async def scenario():
+        before = await get_stats()
+        await get_user(801)
+        reservation = await reserve_request(801)
+        await reserve_request(801)
+        await refund_request(reservation)
+        return before, await get_stats()
+
+    before, after = run_async(scenario())
+    assert after["users"] - before["users"] == 1
+    assert after["new_users"] - before["new_users"] == 1
+    assert after["requests_free"] - before["requests_free"] == 1
+    assert after["today_requests_free"] - before["today_requests_free"] == 1
+
+    db = SessionLocal()
+    try:
+        promo = PromoService.create_promo_code(db, 3, created_by=1)
+        PromoService.use_promo_code(db, promo.code, 801)
+    finally:
+        db.close()
+    promos = run_async(get_stats())
+    assert promos["promos_created"] - after["promos_created"] == 1
+    assert promos["promos_used"] - after["promos_used"] == 1
+    assert promos["promos_active"] == after["promos_active"]
+
+
+def test_user_counted_active_once_per_day():
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+
+    async def scenario():
+        await get_user(802)
+        marks = [await mark_user_active(802, tomorrow) for _ in range(3)]
+        history = await get_daily_stats(2, today=tomorrow)
+        return marks, (await get_stats(tomorrow))["active_users"], history
+
+    marks, active, history = run_async(scenario())
+    assert marks == [True, False, False]
+    assert active >= 1
+    assert history[0].day == tomorrow
+
+
+def test_migration_backfills_totals(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    migrate(legacy)
+    with legacy.begin() as conn:
+        conn.execute(text("DELETE FROM stats_totals"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version >= 5"))
+        conn.execute(text("INSERT INTO users (id, tg_id) VALUES (1, '1'), (2, '2')"))
+        conn.execute(text("INSERT INTO promo_codes (code, is_active, used_by) VALUES ('A', 1, NULL), ('B', 0, 2)"))
+
+    migrate(legacy)
+
+    with legacy.connect() as conn:
+        row = conn.execute(text("SELECT users, promos_created, promos_used, promos_active FROM stats_totals")).one()
+    assert tuple(row) == (2, 2, 1, 1)
@@ -0,0 +1,59 @@
+# tests/test_stream_editor.py
+import asyncio
+import time
+from app.services.stream_editor import StreamingMessageEditor, STREAM_CURSOR
+
+
+class FakeMessage:
+    def __init__(self, fail_edits=False, edit_delay=0.0):
+        self.edits = []
+        self.sent = []
+        self.fail_edits = fail_edits
+        self.edit_delay = edit_delay
+
+    async def edit_text(self, text):
+        await asyncio.sleep(self.edit_delay)
+        if self.fail_edits:
+            raise RuntimeError("message can't be edited")
+        self.edits.append(text)
+
+    async def answer(self, text):
+        self.sent.append(text)
+
+
+def test_partial_edits_are_throttled_and_final_edit_always_sent():
+    async def scenario():
+        message = FakeMessage()
+        editor = StreamingMessageEditor(message, min_interval=60)
+        await editor.update("Рыжий")
+        await asyncio.sleep(0)  # первая правка уходит сразу
+        await editor.update("Рыжий котик")  # слишком рано - ждет троттлинга
+        await editor.update("Рыжий котик мурчит")  # заменяет предыдущий текст
+        await editor.finish("Рыжий котик мурчит\n\n📊 Баланс")
+        assert message.edits == ["Рыжий" + STREAM_CURSOR, "Рыжий котик мурчит\n\n📊 Баланс"]
+    asyncio.run(scenario())
+
+
+def test_finish_falls_back_to_new_message():
+    async def scenario():
+        message = FakeMessage(fail_edits=True)
+        editor = StreamingMessageEditor(message, min_interval=0)
+        await editor.update("частичный")
+        await editor.finish("готово")
+        assert message.sent == ["готово"]
+    asyncio.run(scenario())
+
+
+def test_slow_telegram_edit_does_not_block_the_stream():
+    async def scenario():
+        message = FakeMessage(edit_delay=0.2)
+        editor = StreamingMessageEditor(message, min_interval=0)
+        started = time.monotonic()
+        for text in ("Ры", "Рыжий", "Рыжий кот"):
+            await editor.update(text)
+            await asyncio.sleep(0)
+        assert time.monotonic() - started < 0.1
+        # Финал дожидается идущей правки и не обгоняется ею
+        await editor.finish("готово")
+        assert message.edits == ["Ры" + STREAM_CURSOR, "готово"]
+    asyncio.run(scenario())
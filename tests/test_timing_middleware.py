@@ -0,0 +1,56 @@
+# tests/test_timing_middleware.py
+import asyncio
+import logging
+from datetime import datetime
+from aiogram import Bot, Dispatcher, Router, F
+from aiogram.types import Message, Update
+from app.middlewares.timing import HandlerStats, setup_timing, UNHANDLED
+
+
+def _text_update(update_id: int, text: str) -> Update:
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": datetime.now(),
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "u"},
+            "text": text,
+        },
+    })
+
+
+def test_nested_router_handlers_are_timed_by_name(caplog):
+    router = Router()
+
+    @router.message(F.text == "slow")
+    async def slow_handler(message: Message):
+        await asyncio.sleep(0.02)
+
+    dispatcher = Dispatcher()
+    dispatcher.include_router(router)
+    stats = HandlerStats(window=10)
+    setup_timing(dispatcher, stats, slow_ms=10)
+    bot = Bot("123456:test")
+
+    async def feed():
+        await dispatcher.feed_update(bot, _text_update(1, "slow"))
+        await dispatcher.feed_update(bot, _text_update(2, "other"))
+        await bot.session.close()
+
+    with caplog.at_level(logging.WARNING, logger="app.middlewares.timing"):
+        asyncio.run(feed())
+
+    rows = {row["handler"]: row for row in stats.snapshot()}
+    slow = rows["test_timing_middleware.test_nested_router_handlers_are_timed_by_name.<locals>.slow_handler"]
+    assert slow["calls"] == 1 and slow["p50_ms"] >= 20
+    assert rows[UNHANDLED]["calls"] == 1
+    assert '"update_type": "message"' in caplog.text and '"event": "slow_handler"' in caplog.text
+
+
+def test_window_keeps_only_recent_samples():
+    stats = HandlerStats(window=3)
+    for seconds in (10.0, 0.001, 0.001, 0.001):
+        stats.record("h", seconds)
+    row = stats.snapshot()[0]
+    assert row["calls"] == 4 and row["max_ms"] == 1.0
@@ -0,0 +1,125 @@
+# tests/test_usage_ledger.py
+import asyncio
+from sqlalchemy import func, select
+from app.db.database import engine
+from app.db.models import Base, UsageEvent
+from app.db.async_database import AsyncSessionLocal
+from app.services.usage_ledger import UsageLedger
+from tests.helpers import run_async
+
+Base.metadata.create_all(bind=engine)
+
+
+def _record(ledger, user_id=1):
+    ledger.record(user_id, "free", "ok", 12.5, cache_hit=False, prompt_tokens=850, completion_tokens=60)
+
+
+def test_flushes_full_batches_without_waiting_for_interval():
+    batches = []
+
+    async def write(rows):
+        batches.append(len(rows))
+
+    async def scenario():
+        ledger = UsageLedger(flush_interval=60, batch_size=3, max_pending=100, write_batch=write)
+        ledger.start()
+        for _ in range(7):
+            _record(ledger)
+        await asyncio.sleep(0.01)
+        flushed_early = list(batches)
+        await ledger.stop()
+        return flushed_early, ledger
+
+    flushed_early, ledger = asyncio.run(scenario())
+    assert flushed_early[:2] == [3, 3]
+    assert batches == [3, 3, 1] and ledger.written == 7 and ledger.pending == 0
+
+
+def test_failed_flush_keeps_events_and_overflow_drops():
+    failures = []
+
+    async def flaky(rows):
+        if not failures:
+            failures.append(1)
+            raise ConnectionError("db down")
+
+    async def scenario():
+        ledger = UsageLedger(flush_interval=60, batch_size=10, max_pending=3, write_batch=flaky)
+        for user_id in range(5):
+            _record(ledger, user_id)
+        assert await ledger.flush() == 0
+        assert ledger.pending == 3 and ledger.dropped == 2
+        assert await ledger.flush() == 3
+        return ledger
+
+    assert asyncio.run(scenario()).pending == 0
+
+
+def test_events_land_in_db_with_one_insert_per_batch():
+    async def scenario():
+        ledger = UsageLedger(flush_interval=60, batch_size=50, max_pending=1000)
+        for user_id in range(120):
+            _record(ledger, 9000 + user_id)
+        await ledger.stop()
+        async with AsyncSessionLocal() as db:
+            count = await db.scalar(select(func.count()).select_from(UsageEvent).where(UsageEvent.user_id >= 9000))
+            tokens = await db.scalar(select(func.sum(UsageEvent.prompt_tokens)).where(UsageEvent.user_id >= 9000))
+        return count, tokens
+
+    assert run_async(scenario()) == (120, 120 * 850)
+
+
+class _Message:
+    def __init__(self, user_id):
+        self.from_user = type("User", (), {"id": user_id})()
+        self.answers = []
+        self.deleted = False
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+        return self
+
+    async def edit_text(self, text, **kwargs):
+        pass
+
+    async def delete(self):
+        self.deleted = True
+
+
+def test_rejected_and_failed_analyses_are_recorded(monkeypatch):
+    import contextlib
+    from app.handlers import basic
+    from app.services.analyzer_scheduler import QueueFull
+
+    ledger = UsageLedger(flush_interval=60, batch_size=100, max_pending=100, write_batch=None)
+    monkeypatch.setattr(basic, "usage_ledger", ledger)
+
+    @contextlib.asynccontextmanager
+    async def reserved(user_id):
+        yield type("Reservation", (), {"request_type": "paid", "paid_requests": 3, "free_requests": 0})()
+
+    async def queue_full(*args, **kwargs):
+        raise QueueFull()
+
+    def broken(user_id):
+        raise RuntimeError("db is down")
+
+    async def scenario():
+        await basic.pending_photos.set(501, {"file_id": "f", "file_unique_id": "u"})
+        monkeypatch.setattr(basic, "consume_request", reserved)
+        monkeypatch.setattr(basic, "analyze_pending_photo", queue_full)
+        rejected = _Message(501)
+        await basic.analyze_photo_directly(rejected)
+        # "Анализирую котика..." не остается висеть после отказа
+        assert rejected.deleted and rejected.answers[-1] == basic.QUEUE_FULL_TEXT
+
+        monkeypatch.setattr(basic, "consume_request", broken)
+        await basic.analyze_photo_directly(_Message(501))
+
+        monkeypatch.setattr(basic.analyzer_scheduler, "is_saturated", lambda: True)
+        await basic.analyze_photo_directly(_Message(501))
+        await basic.pending_photos.pop(501)
+
+    asyncio.run(scenario())
+    events = [(event["request_type"], event["outcome"]) for event in ledger._pending]
+    assert events == [("paid", "queue_full"), ("none", "error"), ("none", "queue_full")]
@@ -0,0 +1,14 @@
+# tests/test_webhook.py
+import pytest
+from app.config import StateConfig
+from app.webhook import check_workers_config
+
+
+def test_several_workers_require_shared_state(monkeypatch):
+    monkeypatch.setattr(StateConfig, "BACKEND", "memory")
+    check_workers_config(1)
+    with pytest.raises(RuntimeError, match="STATE_STORE_BACKEND=sqlite"):
+        check_workers_config(4)
+
+    monkeypatch.setattr(StateConfig, "BACKEND", "sqlite")
+    check_workers_config(4)